@@ -0,0 +1,201 @@
+#Benchmarks de tiempo y memoria de todos los KPIs sobre datos sintéticos.
+#Cada KPI se mide en modo todas las cohortes y cohorte única, para cada tamaño de datos.
+#Los resultados se guardan en JSON (uno por commit) para comparar regresiones entre commits.
+#Uso:
+#   python benchmarks/bench_kpis.py --tamanos chico mediano --repeticiones 5
+#   python benchmarks/bench_kpis.py --comparar resultados/a.json resultados/b.json
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTADOS_DIR = Path(__file__).resolve().parent / "resultados"
+
+# Snapshots de benchmark aislados de los de producción (debe fijarse antes de importar snapshots)
+os.environ.setdefault("ECAS_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="ecas_bench_"))
+
+from fuentes_sinteticas import publicar_fuentes_sinteticas
+
+#tamaño -> (estudiantes ECAS, estudiantes del resto del sistema)
+TAMANOS = {
+    "chico": (2_000, 10_000),
+    "mediano": (20_000, 100_000),
+    "grande": (100_000, 1_000_000),
+}
+
+COHORTE_UNICA = 2015
+
+#Los módulos de KPIs cargan datos al importarse, por eso se resuelven después de publicar el snapshot
+#(módulo.función, argumentos fijos, nombre del parámetro de cohorte, requiere BD)
+#Los KPIs de dash2 son cortes de un lote de todas las cohortes memoizado por versión: el costo del
+#cálculo se mide en las entradas '*_lote' (sin parámetro de cohorte, modo "lote"). Lo mismo con el universo
+#ex-ECAS: construir_universo_ex_ecas corta la tabla memoizada, que se construye en 'universo_*'
+KPIS = [
+    ("metrics.get_top_fuga_por_orden", {"columna": "institucion_destino", "orden": 1}, "anio_n", False),
+    ("metrics.get_estimation_titulacion_abandono", {}, "anio_n", True),
+    ("metrics.get_tiempo_de_descanso", {}, "anio_n", False),
+    ("metrics.get_total_fugados_por_cohorte", {}, "anio_n", False),
+    ("metrics.get_tasa_desercion_por_cohorte", {}, "anio_n", False),
+    ("metricas_2.kpi1_pct_llegan_postitulo_postgrado", {}, "anio_n", False),
+    ("metricas_2.calcular_top_reingreso_por_columna", {"columna_objetivo": "institucion_destino"}, "cohorte_n", False),
+    ("metricas_2.calcular_permanencia_desertores", {}, "cohorte_n", False),
+    ("metricas_2.calcular_kpi_continuidad_origen", {}, "cohorte_n", False),
+    ("metrics_titulados.calcular_nivel_reingreso", {}, "cohorte_n", False),
+    ("metrics_titulados.calcular_nivel_reingreso_inmediato", {}, "cohorte_n", False),
+    ("metrics_titulados.calcular_top_reingreso_por_columna_titulados", {"columna_objetivo": "institucion_destino"}, "cohorte_n", False),
+    ("metrics_titulados.calcular_demora_reingreso_por_nivel", {}, "cohorte_n", False),
+    ("metrics_titulados.calcular_distribucion_demora_reingreso", {}, "cohorte_n", False),
+    ("metrics_titulados.calcular_ruta_promedio_titulados", {}, "cohorte_n", False),
+    ("auxiliar.construir_universo_ex_ecas", {}, "anio_n", False),
+    ("auxiliar.universo_todas_cohortes", {}, None, False),
+    ("auxiliar.universo_indexado_por_cohorte", {}, None, False),
+    ("metricas_2.kpi1_lote", {}, None, False),
+    ("metricas_2.top_reingreso_lote", {"columna_objetivo": "institucion_destino"}, None, False),
+    ("metricas_2.permanencia_desertores_lote", {}, None, False),
+    ("metricas_2.continuidad_origen_lote", {}, None, False),
+    ("metrics_titulados.conteo_reingreso_lote", {"campo": "nivel"}, None, False),
+    ("metrics_titulados.demora_reingreso_lote", {}, None, False),
+    ("metrics_titulados.distribucion_demora_lote", {}, None, False),
+    ("metrics_titulados.ruta_titulados_lote", {}, None, False),
+]
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "sin_git"
+
+def resolver(nombre: str):
+    modulo, funcion = nombre.split(".")
+    return getattr(importlib.import_module(modulo), funcion)
+
+def medir(funcion, kwargs: dict, repeticiones: int) -> dict:
+    """Tiempo (pared y CPU) de 'repeticiones' llamadas tras un calentamiento, y pico de memoria con tracemalloc."""
+    # Las funciones memoizadas por versión se miden sin su cache
+    funcion = getattr(funcion, "__wrapped__", funcion)
+
+    resultado = funcion(**kwargs)
+
+    tiempos, cpu = [], []
+    for _ in range(repeticiones):
+        t0, c0 = time.perf_counter(), time.process_time()
+        funcion(**kwargs)
+        tiempos.append(time.perf_counter() - t0)
+        cpu.append(time.process_time() - c0)
+
+    tracemalloc.start()
+    funcion(**kwargs)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "tiempo_mediana_s": statistics.median(tiempos),
+        "tiempo_min_s": min(tiempos),
+        "cpu_mediana_s": statistics.median(cpu),
+        "pico_memoria_mb": round(pico / 1024 ** 2, 3),
+        "filas_resultado": len(resultado) if hasattr(resultado, "__len__") else None,
+        "repeticiones": repeticiones,
+    }
+
+def ejecutar(tamanos: list, repeticiones: int, semilla: int, filtro: str | None = None) -> dict:
+
+    resultados = []
+    datos = {}
+
+    for tamano in tamanos:
+        n_ecas, n_nacional = TAMANOS[tamano]
+
+        t0 = time.perf_counter()
+        filas = publicar_fuentes_sinteticas(f"bench_{tamano}_{semilla}", n_ecas=n_ecas, n_nacional=n_nacional, semilla=semilla)
+        datos[tamano] = {"filas": filas, "preparacion_s": round(time.perf_counter() - t0, 3)}
+        print(f"✔ Datos '{tamano}' listos en {datos[tamano]['preparacion_s']} s")
+
+        for nombre, argumentos, param_cohorte, requiere_bd in KPIS:
+            if filtro and filtro not in nombre:
+                continue
+            funcion = resolver(nombre)
+
+            modos = (("lote", None),) if param_cohorte is None else (("todas", None), ("cohorte", COHORTE_UNICA))
+            for modo, cohorte in modos:
+                fila = {"kpi": nombre, "modo": modo, "tamano": tamano}
+
+                if requiere_bd and importlib.import_module("metrics").db_conn is None:
+                    fila["omitido"] = "sin conexión a BD"
+                else:
+                    try:
+                        fila.update(medir(funcion, {**argumentos, **({param_cohorte: cohorte} if param_cohorte else {})}, repeticiones))
+                    except Exception as e:
+                        fila["error"] = f"{type(e).__name__}: {e}"
+
+                resultados.append(fila)
+                estado = fila.get("omitido") or fila.get("error") or f"{fila['tiempo_mediana_s'] * 1000:.1f} ms, {fila['pico_memoria_mb']} MB"
+                print(f"  {nombre} [{modo}] {estado}")
+
+    return {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semilla": semilla,
+        "datos": datos,
+        "resultados": resultados,
+    }
+
+def comparar(ruta_base: str, ruta_nueva: str) -> None:
+    """Imprime la razón nuevo/base de tiempo y memoria por KPI, modo y tamaño."""
+    base = json.loads(Path(ruta_base).read_text(encoding="utf-8"))
+    nueva = json.loads(Path(ruta_nueva).read_text(encoding="utf-8"))
+
+    clave = lambda r: (r["kpi"], r["modo"], r["tamano"])
+    indice_base = {clave(r): r for r in base["resultados"] if "tiempo_mediana_s" in r}
+
+    print(f"{'KPI':<70} {'modo':<8} {'tamaño':<8} {'tiempo':>8} {'memoria':>8}")
+    for r in nueva["resultados"]:
+        b = indice_base.get(clave(r))
+        if b is None or "tiempo_mediana_s" not in r:
+            continue
+        razon_t = r["tiempo_mediana_s"] / b["tiempo_mediana_s"] if b["tiempo_mediana_s"] else float("nan")
+        razon_m = r["pico_memoria_mb"] / b["pico_memoria_mb"] if b["pico_memoria_mb"] else float("nan")
+        print(f"{r['kpi']:<70} {r['modo']:<8} {r['tamano']:<8} {razon_t:>7.2f}x {razon_m:>7.2f}x")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks de KPIs sobre datos sintéticos.")
+    parser.add_argument("--tamanos", nargs="+", choices=list(TAMANOS), default=["chico"])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--motor", choices=["pandas", "duckdb"], default=None, help="Motor de los KPIs de dash2 (por defecto ECAS_MOTOR_KPI)")
+    parser.add_argument("--filtro", default=None, help="Solo KPIs cuyo nombre contenga este texto")
+    parser.add_argument("--salida", default=None, help="Archivo JSON (por defecto resultados/<fecha>_<commit>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NUEVO"), help="Compara dos archivos de resultados")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        sys.exit(0)
+
+    auxiliar = importlib.import_module("auxiliar")
+    if args.motor:
+        auxiliar.MOTOR_KPI = args.motor
+
+    informe = ejecutar(args.tamanos, args.repeticiones, args.semilla, args.filtro)
+    informe["motor"] = auxiliar.MOTOR_KPI
+
+    salida = Path(args.salida) if args.salida else RESULTADOS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{informe['commit']}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"✅ Resultados guardados en {salida}")
@@ -0,0 +1,113 @@
+#Deriva las fuentes de los KPIs (las mismas que exportan queries.py y queries_l.py a excel)
+#a partir de las vistas sintéticas, y las publica como snapshot para que los KPIs las lean.
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+for carpeta in ("dash1", "dash2"):
+    if str(BASE_DIR / carpeta) not in sys.path:
+        sys.path.append(str(BASE_DIR / carpeta))
+
+from datos_sinteticos import generar_datos_sinteticos
+from queries import identificar_desertores, clasificar_destino_abandono, base_fugas_desde_extracto, DATASET_EXTRACTO_ECAS
+from queries_l import agrupar_trayectoria_post_titulacion, trayectoria_a_texto
+from snapshots import publicar_snapshot, activar_version
+
+#Columnas de vista_matricula_unificada -> columnas de las consultas de trayectoria
+COLUMNAS_TRAYECTORIA = {
+    "mrun": "mrun",
+    "cat_periodo": "anio_matricula_destino",
+    "nomb_inst": "institucion_destino",
+    "nomb_carrera": "carrera_destino",
+    "area_conocimiento": "area_conocimiento_destino",
+    "nivel_global": "nivel_global",
+    "nivel_carrera_1": "nivel_carrera_1",
+    "nivel_carrera_2": "nivel_carrera_2",
+    "cod_inst": "cod_inst",
+    "dur_total_carr": "duracion_total_carrera",
+    "tipo_inst_1": "tipo_inst_1",
+    "tipo_inst_2": "tipo_inst_2",
+    "tipo_inst_3": "tipo_inst_3",
+    "requisito_ingreso": "requisito_ingreso",
+}
+
+def _sin_categorias(df: pd.DataFrame) -> pd.DataFrame:
+    categoricas = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: object for c in categoricas})
+
+def _trayectoria(df_matricula: pd.DataFrame, mruns) -> pd.DataFrame:
+    df = df_matricula[df_matricula["mrun"].isin(mruns)][list(COLUMNAS_TRAYECTORIA)]
+    return df.rename(columns=COLUMNAS_TRAYECTORIA).sort_values(["mrun", "anio_matricula_destino"], ignore_index=True)
+
+def derivar_fuentes_kpi(vistas: dict) -> dict:
+    """
+    Reproduce sin BD las fuentes que leen los KPIs:
+    - dashboard_extracto_ecas (get_extracto_ecas, base de los KPIs por cohorte)
+    - fuga_a_destino y abandono_total (get_fuga_multianual_trayectoria)
+    - trayectoria_titulados (creacion_trayectoria_titulados, hoja Trayectoria_Resumen)
+    """
+    df_matricula = _sin_categorias(vistas["vista_matricula_unificada"])
+    df_titulados = _sin_categorias(vistas["vista_titulados_unificada_limpia"])
+
+    # ---------- Extracto compartido de ECAS (get_extracto_ecas) ----------
+    df_extracto = (
+        df_matricula[
+            (df_matricula["cod_inst"] == 104) &
+            df_matricula[["mrun", "anio_ing_carr_ori", "cat_periodo"]].notna().all(axis=1)
+        ]
+        [["mrun", "cat_periodo", "anio_ing_carr_ori", "jornada", "gen_alu", "rango_edad", "dur_total_carr", "nomb_carrera"]]
+        .rename(columns={"anio_ing_carr_ori": "cohorte"})
+        .astype({"cat_periodo": "int16", "cohorte": "int16"})
+        .sort_values(["mrun", "cat_periodo"], ignore_index=True)
+    )
+
+    # ---------- Desertores ----------
+    df_ecas_cohortes = base_fugas_desde_extracto(df_extracto)
+    mruns_titulados = df_titulados.loc[df_titulados["cod_inst"] == 104, "mrun"].unique().tolist()
+
+    # Las funciones de queries.py imprimen sus dataframes intermedios
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_meta = identificar_desertores(df_ecas_cohortes, mruns_titulados)
+        df_destino, df_abandono = clasificar_destino_abandono(_trayectoria(df_matricula, df_meta["mrun"]), df_meta)
+
+    # ---------- Titulados ----------
+    df_tit = (
+        df_titulados[
+            (df_titulados["cod_inst"] == 104) &
+            (df_titulados["anio_ing_carr_ori"].between(2007, 2025))
+        ]
+        .groupby("mrun", as_index=False)
+        .agg(
+            gen_alu=("gen_alu", "max"),
+            cohorte=("anio_ing_carr_ori", "min"),
+            anio_titulacion=("cat_periodo", "max"),
+            jornada=("jornada", "max"),
+            rango_edad=("rango_edad", "max"),
+        )
+    )
+    df_trayectoria_tit = _trayectoria(df_matricula, df_tit["mrun"])
+    df_trayectoria_tit["requisito_ingreso"] = df_trayectoria_tit["requisito_ingreso"].fillna("Sin información")
+    df_trayectoria_tit = df_trayectoria_tit.merge(df_tit, on="mrun", how="left")
+
+    df_resumen = trayectoria_a_texto(agrupar_trayectoria_post_titulacion(df_trayectoria_tit, df_tit))
+
+    return {
+        DATASET_EXTRACTO_ECAS: df_extracto,
+        "trayectoria_titulados": df_resumen,
+        "fuga_a_destino": df_destino,
+        "abandono_total": df_abandono,
+    }
+
+def publicar_fuentes_sinteticas(version: str, **parametros) -> dict:
+    """Genera, deriva y publica las fuentes; deja la versión activa en el proceso."""
+    vistas = generar_datos_sinteticos(**parametros)
+    fuentes = derivar_fuentes_kpi(vistas)
+
+    publicar_snapshot(fuentes, version=version)
+    activar_version(version)
+
+    return {nombre: len(df) for nombre, df in {**vistas, **fuentes}.items()}
@@ -1,11 +1,13 @@
 from dash import Dash, html, dcc, ctx
-from dash.dependencies import Input, Output, ALL
+from dash.dependencies import Input, Output, State, ALL
 from graphics import *
 from metrics import *
 import pandas as pd
 import dash_bootstrap_components as dbc
+from parches import parche_figura, stores_firma, id_firma
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+server = app.server
 
 navbar = dbc.NavbarSimple(
     children=[
@@ -125,6 +127,7 @@ app.layout = html.Div(
 
         dcc.Store(id="orden-destino-store", data=1),
         dcc.Store(id="cohorte-store", data="ALL"),
+        *stores_firma(["grafico-destino"]),
     ]
 )
 
@@ -193,14 +196,16 @@ def marcar_boton_activo(orden):
     [
         Output("grafico-destino", "figure"),
         Output("leyenda-destino", "children"),
+        Output(id_firma("grafico-destino"), "data"),
     ],
     [
         Input("tabs-destino", "active_tab"),
         Input("orden-destino-store", "data"),
         Input("cohorte-store", "data"),
-    ]
+    ],
+    State(id_firma("grafico-destino"), "data"),
 )
-def update_grafico_destino(tab_activo, orden, cohorte):
+def update_grafico_destino(tab_activo, orden, cohorte, firma):
 
     anio_n = None if cohorte == "ALL" else int(cohorte)
 
@@ -224,7 +229,10 @@ def update_grafico_destino(tab_activo, orden, cohorte):
 
     leyenda = crear_leyenda(df, columna)
 
-    return fig, leyenda
+    # Si el navegador ya tiene el mismo esqueleto de figura, solo se envían trazas y layout (sin template)
+    fig, firma = parche_figura(fig, firma)
+
+    return fig, leyenda, firma
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,55 @@
+#Álgebra de conjuntos de mrun sobre arreglos int64 ordenados y sin repetidos.
+#Reemplaza los set/list de mruns (muchas veces como texto) y los isin sobre columnas de texto:
+#la pertenencia se resuelve con np.searchsorted y las operaciones entre conjuntos sobre arreglos
+#ordenados, sin bucles de Python. Los mrun pueden venir como enteros, flotantes o texto.
+import numpy as np
+import pandas as pd
+
+#Multiplicador de clave_mrun_anio: deja espacio para años de 4 dígitos
+FACTOR_ANIO = 10000
+
+def _a_int64(mruns) -> tuple:
+    """(valores int64, máscara de válidos) de una lista, arreglo o columna de mruns."""
+    serie = mruns if isinstance(mruns, pd.Series) else pd.Series(np.asarray(mruns))
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype=np.int64)
+        return valores, np.ones(len(valores), dtype=bool)
+
+    numeros = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64)
+    validos = ~np.isnan(numeros)
+    return np.where(validos, numeros, 0).astype(np.int64), validos
+
+def conjunto_mrun(mruns) -> np.ndarray:
+    """Conjunto de mruns como arreglo int64 ordenado y sin repetidos (se descartan nulos y no numéricos)."""
+    valores, validos = _a_int64(mruns)
+    return np.unique(valores[validos])
+
+def pertenece(mruns, conjunto: np.ndarray) -> np.ndarray:
+    """Máscara booleana: qué mruns (en su orden original) están en el conjunto."""
+    valores, validos = _a_int64(mruns)
+    if len(conjunto) == 0:
+        return np.zeros(len(valores), dtype=bool)
+
+    posiciones = np.minimum(np.searchsorted(conjunto, valores), len(conjunto) - 1)
+    return validos & (conjunto[posiciones] == valores)
+
+def union(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.union1d(a, b)
+
+def interseccion(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.intersect1d(a, b, assume_unique=True)
+
+def diferencia(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Elementos de a que no están en b."""
+    return a[~pertenece(a, b)]
+
+def clave_mrun_anio(mruns, anios) -> np.ndarray:
+    """
+    Clave única por par (mrun, año), mrun * FACTOR_ANIO + año, para operar pares con las mismas
+    funciones. Es nula si falta alguno de los dos.
+    """
+    mrun, mrun_valido = _a_int64(mruns)
+    anio, anio_valido = _a_int64(anios)
+    clave = (mrun * FACTOR_ANIO + anio).astype(np.float64)
+    clave[~(mrun_valido & anio_valido)] = np.nan
+    return clave
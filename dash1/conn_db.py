@@ -1,32 +1,237 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
 import urllib
+import pandas as pd
+from dialecto_sql import traducir_sql, nombre_temporal
+from instrumentacion import contar_filas
+import trazas_sql
 
 SERVER = 'QUPARDO'
 DATABASE = 'DBMatriculas'
-DRIVER_NAME = 'ODBC Driver 17 for SQL Server' 
+DRIVER_NAME = 'ODBC Driver 17 for SQL Server'
 
-def get_db_engine():
-    """Establece y devuelve el motor de conexión (Engine) a SQL Server usando Autenticación de Windows."""
+#Backend de la capa de consultas: "sqlserver" (por defecto), "duckdb" o "sqlite".
+#Los backends locales leen un archivo con las vistas cargadas como tablas (ver cargar_tablas_locales).
+BACKEND = os.environ.get("ECAS_DB_BACKEND", "sqlserver").lower()
+BASE_DIR = Path(__file__).resolve().parent.parent
+RUTA_BASE_LOCAL = os.environ.get("ECAS_DB_LOCAL", str(BASE_DIR / f"base_local.{BACKEND}"))
+
+#Plazos de las consultas: cada consulta de leer_sql tiene un límite de tiempo (ECAS_TIMEOUT_CONSULTA
+#segundos, 0 = sin límite). Al vencer se cancela en la base y se lanza ConsultaExpirada, así una base
+#lenta no deja tomado un worker del servidor. Los KPIs con @con_plazo comparten un plazo entre todas
+#sus consultas y, si vence, devuelven su último resultado marcado como desactualizado (sin uno previo
+#se relanza ConsultaExpirada: las cargas iniciales van sin plazo, ver plazo_consultas).
+TIMEOUT_CONSULTA = float(os.environ.get("ECAS_TIMEOUT_CONSULTA", 30))
+
+_SIN_PLAZO_DEFINIDO = object()
+_fin_plazo = contextvars.ContextVar("fin_plazo_consultas", default=_SIN_PLAZO_DEFINIDO)
+
+_ultimos_resultados = {}  # (función, argumentos) -> (fecha, último resultado obtenido)
+_lock_resultados = threading.Lock()
+
+class ConsultaExpirada(TimeoutError):
+    """La consulta (o el KPI que la ejecuta) superó su plazo y se canceló."""
+
+def _engine_sqlserver():
+    DRIVER = urllib.parse.quote_plus(DRIVER_NAME)
+
+    DB_URL = f"mssql+pyodbc://{SERVER}/{DATABASE}?driver={DRIVER}&trusted_connection=yes"
+
+    return create_engine(DB_URL, fast_executemany=True)
+
+def _engine_local(backend: str, ruta: str):
+    # En memoria todas las conexiones deben ser la misma, si no cada una ve una base vacía
+    opciones = {"poolclass": StaticPool} if ruta == ":memory:" else {}
+    return create_engine(f"{backend}:///{ruta}", **opciones)
+
+def get_db_engine(backend: str | None = None, ruta: str | None = None):
+    """Establece y devuelve el motor de conexión (Engine): SQL Server con Autenticación de Windows, o una base local."""
+    backend = (backend or BACKEND).lower()
     try:
-        
-        DRIVER = urllib.parse.quote_plus(DRIVER_NAME)
-        
-        DB_URL = f"mssql+pyodbc://{SERVER}/{DATABASE}?driver={DRIVER}&trusted_connection=yes"
-        
-        engine = create_engine(DB_URL, fast_executemany=True)
-        
+
+        if backend == "sqlserver":
+            engine = _engine_sqlserver()
+        elif backend in ("duckdb", "sqlite"):
+            engine = _engine_local(backend, ruta or RUTA_BASE_LOCAL)
+        else:
+            raise ValueError(f"Backend desconocido: {backend}")
+
         # Probar la conexión
         with engine.connect():
             return engine
-            
+
     except Exception as e:
         print("="*50)
-        print(f"ERROR DE CONEXIÓN A SQL SERVER: {e}")
-        print(f"Revisa el nombre del servidor ({SERVER}) y el driver ({DRIVER_NAME}).")
+        print(f"ERROR DE CONEXIÓN ({backend}): {e}")
+        if backend == "sqlserver":
+            print(f"Revisa el nombre del servidor ({SERVER}) y el driver ({DRIVER_NAME}).")
         print("="*50)
         return None
 
+def _cargar_duckdb(df: pd.DataFrame, nombre: str, engine, if_exists: str) -> None:
+    # DuckDB lee el DataFrame directamente (to_sql inserta fila a fila y es órdenes de magnitud más lento)
+    conexion = engine.raw_connection()
+    try:
+        duck = conexion.driver_connection
+        duck.register("_df_carga", df)
+        if if_exists == "append":
+            duck.execute(f'INSERT INTO "{nombre}" SELECT * FROM _df_carga')
+        else:
+            duck.execute(f'CREATE OR REPLACE TABLE "{nombre}" AS SELECT * FROM _df_carga')
+        duck.unregister("_df_carga")
+        conexion.commit()
+    finally:
+        conexion.close()
+
+#Plazos y cancelación
+@contextmanager
+def plazo_consultas(segundos: float | None):
+    """Plazo común para todas las consultas del bloque (None o 0 = sin límite)."""
+    token = _fin_plazo.set(time.monotonic() + segundos if segundos else None)
+    try:
+        yield
+    finally:
+        _fin_plazo.reset(token)
+
+def tiempo_restante() -> float | None:
+    """
+    Segundos disponibles para la próxima consulta (None = sin límite): lo que queda del plazo vigente
+    o TIMEOUT_CONSULTA si no hay uno. Lanza ConsultaExpirada si el plazo ya venció.
+    """
+    fin = _fin_plazo.get()
+    if fin is _SIN_PLAZO_DEFINIDO:
+        return TIMEOUT_CONSULTA or None
+    if fin is None:
+        return None
+
+    restante = fin - time.monotonic()
+    if restante <= 0:
+        raise ConsultaExpirada("Se agotó el plazo de las consultas.")
+    return restante
+
+@contextmanager
+def _limitar(connection, segundos: float | None):
+    """Cancela lo que se ejecute en la conexión si tarda más de 'segundos'."""
+    if segundos is None:
+        yield
+        return
+
+    crudo = connection.connection.driver_connection
+    vencio = threading.Event()
+    temporizador = None
+
+    if connection.dialect.name == "mssql":
+        # pyodbc: el servidor cancela la sentencia al vencer el timeout de la conexión
+        crudo.timeout = max(1, math.ceil(segundos))
+    else:
+        # sqlite3 y duckdb: se interrumpe la consulta en curso desde otro hilo
+        def _interrumpir():
+            vencio.set()
+            crudo.interrupt()
+
+        temporizador = threading.Timer(segundos, _interrumpir)
+        temporizador.daemon = True
+        temporizador.start()
+
+    inicio = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        if vencio.is_set() or time.monotonic() - inicio >= segundos:
+            raise ConsultaExpirada(f"La consulta superó el plazo de {segundos:.1f} s y se canceló.") from e
+        raise
+    finally:
+        if temporizador is not None:
+            temporizador.cancel()
+        if connection.dialect.name == "mssql":
+            crudo.timeout = 0
+
+def con_plazo(funcion):
+    """
+    Ejecuta la función con un plazo común para sus consultas (TIMEOUT_CONSULTA, salvo que ya haya
+    uno vigente). Si vence, devuelve el último resultado obtenido con los mismos argumentos con
+    attrs["desactualizado"] = True y attrs["obtenido"] (fecha); sin uno previo relanza ConsultaExpirada.
+    """
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        clave = (funcion.__qualname__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(clave)
+        except TypeError:
+            clave = None  # argumentos no hasheables (ej: DataFrames): no se guarda respaldo
+
+        try:
+            if _fin_plazo.get() is _SIN_PLAZO_DEFINIDO:
+                with plazo_consultas(TIMEOUT_CONSULTA):
+                    resultado = funcion(*args, **kwargs)
+            else:
+                resultado = funcion(*args, **kwargs)
+        except ConsultaExpirada as e:
+            with _lock_resultados:
+                anterior = _ultimos_resultados.get(clave)
+            if anterior is None:
+                print(f"⚠ {funcion.__name__}: {e} No hay un resultado anterior.")
+                raise
+            print(f"⚠ {funcion.__name__}: {e} Se usa el último resultado disponible ({anterior[0]}).")
+
+            respaldo = anterior[1].copy(deep=False)
+            respaldo.attrs = {"desactualizado": True, "obtenido": anterior[0]}
+            return respaldo
+
+        if clave is not None:
+            with _lock_resultados:
+                _ultimos_resultados[clave] = (datetime.now().isoformat(timespec="seconds"), resultado)
+        return resultado
+
+    return envoltura
+
+#Helpers independientes del motor: las consultas se escriben en T-SQL y se traducen al dialecto del engine.
+def leer_sql(sql: str, engine, params=None) -> pd.DataFrame:
+    sql_motor = traducir_sql(sql, engine.dialect.name)
+    segundos = tiempo_restante()
+    with engine.connect() as connection, _limitar(connection, segundos):
+        if trazas_sql.RUTA_LOG:
+            df = trazas_sql.ejecutar_con_traza(sql, sql_motor, engine, params, conexion=connection)
+        else:
+            df = pd.read_sql(sql_motor, connection, params=params)
+    contar_filas(len(df))
+    return df
+
+def escribir_temporal(df: pd.DataFrame, nombre: str, engine, chunksize: int | None = None) -> None:
+    """Sube df como la tabla temporal '#nombre' (en bases locales es una tabla tmp_nombre)."""
+    tiempo_restante()  # no se sube nada si el plazo ya venció
+    if engine.dialect.name == "duckdb":
+        _cargar_duckdb(df, nombre_temporal(nombre, "duckdb"), engine, "replace")
+        return
+    df.to_sql(nombre_temporal(nombre, engine.dialect.name), engine, if_exists="replace", index=False, chunksize=chunksize)
+
+def borrar_temporal(nombre: str, engine) -> None:
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE {nombre_temporal(nombre, engine.dialect.name)}"))
+    except Exception:
+        pass
+
+def cargar_tablas_locales(tablas: dict, engine, if_exists: str = "replace") -> None:
+    """Carga DataFrames como tablas de la base local (p. ej. las vistas sintéticas de datos_sinteticos.py)."""
+    for nombre, df in tablas.items():
+        categoricas = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        df = df.astype({c: object for c in categoricas})
+        if engine.dialect.name == "duckdb":
+            _cargar_duckdb(df, nombre, engine, if_exists)
+        else:
+            df.to_sql(nombre, engine, if_exists=if_exists, index=False, chunksize=50_000)
+
 if __name__ == '__main__':
     # Prueba de conexión rápida
     if get_db_engine():
-        print("conector_db.py: Conexión exitosa. Engine listo.")
\ No newline at end of file
+        print(f"conector_db.py: Conexión exitosa ({BACKEND}). Engine listo.")
@@ -7,378 +7,423 @@ import pandas as pd
 from sqlalchemy.engine import Engine
 from typing import Optional
 import sys
-from conn_db import get_db_engine
+from conn_db import get_db_engine, plazo_consultas
 from queries import *
 from metrics import *
 from fig_charts import *
+from exportar_snapshots import cargar_dataset_dashboard, DATASETS_DASHBOARD, DERIVADOS_DASHBOARD
+from snapshots import registrar_version_por_request, iniciar_refresco, cache_por_version
+from instrumentacion import instrumentar_app
+from memoria import reportar_inicio
+from parches import callback_figura, stores_firma
 
 #Constantes
 COD_ECAS = 104
 JORNADA_DIURNA = 'DIURNA'
 JORNADA_VESPERTINA = 'VESPERTINA'
 
-DB_ENGINE = get_db_engine()
+#Gráficos que dependen de la cohorte: se actualizan con Patch (ver parches.py)
+GRAFICOS_COHORTE = [
+    'permanencia-diurna-chart',
+    'permanencia-vespertina-chart',
+    'continuidad-chart',
+    'fuga-destino-pie-chart',
+    'fuga-carrera-bar-chart',
+    'fuga-area-pie-chart',
+    'tiempo-descanso-chart',
+    'total-fugados-chart',
+    'titulacion-estimada-chart',
+    'titulados-desde-otra-inst-chart',
+    'desercion-chart',
+]
 
-#Carga de dataframes
-df_ingresos = get_mruns_per_year(DB_ENGINE)
-df_permanencia_data = get_permanencia_per_year(DB_ENGINE)
-df_permanencia_diurna = get_permanencia_ranking_por_jornada(DB_ENGINE, JORNADA_DIURNA)
-df_permanencia_vespertina = get_permanencia_ranking_por_jornada(DB_ENGINE, JORNADA_VESPERTINA)
-df_continuidad_data = get_continuidad_per_year(DB_ENGINE)
-df_fuga_destino_all = get_top_fuga_a_destino(top_n=10, anio_n=None)
-df_fuga_carrera_all = get_top_fuga_a_carrera(top_n=10, anio_n=None)
-df_fuga_area_all = get_top_fuga_a_area(top_n=10, anio_n=None)
-df_tiempo_descanso_data = get_tiempo_de_descanso(anio_n=None)
-df_total_fugados_data = get_total_fugados_por_cohorte(anio_n=None)
-df_titulacion_estimada_data = get_estimation_titulacion_abandono(anio_n=None)
-df_titulados_desde_otra_inst = titulados_en_ecas_desde_otra_institucion(DB_ENGINE)
-df_desercion_data = get_tasa_desercion_por_cohorte()
-df_ingresos_competencia = get_ingresos_competencia_ecas(DB_ENGINE)
-
-#Creación de gráficos
-admission_chart = create_admission_chart(df_ingresos)
-permanencia_chart = create_permanence_chart(df_permanencia_data)
-permanence_diurna_chart = create_permanence_chart_jornada(df_permanencia_diurna, JORNADA_DIURNA, COD_ECAS)
-permanence_vespertina_chart = create_permanence_chart_jornada(df_permanencia_vespertina, JORNADA_VESPERTINA, COD_ECAS)
-survival_chart_initial = create_survival_chart(df_continuidad_data, anio_filtro='ALL')
-survival_mean_chart = create_resumen_continuidad_chart(df_continuidad_data)
-fuga_destino_chart_initial = create_top_fuga_pie_chart(df_fuga_destino_all, anio_n=None)
-fuga_carrera_chart_initial = create_top_fuga_carrera_chart(df_fuga_carrera_all, anio_n=None)
-fuga_area_chart_initial = create_fuga_area_pie_chart(df_fuga_area_all, anio_n=None)
-tiempo_descanso_chart_initial = create_tiempo_descanso_chart(df_tiempo_descanso_data, anio_n=None)
-total_fugados_chart_initial = create_total_fugados_chart(df_total_fugados_data, anio_n=None)
-titulacion_estimada_chart_initial = create_titulacion_estimada_chart(df_titulacion_estimada_data, anio_n=None)
-titulados_desde_otra_inst_chart_initial = create_titulacion_desde_otra_inst_chart(df_titulados_desde_otra_inst)
-desercion_chart_initial = create_tasa_desercion_chart(df_desercion_data, anio_n=None)
-ingresos_competencia_chart = create_ingresos_competencia_chart(df_ingresos_competencia)
-
-#Dropdown instituciones
-opciones_inst = (
-    df_ingresos_competencia[["cod_inst", "nomb_inst"]]
-    .drop_duplicates()
-    .sort_values("nomb_inst")
-)
+DB_ENGINE = get_db_engine()
 
-dropdown_instituciones = [
-    {"label": row["nomb_inst"], "value": row["cod_inst"]}
-    for _, row in opciones_inst.iterrows()
-]
+def datos(nombre: str) -> pd.DataFrame:
+    """Dataset global en la versión de datos de la request (se actualiza con cada snapshot nuevo)."""
+    return cargar_dataset_dashboard(nombre, DB_ENGINE)
+
+@cache_por_version
+def ranking_permanencia(nombre: str) -> pd.DataFrame:
+    """Top 5 + ECAS por año ya calculado para una jornada (los callbacks solo filtran el año)."""
+    return rankear_top_n_ecas(datos(nombre), COD_ECAS)
+
+#Carga inicial sin plazo (como exportar_snapshots.py): sin snapshot, cada dataset espera a la base una vez
+#y deja un resultado de respaldo para las cargas de página y callbacks, que sí tienen plazo
+with plazo_consultas(None):
+    for nombre in [*DATASETS_DASHBOARD, *DERIVADOS_DASHBOARD]:
+        datos(nombre)
+    for nombre in ("permanencia_diurna", "permanencia_vespertina"):
+        ranking_permanencia(nombre)
+reportar_inicio("dashboard")
+
+def layout():
+    """
+    Layout de la página. Se arma en cada carga con los datasets de la versión de la request:
+    las opciones y figuras iniciales siguen al snapshot vigente y no quedan DataFrames globales.
+    """
+    df_ingresos = datos("ingresos")
+    df_continuidad_data = datos("continuidad")
+    df_ingresos_competencia = datos("ingresos_competencia")
+
+    #Creación de gráficos
+    admission_chart = create_admission_chart(df_ingresos)
+    permanencia_chart = create_permanence_chart(datos("permanencia"))
+    permanence_diurna_chart = create_permanence_chart_jornada(ranking_permanencia("permanencia_diurna"), JORNADA_DIURNA, COD_ECAS)
+    permanence_vespertina_chart = create_permanence_chart_jornada(ranking_permanencia("permanencia_vespertina"), JORNADA_VESPERTINA, COD_ECAS)
+    survival_chart_initial = create_survival_chart(df_continuidad_data, anio_filtro='ALL')
+    survival_mean_chart = create_resumen_continuidad_chart(df_continuidad_data)
+    fuga_destino_chart_initial = create_top_fuga_pie_chart(get_top_fuga_por_orden("institucion_destino", top_n=10, anio_n=None), anio_n=None)
+    fuga_carrera_chart_initial = create_top_fuga_carrera_chart(get_top_fuga_por_orden("carrera_destino", top_n=10, anio_n=None), anio_n=None)
+    fuga_area_chart_initial = create_fuga_area_pie_chart(get_top_fuga_por_orden("area_conocimiento_destino", top_n=10, anio_n=None), anio_n=None)
+    tiempo_descanso_chart_initial = create_tiempo_descanso_chart(datos("tiempo_descanso"), anio_n=None)
+    total_fugados_chart_initial = create_total_fugados_chart(datos("total_fugados"), anio_n=None)
+    titulacion_estimada_chart_initial = create_titulacion_estimada_chart(datos("titulacion_estimada"), anio_n=None)
+    titulados_desde_otra_inst_chart_initial = create_titulacion_desde_otra_inst_chart(datos("titulados_desde_otra_inst"))
+    desercion_chart_initial = create_tasa_desercion_chart(datos("desercion"), anio_n=None)
+    ingresos_competencia_chart = create_ingresos_competencia_chart(df_ingresos_competencia)
+
+    #Dropdown instituciones
+    opciones_inst = (
+        df_ingresos_competencia[["cod_inst", "nomb_inst"]]
+        .drop_duplicates()
+        .sort_values("nomb_inst")
+    )
 
-cohortes_disponibles = sorted(df_ingresos['ingreso_primero'].unique().tolist())
+    dropdown_instituciones = [
+        {"label": row["nomb_inst"], "value": row["cod_inst"]}
+        for _, row in opciones_inst.iterrows()
+    ]
 
-cohortes_disponibles_completas = [
-    year for year in cohortes_disponibles 
-    if year >= 2007 and year <= 2024
-]
+    cohortes_disponibles = sorted(df_ingresos['ingreso_primero'].unique().tolist())
 
-opciones_dropdown = [{'label': 'Total General (Todas las Cohortes)', 'value': 'ALL'}] + \
-                    [{'label': str(year), 'value': year} for year in cohortes_disponibles_completas]
+    cohortes_disponibles_completas = [
+        year for year in cohortes_disponibles 
+        if year >= 2007 and year <= 2024
+    ]
 
-app = dash.Dash(__name__, title="Dashboard de Deserción ECAS")
+    opciones_dropdown = [{'label': 'Total General (Todas las Cohortes)', 'value': 'ALL'}] + \
+                        [{'label': str(year), 'value': year} for year in cohortes_disponibles_completas]
 
-app.layout = html.Div(style={'backgroundColor': '#f8f9fa', 'padding': '20px'}, children=[
+    return html.Div(style={'backgroundColor': '#f8f9fa', 'padding': '20px'}, children=[
     
-    # Encabezado Principal
-    html.H1(
-        children='Dashboard de Retención y Trayectoria Estudiantil (ECAS)',
-        style={
-            'textAlign': 'center',
-            'color': '#343a40',
-            'marginBottom': '30px'
-        }
-    ),
+        # Encabezado Principal
+        html.H1(
+            children='Dashboard de Retención y Trayectoria Estudiantil (ECAS)',
+            style={
+                'textAlign': 'center',
+                'color': '#343a40',
+                'marginBottom': '30px'
+            }
+        ),
 
-    # Sección de Ingreso de Alumnos (Gráfico 1)
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='ingreso-total-chart',
-                    figure=admission_chart
-                )
+        # Sección de Ingreso de Alumnos (Gráfico 1)
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='ingreso-total-chart',
+                        figure=admission_chart
+                    )
+                ])
             ])
-        ])
-    ]),
+        ]),
 
-    html.Div(className="row", children=[
+        html.Div(className="row", children=[
 
-        html.Div(className="col-md-8", children=[
-            dcc.Graph(
-                id="ingresos-competencia-chart",
-                figure=ingresos_competencia_chart
-            )
-        ])
+            html.Div(className="col-md-8", children=[
+                dcc.Graph(
+                    id="ingresos-competencia-chart",
+                    figure=ingresos_competencia_chart
+                )
+            ]),
+
+            html.Div(className="col-md-4", children=[
+                html.Label("Comparar ECAS con:"),
+                dcc.Dropdown(
+                    id="institucion-dropdown",
+                    options=dropdown_instituciones,
+                    multi=True,
+                    placeholder="Seleccionar instituciones"
+                )
+            ])
 
-    ]),
+        ]),
     
-    html.Br(),
+        html.Br(),
 
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='permanencia-total-chart',
-                    figure=permanencia_chart
-                )
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='permanencia-total-chart',
+                        figure=permanencia_chart
+                    )
+                ])
             ])
-        ])
-    ]),
-
-    html.Br(),
-
-    html.Div(style={'marginBottom': '20px', 'marginTop': '20px', 'width': '30%', 'minWidth': '250px'}, children=[
-        html.Label("Seleccionar Cohorte de Ingreso:"),
-        dcc.Dropdown(
-            id='cohorte-dropdown',
-            options=opciones_dropdown,
-            value='ALL',  # Valor inicial: Mostrar todas las cohortes
-            clearable=False
-        ),
-    ]),
+        ]),
+
+        html.Br(),
+
+        html.Div(style={'marginBottom': '20px', 'marginTop': '20px', 'width': '30%', 'minWidth': '250px'}, children=[
+            html.Label("Seleccionar Cohorte de Ingreso:"),
+            dcc.Dropdown(
+                id='cohorte-dropdown',
+                options=opciones_dropdown,
+                value='ALL',  # Valor inicial: Mostrar todas las cohortes
+                clearable=False
+            ),
+        ]),
     
-    html.Br(),
+        html.Br(),
     
-    # Sección de Métricas de Fuga (Placeholder para futuros KPI)
-    html.H2(
-    children='Análisis de Permanencia por Jornada (Top 5 + ECAS)',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
+        # Sección de Métricas de Fuga (Placeholder para futuros KPI)
+        html.H2(
+        children='Análisis de Permanencia por Jornada (Top 5 + ECAS)',
+        style={
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
+        }
+        ),
     
-    html.Div(className='row', children=[
-        # Gráfico 4A: Jornada Diurna
-        html.Div(className='col-md-6', children=[
-            dcc.Graph(id='permanencia-diurna-chart', figure=create_permanence_chart_jornada(df_permanencia_diurna, JORNADA_DIURNA, COD_ECAS))
-        ]),
+        html.Div(className='row', children=[
+            # Gráfico 4A: Jornada Diurna
+            html.Div(className='col-md-6', children=[
+                dcc.Graph(id='permanencia-diurna-chart', figure=permanence_diurna_chart)
+            ]),
         
-        # Gráfico 4B: Jornada Vespertina
-        html.Div(className='col-md-6', children=[
-            dcc.Graph(id='permanencia-vespertina-chart', figure=create_permanence_chart_jornada(df_permanencia_vespertina, JORNADA_VESPERTINA, COD_ECAS))
+            # Gráfico 4B: Jornada Vespertina
+            html.Div(className='col-md-6', children=[
+                dcc.Graph(id='permanencia-vespertina-chart', figure=permanence_vespertina_chart)
+            ]),
         ]),
-    ]),
-
-    html.H2(
-    children='5. Tasa de Continuidad Estudiantil por Cohorte',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='continuidad-chart',
-                    figure=survival_chart_initial # Figura inicial completa
-                )
-            ])
-        ])
-    ]),
-
-    html.H2(
-    children='6. Top 10 Instituciones de Destino de los Estudiantes Fugados',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
-
-    html.Div(className='row', children=[
-        html.Div(className='col-md-6', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='fuga-destino-pie-chart',
-                    figure=fuga_destino_chart_initial 
-                )
+
+        html.H2(
+        children='5. Tasa de Continuidad Estudiantil por Cohorte',
+        style={
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
+        }
+        ),
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='continuidad-chart',
+                        figure=survival_chart_initial # Figura inicial completa
+                    )
+                ])
             ])
         ]),
-    ]),
-
-    html.H2(
-    children='7. Top 10 Carreras de Destino de los Estudiantes Fugados',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
-
-    html.Div(className='row', children=[
-        html.Div(className='col-md-6', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='fuga-carrera-bar-chart',
-                    figure=fuga_carrera_chart_initial 
-                )
-            ])
+
+        html.H2(
+        children='6. Top 10 Instituciones de Destino de los Estudiantes Fugados',
+        style={
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
+        }
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-6', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='fuga-destino-pie-chart',
+                        figure=fuga_destino_chart_initial 
+                    )
+                ])
+            ]),
         ]),
-    ]),
 
-    html.H2(
-    children='8. Top 10 Areas de Destino de los Estudiantes Fugados',
+        html.H2(
+        children='7. Top 10 Carreras de Destino de los Estudiantes Fugados',
         style={
-            'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
-            'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
         }
-    ),
+        ),
 
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
+        html.Div(className='row', children=[
+            html.Div(className='col-md-6', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='fuga-carrera-bar-chart',
+                        figure=fuga_carrera_chart_initial 
+                    )
+                ])
+            ]),
+        ]),
+
+        html.H2(
+        children='8. Top 10 Areas de Destino de los Estudiantes Fugados',
+            style={
+                'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
+                'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
+            }
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='fuga-area-pie-chart', # Nuevo ID para el Pie Chart
+                        figure=fuga_area_chart_initial 
+                    )
+                ])
+            ]),
+        ]),
+
+        html.H2(
+            children='9. Distribución del Tiempo de Descanso Antes de Reingresar',
+            style={
+                'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
+                'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
+            }
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-8', children=[ # Usamos 8/12 para centrar un poco el pie chart
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='tiempo-descanso-chart',
+                        figure=tiempo_descanso_chart_initial 
+                    )
+                ])
+            ]),
+        ]),
+
+        html.H2(
+            children='10. Distribución del Cambio de Institución v/s Abandono del sistema',
+            style={
+                'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
+                'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
+            }
+        ),
+
+        html.Div(className='col-md-6', children=[
             html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
                 dcc.Graph(
-                    id='fuga-area-pie-chart', # Nuevo ID para el Pie Chart
-                    figure=fuga_area_chart_initial 
+                    id='total-fugados-chart', 
+                    figure=total_fugados_chart_initial # Nuevo KPI
                 )
             ])
         ]),
-    ]),
 
-    html.H2(
-        children='9. Distribución del Tiempo de Descanso Antes de Reingresar',
+        html.H2(
+        children='11. Estimación de Titulados en Instituciones de Destino',
         style={
             'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
             'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
         }
-    ),
 
-    html.Div(className='row', children=[
-        html.Div(className='col-md-8', children=[ # Usamos 8/12 para centrar un poco el pie chart
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='tiempo-descanso-chart',
-                    figure=tiempo_descanso_chart_initial 
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
+                    dcc.Graph(
+                        id='titulacion-estimada-chart',
+                        figure=titulacion_estimada_chart_initial 
+                    )
+                ])
+            ]),
+        ]),
+        html.H2(
+        children='12. Titulación en ECAS de Estudiantes Provenientes de Otra Institución',
+        style={
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
+        }
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(
+                    style={
+                        'backgroundColor': 'white',
+                        'padding': '20px',
+                        'borderRadius': '8px',
+                        'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'
+                    },
+                    children=[
+                        dcc.Graph(
+                            id='titulados-desde-otra-inst-chart',
+                            figure=titulados_desde_otra_inst_chart_initial
+                        )
+                    ]
                 )
             ])
         ]),
-    ]),
-
-    html.H2(
-        children='10. Distribución del Cambio de Institución v/s Abandono del sistema',
+        html.H2(
+        children='12. Tasa de Deserción por Cohorte ECAS',
         style={
-            'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
-            'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
+            'textAlign': 'left',
+            'color': '#343a40',
+            'marginTop': '20px',
+            'borderBottom': '2px solid #e9ecef',
+            'paddingBottom': '10px'
         }
-    ),
-
-    html.Div(className='col-md-6', children=[
-        html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-            dcc.Graph(
-                id='total-fugados-chart', 
-                figure=total_fugados_chart_initial # Nuevo KPI
-            )
-        ])
-    ]),
-
-    html.H2(
-    children='11. Estimación de Titulados en Instituciones de Destino',
-    style={
-        'textAlign': 'left', 'color': '#343a40', 'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef', 'paddingBottom': '10px'
-    }
-
-    ),
-
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'}, children=[
-                dcc.Graph(
-                    id='titulacion-estimada-chart',
-                    figure=titulacion_estimada_chart_initial 
+        ),
+
+        html.Div(className='row', children=[
+            html.Div(className='col-md-12', children=[
+                html.Div(
+                    style={
+                        'backgroundColor': 'white',
+                        'padding': '20px',
+                        'borderRadius': '8px',
+                        'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'
+                    },
+                    children=[
+                        dcc.Graph(
+                            id='desercion-chart',
+                            figure=desercion_chart_initial
+                        )
+                    ]
                 )
             ])
         ]),
-    ]),
-    html.H2(
-    children='12. Titulación en ECAS de Estudiantes Provenientes de Otra Institución',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
-
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(
-                style={
-                    'backgroundColor': 'white',
-                    'padding': '20px',
-                    'borderRadius': '8px',
-                    'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'
-                },
-                children=[
-                    dcc.Graph(
-                        id='titulados-desde-otra-inst-chart',
-                        figure=titulados_desde_otra_inst_chart_initial
-                    )
-                ]
-            )
-        ])
-    ]),
-    html.H2(
-    children='12. Tasa de Deserción por Cohorte ECAS',
-    style={
-        'textAlign': 'left',
-        'color': '#343a40',
-        'marginTop': '20px',
-        'borderBottom': '2px solid #e9ecef',
-        'paddingBottom': '10px'
-    }
-    ),
-
-    html.Div(className='row', children=[
-        html.Div(className='col-md-12', children=[
-            html.Div(
-                style={
-                    'backgroundColor': 'white',
-                    'padding': '20px',
-                    'borderRadius': '8px',
-                    'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'
-                },
-                children=[
-                    dcc.Graph(
-                        id='desercion-chart',
-                        figure=desercion_chart_initial
-                    )
-                ]
-            )
-        ])
-    ]),
 
-])
+        # Firma del esqueleto de cada gráfico que se actualiza con Patch
+        *stores_firma(GRAFICOS_COHORTE),
+    ])
+
+app = dash.Dash(__name__, title="Dashboard de Deserción ECAS")
+server = app.server
+registrar_version_por_request(server)
+
+app.layout = layout
 
 @app.callback(
     Output("ingresos-competencia-chart", "figure"),
     Input("institucion-dropdown", "value")
 )
 def update_ingresos_competencia(cod_inst_selected):
+    # Las instituciones elegidas se muestran junto a ECAS (el resto queda en la leyenda)
     return create_ingresos_competencia_chart(
-        df_ingresos_competencia,
+        datos("ingresos_competencia"),
         cod_inst_selected
     )
 
-@app.callback(
-    Output('permanencia-diurna-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'permanencia-diurna-chart', Input('cohorte-dropdown', 'value'))
 def update_diurna_chart(selected_year):
-    # Crear una copia del DataFrame completo para trabajar con ella
-    df_filtered = df_permanencia_diurna.copy() 
+    # Ranking Top 5 + ECAS ya calculado para todos los años
+    df_filtered = ranking_permanencia("permanencia_diurna")
     
     if selected_year != 'ALL':
         # Convertir el año seleccionado a entero
@@ -387,19 +432,15 @@ def update_diurna_chart(selected_year):
         # Filtrar el DataFrame al año específico
         df_filtered = df_filtered[df_filtered['anio'] == year_int]
         
-    # Reutilizar la función de creación de gráfico con el DataFrame filtrado
-    # La función ya aplica la lógica de Top 5 + ECAS por año, que ahora será solo un año.
+    # El ranking es por año, así que filtrar un año no cambia el Top 5 + ECAS
     return create_permanence_chart_jornada(df_filtered, JORNADA_DIURNA, COD_ECAS)
 
 
 # --- Callback para actualizar el gráfico de Permanencia Vespertina ---
-@app.callback(
-    Output('permanencia-vespertina-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'permanencia-vespertina-chart', Input('cohorte-dropdown', 'value'))
 def update_vespertina_chart(selected_year):
-    # Crear una copia del DataFrame completo
-    df_filtered = df_permanencia_vespertina.copy() 
+    # Ranking Top 5 + ECAS ya calculado para todos los años
+    df_filtered = ranking_permanencia("permanencia_vespertina")
     
     if selected_year != 'ALL':
         year_int = int(selected_year)
@@ -408,22 +449,18 @@ def update_vespertina_chart(selected_year):
     # Reutilizar la función de creación de gráfico con el DataFrame filtrado
     return create_permanence_chart_jornada(df_filtered, JORNADA_VESPERTINA, COD_ECAS)
 
-@app.callback(
-    Output('continuidad-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'continuidad-chart', Input('cohorte-dropdown', 'value'))
 def update_survival_chart(selected_year):
+    df_continuidad = datos("continuidad")
+
     if selected_year is None or selected_year == "ALL":
-        return create_resumen_continuidad_chart(df_continuidad_data)
+        return create_resumen_continuidad_chart(df_continuidad)
 
     return create_survival_chart(
-        df_continuidad_data, anio_filtro=selected_year
+        df_continuidad, anio_filtro=selected_year
     )
 
-@app.callback(
-    Output('fuga-destino-pie-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'fuga-destino-pie-chart', Input('cohorte-dropdown', 'value'))
 def update_fuga_destino_chart(selected_year):
     
     anio_n_filter = None
@@ -435,15 +472,12 @@ def update_fuga_destino_chart(selected_year):
             anio_n_filter = None 
 
     # Recargar o refiltrar los datos desde la fuente
-    df_fuga_destino_filtered = get_top_fuga_a_destino(top_n=10, anio_n=anio_n_filter)
+    df_fuga_destino_filtered = get_top_fuga_por_orden("institucion_destino", top_n=10, anio_n=anio_n_filter)
     
     # Crear el gráfico
     return create_top_fuga_pie_chart(df_fuga_destino_filtered, anio_n=anio_n_filter)
 
-@app.callback(
-    Output('fuga-carrera-bar-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'fuga-carrera-bar-chart', Input('cohorte-dropdown', 'value'))
 def update_fuga_carrera_chart(selected_year):
     
     anio_n_filter = None
@@ -454,15 +488,12 @@ def update_fuga_carrera_chart(selected_year):
             anio_n_filter = None 
 
     # Recargar o refiltrar los datos desde la fuente
-    df_fuga_carrera_filtered = get_top_fuga_a_carrera(top_n=10, anio_n=anio_n_filter)
+    df_fuga_carrera_filtered = get_top_fuga_por_orden("carrera_destino", top_n=10, anio_n=anio_n_filter)
     
     # Crear el gráfico
     return create_top_fuga_carrera_chart(df_fuga_carrera_filtered, anio_n=anio_n_filter)
 
-@app.callback(
-    Output('fuga-area-pie-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'fuga-area-pie-chart', Input('cohorte-dropdown', 'value'))
 def update_fuga_area_pie_chart(selected_year):
     
     anio_n_filter = None
@@ -473,18 +504,15 @@ def update_fuga_area_pie_chart(selected_year):
             anio_n_filter = None 
 
     # Recargar o refiltrar los datos
-    df_fuga_area_filtered = get_top_fuga_a_area(top_n=10, anio_n=anio_n_filter)
+    df_fuga_area_filtered = get_top_fuga_por_orden("area_conocimiento_destino", top_n=10, anio_n=anio_n_filter)
     
     # Crear el gráfico
     return create_fuga_area_pie_chart(df_fuga_area_filtered, anio_n=anio_n_filter)
 
-@app.callback(
-    Output('tiempo-descanso-chart', 'figure'),
-    Input('cohorte-dropdown', 'value')
-)
+@callback_figura(app, 'tiempo-descanso-chart', Input('cohorte-dropdown', 'value'))
 def update_tiempo_descanso_chart(selected_year):
 
-    df_base = df_tiempo_descanso_data.copy()
+    df_base = datos("tiempo_descanso")
 
     # TOTAL GENERAL
     if selected_year == 'ALL' or selected_year is None:
@@ -514,17 +542,14 @@ def update_tiempo_descanso_chart(selected_year):
 
         return create_tiempo_descanso_chart(df_filtered, anio_n=None)
 
-@app.callback(
-    Output('total-fugados-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'total-fugados-chart', Input('cohorte-dropdown', 'value'))
 def update_total_fugados_chart(selected_year):
     
     # 1. Inicializar la variable de filtro que usaremos en la función del gráfico
     anio_n_filter = None
     
     # Usamos el DataFrame completo cargado en memoria (asumiendo que df_total_fugados_data es global)
-    df_base = df_total_fugados_data.copy()
+    df_base = datos("total_fugados")
     
     if selected_year != 'ALL':
         try:
@@ -548,14 +573,11 @@ def update_total_fugados_chart(selected_year):
     # anio_n=None indica a la función que debe crear el gráfico de tendencia
     return create_total_fugados_chart(df_filtered, anio_n=None)
 
-@app.callback(
-    Output('titulacion-estimada-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'titulacion-estimada-chart', Input('cohorte-dropdown', 'value'))
 def update_titulacion_estimada_chart(selected_year):
     
     # Usamos el DataFrame completo cargado en memoria (asumiendo que df_titulacion_estimada_data es global)
-    df_base = df_titulacion_estimada_data.copy()
+    df_base = datos("titulacion_estimada")
     
     if selected_year == 'ALL':
         # Vista de tendencia completa
@@ -570,13 +592,10 @@ def update_titulacion_estimada_chart(selected_year):
             # En caso de error, volver a la vista general
             return create_titulacion_estimada_chart(df_base, anio_n=None)
 
-@app.callback(
-    Output('titulados-desde-otra-inst-chart', 'figure'),
-    [Input('cohorte-dropdown', 'value')]
-)
+@callback_figura(app, 'titulados-desde-otra-inst-chart', Input('cohorte-dropdown', 'value'))
 def update_titulados_desde_otra_inst_chart(selected_year):
 
-    df_base = df_titulados_desde_otra_inst.copy()
+    df_base = datos("titulados_desde_otra_inst")
 
     # TOTAL GENERAL
     if selected_year == 'ALL' or selected_year is None:
@@ -592,13 +611,10 @@ def update_titulados_desde_otra_inst_chart(selected_year):
     except (ValueError, TypeError):
         return create_titulacion_desde_otra_inst_chart(df_base)
 
-@app.callback(
-    Output('desercion-chart', 'figure'),
-    Input('cohorte-dropdown', 'value')
-)
+@callback_figura(app, 'desercion-chart', Input('cohorte-dropdown', 'value'))
 def update_desercion_chart(selected_year):
 
-    df_base = df_desercion_data.copy()
+    df_base = datos("desercion")
 
     if selected_year == 'ALL' or selected_year is None:
         return create_tasa_desercion_chart(df_base, anio_n=None)
@@ -611,5 +627,9 @@ def update_desercion_chart(selected_year):
     except (ValueError, TypeError):
         return create_tasa_desercion_chart(df_base, anio_n=None)
 
+# Latencia, CPU, filas y tamaño de respuesta de cada callback en /metrics
+instrumentar_app(app)
+
 if __name__ == '__main__':
+    iniciar_refresco()
     app.run(debug=True)
\ No newline at end of file
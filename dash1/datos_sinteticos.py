@@ -0,0 +1,568 @@
+#Generador de datos sintéticos con el esquema de las vistas unificadas (ver views.py).
+#Permite probar y medir los KPIs sin el SQL Server de producción: modela cohortes ECAS,
+#deserción, retornos, traslados a otras instituciones, titulación y estudios de postgrado.
+#Uso: python datos_sinteticos.py --ecas 20000 --nacional 1000000 --salida datos_sinteticos
+#     python datos_sinteticos.py --formato duckdb --salida base_local.duckdb   (base local, ver conn_db.py)
+import argparse
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from views import consulta_matricula, consulta_titulados, create_dimension_table, sql_dim_carrera, indices_dim_carrera
+from conn_db import get_db_engine, cargar_tablas_locales
+
+COD_ECAS = 104
+NOMBRE_ECAS = "INSTITUTO PROFESIONAL ESCUELA DE CONTADORES AUDITORES DE SANTIAGO"
+CARRERA_ECAS = "CONTADOR AUDITOR"
+DURACION_ECAS = {"Diurna": 8, "Vespertina": 9}
+
+MRUN_INICIAL = 1_000_000
+
+RANGOS_EDAD = ["15 a 19 años", "20 a 24 años", "25 a 29 años", "30 a 34 años", "35 a 39 años", "40 y más años"]
+LIMITES_EDAD = [20, 25, 30, 35, 40]
+
+REGIONES = ["Metropolitana", "Valparaíso", "Biobío", "Maule", "Araucanía", "Antofagasta", "Los Lagos", "Coquimbo"]
+
+#tipo_inst_1 -> (tipo_inst_2, tipo_inst_3, prefijo del nombre)
+TIPOS_INSTITUCION = {
+    "Universidades": ("Universidades Privadas", "Universidades Privadas", "UNIVERSIDAD"),
+    "Institutos Profesionales": ("Institutos Profesionales", "Institutos Profesionales", "INSTITUTO PROFESIONAL"),
+    "Centros de Formación Técnica": ("Centros de Formación Técnica", "Centros de Formación Técnica", "CENTRO DE FORMACION TECNICA"),
+}
+
+#carrera -> (area, nivel_global, nivel_carrera_1, nivel_carrera_2, semestres, tipos de institución que la imparten)
+CARRERAS = {
+    "CONTADOR AUDITOR": ("Administración y Comercio", "Pregrado", "Carreras Profesionales", "Profesional Sin Licenciatura", 9, "UI"),
+    "INGENIERIA COMERCIAL": ("Administración y Comercio", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "INGENIERIA EN ADMINISTRACION DE EMPRESAS": ("Administración y Comercio", "Pregrado", "Carreras Profesionales", "Profesional Sin Licenciatura", 8, "UI"),
+    "CONTADOR TECNICO DE NIVEL SUPERIOR": ("Administración y Comercio", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 5, "IC"),
+    "TECNICO DE NIVEL SUPERIOR EN CONTABILIDAD": ("Administración y Comercio", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 5, "IC"),
+    "TECNICO EN ADMINISTRACION DE EMPRESAS": ("Administración y Comercio", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 4, "IC"),
+    "INGENIERIA CIVIL INFORMATICA": ("Tecnología", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 12, "U"),
+    "ANALISTA PROGRAMADOR": ("Tecnología", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 5, "IC"),
+    "INGENIERIA EN CONSTRUCCION": ("Tecnología", "Pregrado", "Carreras Profesionales", "Profesional Sin Licenciatura", 9, "UI"),
+    "ENFERMERIA": ("Salud", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "TECNICO EN ENFERMERIA": ("Salud", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 5, "IC"),
+    "PEDAGOGIA EN EDUCACION BASICA": ("Educación", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 9, "U"),
+    "PSICOLOGIA": ("Ciencias Sociales", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "TRABAJO SOCIAL": ("Ciencias Sociales", "Pregrado", "Carreras Profesionales", "Profesional Sin Licenciatura", 8, "UI"),
+    "DERECHO": ("Derecho", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "TECNICO JURIDICO": ("Derecho", "Pregrado", "Carreras Técnicas", "Técnico de Nivel Superior", 5, "IC"),
+    "DISEÑO GRAFICO": ("Arte y Arquitectura", "Pregrado", "Carreras Profesionales", "Profesional Sin Licenciatura", 8, "UI"),
+    "PERIODISMO": ("Humanidades", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "AGRONOMIA": ("Agropecuaria", "Pregrado", "Carreras Profesionales", "Profesional Con Licenciatura", 10, "U"),
+    "POSTITULO EN AUDITORIA": ("Administración y Comercio", "Postítulo", "Postítulo", "Postítulo", 2, "UI"),
+    "DIPLOMADO EN NORMAS IFRS": ("Administración y Comercio", "Postítulo", "Postítulo", "Postítulo", 2, "UI"),
+    "POSTITULO EN GESTION TRIBUTARIA": ("Administración y Comercio", "Postítulo", "Postítulo", "Postítulo", 2, "U"),
+    "MAGISTER EN TRIBUTACION": ("Administración y Comercio", "Postgrado", "Magister", "Magister", 4, "U"),
+    "MAGISTER EN ADMINISTRACION DE EMPRESAS (MBA)": ("Administración y Comercio", "Postgrado", "Magister", "Magister", 4, "U"),
+    "MAGISTER EN FINANZAS": ("Administración y Comercio", "Postgrado", "Magister", "Magister", 4, "U"),
+    "DOCTORADO EN ECONOMIA": ("Administración y Comercio", "Postgrado", "Doctorado", "Doctorado", 8, "U"),
+}
+
+REQUISITO_POR_NIVEL = {"Pregrado": "Licencia Media", "Postítulo": "Título Profesional", "Postgrado": "Licenciatura"}
+
+#Probabilidades del modelo de trayectorias
+P_VESPERTINA = 0.4
+P_TITULA_ECAS = 0.5
+P_RETORNO = 0.12
+P_TRASLADO = 0.55
+P_TITULA_DESTINO = 0.45
+P_POSTGRADO = 0.22
+P_SEGUNDO_PREGRADO = 0.08
+P_TRAYECTORIA_PREVIA = 0.08
+P_TITULA_NACIONAL = 0.55
+P_POSTGRADO_NACIONAL = 0.1
+P_TITULO_SIN_NOMBRE_ECAS = 0.1
+
+def columnas_consulta(consulta: str) -> list:
+    """Nombres de columna (alias incluidos) de una lista de columnas SQL como las de views.py."""
+    columnas = []
+    for parte in consulta.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        alias = re.search(r"\bAS\s+(\w+)\s*$", parte, flags=re.IGNORECASE)
+        columnas.append(alias.group(1) if alias else parte.split()[-1])
+    return columnas
+
+COLUMNAS_MATRICULA = columnas_consulta(consulta_matricula)
+COLUMNAS_TITULADOS = columnas_consulta(consulta_titulados)
+
+#Catálogo de instituciones y oferta
+def construir_catalogo(semilla: int = 2024, n_instituciones: int = 150) -> pd.DataFrame:
+    """
+    Oferta académica sintética: una fila por carrera-jornada-institución (cod_carrera único).
+    Incluye a ECAS (cod_inst 104) y a la competencia directa (IP/CFT de la Región Metropolitana).
+    """
+    rng = np.random.default_rng([semilla, 0])
+
+    tipos = rng.choice(list(TIPOS_INSTITUCION), size=n_instituciones, p=[0.35, 0.35, 0.30])
+    regiones = rng.choice(REGIONES, size=n_instituciones, p=[0.45] + [0.55 / (len(REGIONES) - 1)] * (len(REGIONES) - 1))
+    codigos = rng.choice(np.setdiff1d(np.arange(1, 1000), [COD_ECAS]), size=n_instituciones, replace=False)
+
+    filas = []
+    for cod, tipo, region in zip(codigos, tipos, regiones):
+        letra = {"Universidades": "U", "Institutos Profesionales": "I", "Centros de Formación Técnica": "C"}[tipo]
+        nombre = f"{TIPOS_INSTITUCION[tipo][2]} SINTETICO {cod:03d}"
+        posibles = [c for c, datos in CARRERAS.items() if letra in datos[5]]
+        n_carreras = min(len(posibles), int(rng.integers(4, 12)))
+        for carrera in rng.choice(posibles, size=n_carreras, replace=False):
+            jornadas = ["Diurna", "Vespertina"] if rng.random() < 0.5 else ["Diurna"]
+            for jornada in jornadas:
+                filas.append((int(cod), nombre, tipo, region, carrera, jornada))
+
+    for jornada in ("Diurna", "Vespertina"):
+        filas.append((COD_ECAS, NOMBRE_ECAS, "Institutos Profesionales", "Metropolitana", CARRERA_ECAS, jornada))
+
+    catalogo = pd.DataFrame(filas, columns=["cod_inst", "nomb_inst", "tipo_inst_1", "region_sede", "nomb_carrera", "jornada"])
+
+    datos = catalogo["nomb_carrera"].map(CARRERAS)
+    catalogo["area_conocimiento"] = datos.str[0]
+    catalogo["nivel_global"] = datos.str[1]
+    catalogo["nivel_carrera_1"] = datos.str[2]
+    catalogo["nivel_carrera_2"] = datos.str[3]
+    catalogo["dur_total_carr"] = datos.str[4] + (catalogo["jornada"] == "Vespertina").astype(int)
+    catalogo["tipo_inst_2"] = catalogo["tipo_inst_1"].map(lambda t: TIPOS_INSTITUCION[t][0])
+    catalogo["tipo_inst_3"] = catalogo["tipo_inst_1"].map(lambda t: TIPOS_INSTITUCION[t][1])
+    catalogo["requisito_ingreso"] = catalogo["nivel_global"].map(REQUISITO_POR_NIVEL)
+
+    es_ecas = catalogo["cod_inst"] == COD_ECAS
+    catalogo.loc[es_ecas, "dur_total_carr"] = catalogo.loc[es_ecas, "jornada"].map(DURACION_ECAS)
+
+    catalogo["cod_carrera"] = np.arange(1, len(catalogo) + 1) * 10 + 7
+    catalogo["codigo_unico"] = (
+        "I" + catalogo["cod_inst"].astype(str) + "S1C" + catalogo["cod_carrera"].astype(str)
+        + "J" + catalogo["jornada"].map({"Diurna": "1", "Vespertina": "2"}) + "V1"
+    )
+    catalogo["es_licenciatura"] = catalogo["nivel_carrera_2"] == "Profesional Con Licenciatura"
+
+    # Popularidad de cada oferta (la carrera de ECAS y su competencia pesan más en la RM)
+    peso = rng.lognormal(0, 1, size=len(catalogo))
+    peso[(catalogo["nomb_carrera"] == CARRERA_ECAS) & (catalogo["region_sede"] == "Metropolitana")] *= 4
+    catalogo["peso"] = peso
+
+    return catalogo
+
+#Simulación de trayectorias por bloques
+def _tramos(**columnas) -> dict:
+    """Un 'tramo' es un período continuo de matrícula de un estudiante en una oferta."""
+    n = len(columnas["mrun"])
+    return {k: np.broadcast_to(np.asarray(v), (n,)).copy() for k, v in columnas.items()}
+
+def _concatenar_tramos(tramos: list) -> dict:
+    tramos = [t for t in tramos if len(t["mrun"])]
+    return {k: np.concatenate([t[k] for t in tramos]) for k in tramos[0]}
+
+def _elegir_oferta(rng, catalogo: pd.DataFrame, mascara: np.ndarray, n: int) -> np.ndarray:
+    indices = np.flatnonzero(mascara)
+    pesos = catalogo["peso"].to_numpy()[indices]
+    return rng.choice(indices, size=n, p=pesos / pesos.sum())
+
+def _titulacion(rng, inicio, anios, completa, p_titula, anio_fin):
+    titula = completa & (rng.random(len(inicio)) < p_titula)
+    anio_tit = inicio + anios - 1 + rng.choice([0, 1], size=len(inicio), p=[0.6, 0.4])
+    titula &= anio_tit <= anio_fin
+    return titula, np.where(titula, anio_tit, -1)
+
+def _simular_ecas(rng, catalogo, mruns, anio_inicio, anio_fin) -> Tuple[dict, dict]:
+    n = len(mruns)
+    es_ecas = (catalogo["cod_inst"] == COD_ECAS).to_numpy()
+    pregrado_otra = (~es_ecas) & (catalogo["nivel_global"] == "Pregrado").to_numpy()
+    post = (catalogo["nivel_global"] != "Pregrado").to_numpy()
+
+    cohorte = rng.integers(anio_inicio, anio_fin + 1, size=n)
+    vespertina = rng.random(n) < P_VESPERTINA
+    oferta_ecas = np.where(
+        vespertina,
+        np.flatnonzero(es_ecas & (catalogo["jornada"] == "Vespertina").to_numpy())[0],
+        np.flatnonzero(es_ecas & (catalogo["jornada"] == "Diurna").to_numpy())[0]
+    )
+
+    edad = np.where(vespertina, 21 + rng.gamma(2, 3, n), 18 + rng.gamma(1.5, 1.5, n)).round().astype(int)
+    estudiante = {
+        "mrun": mruns,
+        "gen_alu": rng.choice([1, 2], size=n, p=[0.45, 0.55]),
+        "anio_nac": cohorte - edad,
+        "mes_nac": rng.integers(1, 13, size=n),
+    }
+
+    dur_anios = np.ceil(catalogo["dur_total_carr"].to_numpy()[oferta_ecas] / 2).astype(int)
+    disponible = anio_fin - cohorte + 1
+
+    titula = rng.random(n) < P_TITULA_ECAS
+    anios = np.where(
+        titula,
+        dur_anios + rng.choice([0, 0, 1, 1, 2], size=n),
+        np.clip(rng.geometric(0.45, size=n), 1, np.maximum(dur_anios - 1, 1))
+    )
+    cursando = anios >= disponible
+    anios = np.minimum(anios, disponible)
+    titula &= ~cursando
+    deserta = ~titula & ~cursando
+
+    titula, anio_tit = _titulacion(rng, cohorte, anios, titula, 1.0, anio_fin)
+    tramos = [_tramos(mrun=mruns, oferta=oferta_ecas, inicio=cohorte, anios=anios, cohorte=cohorte, titula=titula, anio_tit=anio_tit)]
+
+    # Retornos: desertores que vuelven a ECAS tras 1-3 años fuera
+    retorna = deserta & (rng.random(n) < P_RETORNO)
+    inicio_ret = cohorte + anios + rng.integers(1, 4, size=n)
+    retorna &= inicio_ret <= anio_fin
+    anios_ret = np.minimum(np.maximum(dur_anios - anios, 1) + rng.integers(0, 2, size=n), anio_fin - inicio_ret + 1)
+    completa_ret = anios_ret >= np.maximum(dur_anios - anios, 1)
+    tit_ret, anio_tit_ret = _titulacion(rng, inicio_ret, anios_ret, completa_ret, 0.6, anio_fin)
+    r = retorna
+    tramos.append(_tramos(
+        mrun=mruns[r], oferta=oferta_ecas[r], inicio=inicio_ret[r], anios=anios_ret[r],
+        cohorte=cohorte[r], titula=tit_ret[r], anio_tit=anio_tit_ret[r]
+    ))
+    titula_final = titula | (retorna & tit_ret)
+    anio_tit_final = np.where(titula, anio_tit, np.where(retorna & tit_ret, anio_tit_ret, -1))
+
+    # Traslados: desertores que se matriculan en otra institución
+    traslada = deserta & ~retorna & (rng.random(n) < P_TRASLADO)
+    inicio_dest = cohorte + anios + rng.choice([0, 1, 2], size=n, p=[0.6, 0.25, 0.15])
+    traslada &= inicio_dest <= anio_fin
+    k = int(traslada.sum())
+    if k:
+        oferta_dest = _elegir_oferta(rng, catalogo, pregrado_otra, k)
+        dur_dest = np.ceil(catalogo["dur_total_carr"].to_numpy()[oferta_dest] / 2).astype(int)
+        anios_dest = np.minimum(rng.integers(1, dur_dest + 2), anio_fin - inicio_dest[traslada] + 1)
+        tit_dest, anio_tit_dest = _titulacion(rng, inicio_dest[traslada], anios_dest, anios_dest >= dur_dest, P_TITULA_DESTINO, anio_fin)
+        tramos.append(_tramos(
+            mrun=mruns[traslada], oferta=oferta_dest, inicio=inicio_dest[traslada], anios=anios_dest,
+            cohorte=inicio_dest[traslada], titula=tit_dest, anio_tit=anio_tit_dest
+        ))
+
+    # Postgrado / postítulo o segundo pregrado tras titularse en ECAS
+    u = rng.random(n)
+    sigue = titula_final & (u < P_POSTGRADO + P_SEGUNDO_PREGRADO)
+    inicio_post = anio_tit_final + 1 + np.minimum(rng.geometric(0.35, size=n) - 1, 6)
+    sigue &= inicio_post <= anio_fin
+    k = int(sigue.sum())
+    if k:
+        es_post = u[sigue] < P_POSTGRADO
+        oferta_post = np.where(
+            es_post,
+            _elegir_oferta(rng, catalogo, post, k),
+            _elegir_oferta(rng, catalogo, pregrado_otra, k)
+        )
+        dur_post = np.ceil(catalogo["dur_total_carr"].to_numpy()[oferta_post] / 2).astype(int)
+        anios_post = np.minimum(dur_post + rng.integers(0, 2, size=k), anio_fin - inicio_post[sigue] + 1)
+        tit_post, anio_tit_post = _titulacion(rng, inicio_post[sigue], anios_post, anios_post >= dur_post, 0.7, anio_fin)
+        tramos.append(_tramos(
+            mrun=mruns[sigue], oferta=oferta_post, inicio=inicio_post[sigue], anios=anios_post,
+            cohorte=inicio_post[sigue], titula=tit_post, anio_tit=anio_tit_post
+        ))
+
+    # Trayectoria previa en otra institución (ingresan a ECAS desde otra institución)
+    previa = rng.random(n) < P_TRAYECTORIA_PREVIA
+    anios_prev = rng.integers(1, 4, size=n)
+    inicio_prev = cohorte - anios_prev
+    previa &= inicio_prev >= anio_inicio
+    k = int(previa.sum())
+    if k:
+        oferta_prev = _elegir_oferta(rng, catalogo, pregrado_otra, k)
+        tramos.append(_tramos(
+            mrun=mruns[previa], oferta=oferta_prev, inicio=inicio_prev[previa], anios=anios_prev[previa],
+            cohorte=inicio_prev[previa], titula=False, anio_tit=-1
+        ))
+
+    return estudiante, _concatenar_tramos(tramos)
+
+def _simular_nacional(rng, catalogo, mruns, anio_inicio, anio_fin) -> Tuple[dict, dict]:
+    n = len(mruns)
+    es_ecas = (catalogo["cod_inst"] == COD_ECAS).to_numpy()
+    pregrado = (~es_ecas) & (catalogo["nivel_global"] == "Pregrado").to_numpy()
+    post = (catalogo["nivel_global"] != "Pregrado").to_numpy()
+
+    cohorte = rng.integers(anio_inicio, anio_fin + 1, size=n)
+    edad = (18 + rng.gamma(1.5, 2, n)).round().astype(int)
+    estudiante = {
+        "mrun": mruns,
+        "gen_alu": rng.choice([1, 2], size=n, p=[0.47, 0.53]),
+        "anio_nac": cohorte - edad,
+        "mes_nac": rng.integers(1, 13, size=n),
+    }
+
+    oferta = _elegir_oferta(rng, catalogo, pregrado, n)
+    dur = np.ceil(catalogo["dur_total_carr"].to_numpy()[oferta] / 2).astype(int)
+    anios = np.minimum(np.where(rng.random(n) < P_TITULA_NACIONAL, dur + rng.integers(0, 2, size=n), rng.integers(1, dur + 1)), anio_fin - cohorte + 1)
+    titula, anio_tit = _titulacion(rng, cohorte, anios, anios >= dur, 1.0, anio_fin)
+    tramos = [_tramos(mrun=mruns, oferta=oferta, inicio=cohorte, anios=anios, cohorte=cohorte, titula=titula, anio_tit=anio_tit)]
+
+    sigue = titula & (rng.random(n) < P_POSTGRADO_NACIONAL)
+    inicio_post = anio_tit + 1 + np.minimum(rng.geometric(0.35, size=n) - 1, 6)
+    sigue &= inicio_post <= anio_fin
+    k = int(sigue.sum())
+    if k:
+        oferta_post = _elegir_oferta(rng, catalogo, post, k)
+        dur_post = np.ceil(catalogo["dur_total_carr"].to_numpy()[oferta_post] / 2).astype(int)
+        anios_post = np.minimum(dur_post, anio_fin - inicio_post[sigue] + 1)
+        tit_post, anio_tit_post = _titulacion(rng, inicio_post[sigue], anios_post, anios_post >= dur_post, 0.7, anio_fin)
+        tramos.append(_tramos(
+            mrun=mruns[sigue], oferta=oferta_post, inicio=inicio_post[sigue], anios=anios_post,
+            cohorte=inicio_post[sigue], titula=tit_post, anio_tit=anio_tit_post
+        ))
+
+    return estudiante, _concatenar_tramos(tramos)
+
+#Materialización de filas
+def _categoria(catalogo: pd.DataFrame, columna: str, oferta: np.ndarray) -> pd.Categorical:
+    codigos, categorias = pd.factorize(catalogo[columna])
+    return pd.Categorical.from_codes(codigos[oferta], categories=categorias)
+
+def _rango_edad(edad: np.ndarray) -> pd.Categorical:
+    return pd.Categorical.from_codes(np.digitize(edad, LIMITES_EDAD), categories=RANGOS_EDAD)
+
+def _filas_matricula(catalogo, estudiante, tramos, id_inicial: int) -> pd.DataFrame:
+    anios = tramos["anios"]
+    fila_tramo = np.repeat(np.arange(len(anios)), anios)
+    desfase = np.arange(len(fila_tramo)) - np.repeat(np.cumsum(anios) - anios, anios)
+
+    oferta = tramos["oferta"][fila_tramo]
+    cat_periodo = tramos["inicio"][fila_tramo] + desfase
+    mrun = tramos["mrun"][fila_tramo]
+
+    pos = np.searchsorted(estudiante["mrun"], mrun)
+    anio_nac = estudiante["anio_nac"][pos]
+
+    df = pd.DataFrame({
+        "cat_periodo": cat_periodo.astype(np.int32),
+        "mrun": mrun.astype(np.int64),
+        "gen_alu": estudiante["gen_alu"][pos].astype(np.int8),
+        "rango_edad": _rango_edad(cat_periodo - anio_nac),
+        "nomb_inst": _categoria(catalogo, "nomb_inst", oferta),
+        "area_conocimiento": _categoria(catalogo, "area_conocimiento", oferta),
+        "codigo_unico": _categoria(catalogo, "codigo_unico", oferta),
+        "dur_total_carr": catalogo["dur_total_carr"].to_numpy()[oferta].astype(np.int16),
+        "cod_inst": catalogo["cod_inst"].to_numpy()[oferta].astype(np.int32),
+        "jornada": _categoria(catalogo, "jornada", oferta),
+        "dur_estudio_carr": catalogo["dur_total_carr"].to_numpy()[oferta].astype(np.int16),
+        "dur_proceso_tit": np.where(catalogo["nivel_global"].to_numpy()[oferta] == "Pregrado", 1, 0).astype(np.int16),
+        "anio_ing_carr_ori": tramos["cohorte"][fila_tramo].astype(np.int32),
+        "anio_ing_carr_act": tramos["inicio"][fila_tramo].astype(np.int32),
+        "cod_carrera": catalogo["cod_carrera"].to_numpy()[oferta].astype(np.int64),
+        "nomb_carrera": _categoria(catalogo, "nomb_carrera", oferta),
+        "region_sede": _categoria(catalogo, "region_sede", oferta),
+        "tipo_inst_1": _categoria(catalogo, "tipo_inst_1", oferta),
+        "tipo_inst_2": _categoria(catalogo, "tipo_inst_2", oferta),
+        "tipo_inst_3": _categoria(catalogo, "tipo_inst_3", oferta),
+        "fec_nac_alu": (anio_nac * 100 + estudiante["mes_nac"][pos]).astype(np.int32),
+        "id": np.arange(id_inicial, id_inicial + len(fila_tramo), dtype=np.int64),
+        "nivel_global": _categoria(catalogo, "nivel_global", oferta),
+        "nivel_carrera_1": _categoria(catalogo, "nivel_carrera_1", oferta),
+        "nivel_carrera_2": _categoria(catalogo, "nivel_carrera_2", oferta),
+        "requisito_ingreso": _categoria(catalogo, "requisito_ingreso", oferta),
+    })
+
+    return df[COLUMNAS_MATRICULA].sort_values(["mrun", "cat_periodo"], kind="stable", ignore_index=True)
+
+def _filas_titulados(rng, catalogo, estudiante, tramos) -> pd.DataFrame:
+    sel = np.flatnonzero(tramos["titula"])
+    oferta = tramos["oferta"][sel]
+    mrun = tramos["mrun"][sel]
+    anio_tit = tramos["anio_tit"][sel]
+
+    pos = np.searchsorted(estudiante["mrun"], mrun)
+    cod_inst = catalogo["cod_inst"].to_numpy()[oferta]
+
+    # En los registros de ECAS el título a veces viene vacío (la vista limpia lo completa)
+    titulo = catalogo["nomb_carrera"].to_numpy()[oferta].astype(object)
+    titulo[(cod_inst == COD_ECAS) & (rng.random(len(sel)) < P_TITULO_SIN_NOMBRE_ECAS)] = None
+
+    grado = np.where(
+        catalogo["es_licenciatura"].to_numpy()[oferta],
+        "LICENCIADO EN " + catalogo["area_conocimiento"].to_numpy()[oferta].astype(str).astype(object),
+        None
+    )
+
+    mes = rng.integers(1, 13, size=len(sel))
+    dia = rng.integers(1, 29, size=len(sel))
+
+    df = pd.DataFrame({
+        "cat_periodo": anio_tit.astype(np.int32),
+        "mrun": mrun.astype(np.int64),
+        "gen_alu": estudiante["gen_alu"][pos].astype(np.int8),
+        "rango_edad": _rango_edad(anio_tit - estudiante["anio_nac"][pos]),
+        "anio_ing_carr_ori": tramos["cohorte"][sel].astype(np.int32),
+        "nombre_titulo_obtenido": titulo,
+        "nombre_grado_obtenido": grado,
+        "fecha_obtencion_titulo": (anio_tit * 10000 + mes * 100 + dia).astype(np.int64),
+        "tipo_inst_1": _categoria(catalogo, "tipo_inst_1", oferta),
+        "tipo_inst_2": _categoria(catalogo, "tipo_inst_2", oferta),
+        "tipo_inst_3": _categoria(catalogo, "tipo_inst_3", oferta),
+        "cod_inst": cod_inst.astype(np.int32),
+        "nomb_inst": _categoria(catalogo, "nomb_inst", oferta),
+        "nomb_carrera": _categoria(catalogo, "nomb_carrera", oferta),
+        "dur_total_carr": catalogo["dur_total_carr"].to_numpy()[oferta].astype(np.int16),
+        "jornada": _categoria(catalogo, "jornada", oferta),
+        "area_conocimiento": _categoria(catalogo, "area_conocimiento", oferta),
+        "tipo_plan_carr": "Plan Regular",
+        "nivel_global": _categoria(catalogo, "nivel_global", oferta),
+        "nivel_carrera_1": _categoria(catalogo, "nivel_carrera_1", oferta),
+        "nivel_carrera_2": _categoria(catalogo, "nivel_carrera_2", oferta),
+        "sem_ing_carr_ori": np.int8(1),
+        "anio_ing_carr_act": tramos["inicio"][sel].astype(np.int32),
+        "sem_ing_carr_act": np.int8(1),
+    })
+
+    return df[COLUMNAS_TITULADOS].sort_values(["mrun", "cat_periodo"], kind="stable", ignore_index=True)
+
+def limpiar_titulados(df_titulados: pd.DataFrame) -> pd.DataFrame:
+    """Equivalente en pandas de sql_vista_titulados_limpia (views.py)."""
+    df = df_titulados[df_titulados["fecha_obtencion_titulo"].notna()].copy()
+
+    titulo = df["nombre_titulo_obtenido"].astype(object)
+    titulo = titulo.where(
+        ~titulo.isin(["TECNICO DE NIVEL SUPERIOR EN CONTABILIDAD", "CONTADOR TECNICO DE NIVEL SUPERIOR"]),
+        "CONTADOR TECNICO DE NIVEL SUPERIOR"
+    )
+    titulo = titulo.where(~(titulo.isna() & (df["cod_inst"] == COD_ECAS)), "CONTADOR AUDITOR")
+
+    df["nombre_titulo_obtenido"] = titulo
+    return df.rename(columns={"nombre_titulo_obtenido": "nomb_titulo_obtenido"})
+
+#API
+def generar_bloques(
+    n_ecas: int = 5_000,
+    n_nacional: int = 20_000,
+    semilla: int = 2024,
+    anio_inicio: int = 2007,
+    anio_fin: int = 2025,
+    tam_bloque: int = 200_000,
+    catalogo: Optional[pd.DataFrame] = None
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Genera (matrícula, titulados) por bloques de estudiantes, para escalar a decenas
+    de millones de filas sin tenerlas todas en memoria. Cada bloque usa su propia
+    semilla derivada: el resultado es reproducible y no depende del tamaño de bloque
+    más que en el reparto de mruns.
+    """
+    if catalogo is None:
+        catalogo = construir_catalogo(semilla)
+
+    id_siguiente = 1
+    mrun_siguiente = MRUN_INICIAL
+    bloques = [("ecas", n_ecas), ("nacional", n_nacional)]
+
+    for i_tipo, (tipo, total) in enumerate(bloques):
+        for i_bloque, inicio in enumerate(range(0, total, tam_bloque)):
+            n = min(tam_bloque, total - inicio)
+            rng = np.random.default_rng([semilla, 1 + i_tipo, i_bloque])
+            mruns = np.arange(mrun_siguiente, mrun_siguiente + n, dtype=np.int64)
+            mrun_siguiente += n
+
+            simular = _simular_ecas if tipo == "ecas" else _simular_nacional
+            estudiante, tramos = simular(rng, catalogo, mruns, anio_inicio, anio_fin)
+
+            df_matricula = _filas_matricula(catalogo, estudiante, tramos, id_siguiente)
+            id_siguiente += len(df_matricula)
+
+            yield df_matricula, _filas_titulados(rng, catalogo, estudiante, tramos)
+
+def dim_carrera_desde_matricula(df_matricula: pd.DataFrame) -> pd.DataFrame:
+    """Tabla dim_carrera (ver sql_dim_carrera en views.py) calculada en memoria."""
+    df = df_matricula[df_matricula["nomb_carrera"].notna()]
+    df = df.assign(
+        codigo_unico=df["codigo_unico"].astype(object),
+        nomb_carrera=df["nomb_carrera"].astype(str),
+    )
+    dim = (
+        df.groupby(["codigo_unico", "nomb_carrera"], as_index=False, dropna=False)
+        .agg(
+            cod_carrera=("cod_carrera", "max"),
+            cod_inst=("cod_inst", "max"),
+        )
+    )
+    dim["es_auditoria"] = dim["nomb_carrera"].str.upper().str.contains("AUDITOR", regex=False).astype(int)
+    return dim
+
+def generar_datos_sinteticos(**parametros) -> dict:
+    """Vistas completas en memoria (para tamaños pequeños y medianos) y la dimensión de carreras."""
+    matriculas, titulados = zip(*generar_bloques(**parametros))
+
+    df_matricula = pd.concat(matriculas, ignore_index=True)
+    df_titulados = pd.concat(titulados, ignore_index=True)
+    return {
+        "vista_matricula_unificada": df_matricula,
+        "vista_titulados_unificada": df_titulados,
+        "vista_titulados_unificada_limpia": limpiar_titulados(df_titulados),
+        "dim_carrera": dim_carrera_desde_matricula(df_matricula),
+    }
+
+def escribir_datos_sinteticos(directorio: str | Path, formato: str = "parquet", **parametros) -> dict:
+    """
+    Escribe cada vista como una carpeta de partes (parquet o csv), un archivo por bloque.
+    Con formato "duckdb" o "sqlite", 'directorio' es el archivo de la base local y cada vista queda como tabla.
+    Devuelve la cantidad de filas escritas por vista.
+    """
+    directorio = Path(directorio)
+    filas = {"vista_matricula_unificada": 0, "vista_titulados_unificada": 0, "vista_titulados_unificada_limpia": 0}
+
+    engine = None
+    if formato in ("duckdb", "sqlite"):
+        engine = get_db_engine(formato, str(directorio))
+        if engine is None:
+            raise RuntimeError(f"No se pudo abrir la base local {directorio}")
+
+    for i, (df_matricula, df_titulados) in enumerate(generar_bloques(**parametros)):
+        partes = {
+            "vista_matricula_unificada": df_matricula,
+            "vista_titulados_unificada": df_titulados,
+            "vista_titulados_unificada_limpia": limpiar_titulados(df_titulados),
+        }
+        if engine is not None:
+            cargar_tablas_locales(partes, engine, if_exists="replace" if i == 0 else "append")
+            for vista, df in partes.items():
+                filas[vista] += len(df)
+            print(f"✔ Bloque {i}: {len(df_matricula):,} matrículas, {len(df_titulados):,} titulaciones")
+            continue
+
+        for vista, df in partes.items():
+            carpeta = directorio / vista
+            carpeta.mkdir(parents=True, exist_ok=True)
+            if formato == "parquet":
+                df.to_parquet(carpeta / f"parte_{i:05d}.parquet", index=False)
+            else:
+                df.to_csv(carpeta / f"parte_{i:05d}.csv", index=False)
+            filas[vista] += len(df)
+
+        print(f"✔ Bloque {i}: {len(df_matricula):,} matrículas, {len(df_titulados):,} titulaciones")
+
+    # La dimensión de carreras se arma sobre la matrícula completa, como en views.py
+    if engine is not None:
+        _, mensaje = create_dimension_table("dim_carrera", sql_dim_carrera, indices_dim_carrera, engine)
+        print(mensaje)
+
+    return filas
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Genera vistas sintéticas de matrícula y titulados.")
+    parser.add_argument("--ecas", type=int, default=5_000, help="Estudiantes con cohorte en ECAS")
+    parser.add_argument("--nacional", type=int, default=20_000, help="Estudiantes del resto del sistema")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--anio-inicio", type=int, default=2007)
+    parser.add_argument("--anio-fin", type=int, default=2025)
+    parser.add_argument("--tam-bloque", type=int, default=200_000, help="Estudiantes por bloque")
+    parser.add_argument("--formato", choices=["parquet", "csv", "duckdb", "sqlite"], default="parquet")
+    parser.add_argument("--salida", default="datos_sinteticos")
+    args = parser.parse_args()
+
+    filas = escribir_datos_sinteticos(
+        args.salida,
+        formato=args.formato,
+        n_ecas=args.ecas,
+        n_nacional=args.nacional,
+        semilla=args.semilla,
+        anio_inicio=args.anio_inicio,
+        anio_fin=args.anio_fin,
+        tam_bloque=args.tam_bloque,
+    )
+
+    for vista, n in filas.items():
+        print(f"✅ {vista}: {n:,} filas")
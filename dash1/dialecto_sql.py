@@ -0,0 +1,84 @@
+#Capa de dialecto: traduce las consultas escritas en T-SQL (SQL Server) a DuckDB o SQLite.
+#Solo cubre lo que usan queries.py, queries_l.py y metrics.py:
+#   - SELECT TOP (n) ...         -> ... LIMIT n (también dentro de CTEs)
+#   - tablas #Temp               -> tablas normales tmp_<nombre>
+#   - ISNULL(a, b)               -> COALESCE(a, b)
+#   - esquema dbo.               -> sin esquema
+#   - cod_inst LIKE 104          -> cod_inst = 104
+#   - LIKE '...'                 -> ILIKE en DuckDB (la collation de SQL Server no distingue mayúsculas)
+#   - CAST(x AS DECIMAL(p, s))   -> ROUND(x, s) en SQLite (ignora la precisión del DECIMAL)
+import re
+
+DIALECTOS_LOCALES = ("duckdb", "sqlite")
+
+_RE_TOP = re.compile(r"\bSELECT(\s+DISTINCT)?\s+TOP\s*\(?\s*(\d+)\s*\)?", re.IGNORECASE)
+_RE_TEMPORAL = re.compile(r"#(\w+)")
+_RE_ISNULL = re.compile(r"\bISNULL\s*\(", re.IGNORECASE)
+_RE_DBO = re.compile(r"\bdbo\.", re.IGNORECASE)
+_RE_LIKE_NUMERO = re.compile(r"\bLIKE\s+(\d+)\b", re.IGNORECASE)
+_RE_LIKE = re.compile(r"\bLIKE\b", re.IGNORECASE)
+_RE_CAST = re.compile(r"\bCAST\s*\(", re.IGNORECASE)
+_RE_AS_DECIMAL = re.compile(r"\s+AS\s+DECIMAL\s*\(\s*\d+\s*,\s*(\d+)\s*\)\s*$", re.IGNORECASE)
+
+def nombre_temporal(nombre: str, dialecto: str) -> str:
+    """Nombre físico de una tabla temporal '#Nombre' en el dialecto dado."""
+    nombre = nombre.lstrip("#")
+    return f"#{nombre}" if dialecto == "mssql" else f"tmp_{nombre}"
+
+def _fin_de_expresion(sql: str, inicio: int) -> int:
+    """Posición donde termina la expresión que comienza en 'inicio' (paréntesis de cierre, ';' o fin)."""
+    profundidad = 0
+    en_texto = False
+    for i in range(inicio, len(sql)):
+        c = sql[i]
+        if c == "'":
+            en_texto = not en_texto
+        elif en_texto:
+            continue
+        elif c == "(":
+            profundidad += 1
+        elif c == ")":
+            if profundidad == 0:
+                return i
+            profundidad -= 1
+        elif c == ";" and profundidad == 0:
+            return i
+    return len(sql)
+
+def _traducir_top(sql: str) -> str:
+    # Se reemplaza de a uno, porque cada LIMIT desplaza las posiciones siguientes
+    while (m := _RE_TOP.search(sql)):
+        distinct, n = m.group(1) or "", m.group(2)
+        sql = sql[:m.start()] + f"SELECT{distinct}" + sql[m.end():]
+        fin = _fin_de_expresion(sql, m.start() + len("SELECT") + len(distinct))
+        cuerpo = sql[:fin].rstrip()
+        sql = f"{cuerpo}\n    LIMIT {n}\n" + sql[fin:]
+    return sql
+
+def _traducir_decimal(sql: str) -> str:
+    # De atrás hacia adelante, así los CAST anidados no cambian las posiciones pendientes
+    for m in reversed(list(_RE_CAST.finditer(sql))):
+        fin = _fin_de_expresion(sql, m.end())
+        decimal = _RE_AS_DECIMAL.search(sql[m.end():fin])
+        if decimal:
+            expresion = sql[m.end():m.end() + decimal.start()]
+            sql = sql[:m.start()] + f"ROUND(CAST({expresion} AS REAL), {decimal.group(1)})" + sql[fin + 1:]
+    return sql
+
+def traducir_sql(sql: str, dialecto: str) -> str:
+    """Devuelve la consulta en el dialecto del motor (mssql la deja intacta)."""
+    if dialecto not in DIALECTOS_LOCALES:
+        return sql
+
+    sql = _traducir_top(sql)
+    sql = _RE_TEMPORAL.sub(lambda m: nombre_temporal(m.group(1), dialecto), sql)
+    sql = _RE_ISNULL.sub("COALESCE(", sql)
+    sql = _RE_DBO.sub("", sql)
+    sql = _RE_LIKE_NUMERO.sub(r"= \1", sql)
+
+    if dialecto == "duckdb":
+        sql = _RE_LIKE.sub("ILIKE", sql)
+    else:
+        sql = _traducir_decimal(sql)
+
+    return sql
@@ -0,0 +1,106 @@
+#Exporta los datasets de los dashboards a un snapshot mapeable en memoria (ver snapshots.py).
+#Uso: python exportar_snapshots.py [--sin-dashboard] [--version 20250101]
+import argparse
+
+from conn_db import get_db_engine, plazo_consultas, con_plazo, ConsultaExpirada
+from queries import (
+    get_extracto_ecas,
+    get_titulacion_ecas,
+    get_previas_ecas,
+    ingresos_desde_extracto,
+    tramos_desde_extracto,
+    titulados_desde_otra_inst,
+    get_permanencia_ranking_jornadas,
+    filtrar_jornada,
+    permanencia_desde_tramos,
+    continuidad_desde_tramos,
+    get_ingresos_competencia_ecas,
+)
+from metrics import (
+    get_tiempo_de_descanso,
+    get_total_fugados_por_cohorte,
+    get_estimation_titulacion_abandono,
+    get_tasa_desercion_por_cohorte,
+)
+from snapshots import FUENTES_EXCEL, CONSTRUCTORES, cargar_dataset, publicar_snapshot, es_desactualizado
+
+#Dataframes globales de dashboard.py (nombre -> función que recibe el engine)
+#extracto_ecas es la matrícula de ECAS que comparten los KPIs por cohorte (ver get_extracto_ecas)
+DATASETS_DASHBOARD = {
+    "extracto_ecas": lambda engine: get_extracto_ecas(engine),
+    "titulacion_ecas": lambda engine: get_titulacion_ecas(engine),
+    "previas_ecas": lambda engine: get_previas_ecas(engine),
+    "permanencia_jornadas": lambda engine: get_permanencia_ranking_jornadas(engine),
+    "tiempo_descanso": lambda engine: get_tiempo_de_descanso(anio_n=None),
+    "total_fugados": lambda engine: get_total_fugados_por_cohorte(anio_n=None),
+    "titulacion_estimada": lambda engine: get_estimation_titulacion_abandono(anio_n=None),
+    "ingresos_competencia": lambda engine: get_ingresos_competencia_ecas(engine),
+}
+
+#Datasets de dashboard.py que se calculan en memoria a partir de otros (nombre -> (datasets base, función))
+#Los KPIs por cohorte salen del extracto de ECAS sin volver a la BD, permanencia y continuidad de la
+#tabla de tramos (una fila por estudiante) y el ranking de cada jornada de una sola consulta.
+#Van en orden de dependencia.
+DERIVADOS_DASHBOARD = {
+    "ingresos": (("extracto_ecas",), ingresos_desde_extracto),
+    "tramos_matricula": (("extracto_ecas", "titulacion_ecas"), tramos_desde_extracto),
+    "titulados_desde_otra_inst": (("extracto_ecas", "previas_ecas", "titulacion_ecas"), titulados_desde_otra_inst),
+    "desercion": (("extracto_ecas",), lambda df: get_tasa_desercion_por_cohorte(df_extracto=df)),
+    "permanencia_diurna": (("permanencia_jornadas",), lambda df: filtrar_jornada(df, 'DIURNA')),
+    "permanencia_vespertina": (("permanencia_jornadas",), lambda df: filtrar_jornada(df, 'VESPERTINA')),
+    "permanencia": (("tramos_matricula",), permanencia_desde_tramos),
+    "continuidad": (("tramos_matricula",), continuidad_desde_tramos),
+}
+
+@con_plazo
+def cargar_dataset_dashboard(nombre: str, engine):
+    """
+    Dataset global del dashboard: snapshot si existe, si no se calcula contra la BD.
+    Si las consultas vencen se responde con el último resultado, marcado como desactualizado.
+    """
+    if nombre in DERIVADOS_DASHBOARD:
+        bases, funcion = DERIVADOS_DASHBOARD[nombre]
+
+        def construir():
+            datos_base = [cargar_dataset_dashboard(base, engine) for base in bases]
+            # Un derivado de un respaldo también es respaldo: se usa el último derivado obtenido
+            if any(es_desactualizado(df) for df in datos_base):
+                raise ConsultaExpirada(f"Los datos base de '{nombre}' están desactualizados.")
+            return funcion(*datos_base)
+
+        return cargar_dataset(f"dashboard_{nombre}", construir=construir)
+    return cargar_dataset(f"dashboard_{nombre}", construir=lambda: DATASETS_DASHBOARD[nombre](engine))
+
+def exportar_snapshots(incluir_dashboard: bool = True, version: str | None = None) -> str:
+
+    datasets = {}
+
+    # Fuentes excel y trayectorias CSR
+    for nombre in list(FUENTES_EXCEL) + list(CONSTRUCTORES):
+        datasets[nombre] = cargar_dataset(nombre)
+        print(f"✔ {nombre}")
+
+    if incluir_dashboard:
+        engine = get_db_engine()
+        # La exportación espera a la base lo que haga falta: un respaldo desactualizado no se publica
+        with plazo_consultas(None):
+            for nombre, funcion in DATASETS_DASHBOARD.items():
+                datasets[f"dashboard_{nombre}"] = funcion(engine)
+                print(f"✔ dashboard_{nombre}")
+
+        for nombre, (bases, funcion) in DERIVADOS_DASHBOARD.items():
+            datasets[f"dashboard_{nombre}"] = funcion(*[datasets[f"dashboard_{base}"] for base in bases])
+            print(f"✔ dashboard_{nombre} (desde {', '.join(bases)})")
+
+    return publicar_snapshot(datasets, version=version)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Exporta snapshots Arrow/NumPy de los dashboards.")
+    parser.add_argument("--sin-dashboard", action="store_true", help="No recalcula los datasets SQL de dashboard.py")
+    parser.add_argument("--version", default=None, help="Nombre de la versión (por defecto, fecha y hora)")
+    args = parser.parse_args()
+
+    version = exportar_snapshots(incluir_dashboard=not args.sin_dashboard, version=args.version)
+
+    print(f"✅ Snapshot publicado: versión {version}")
@@ -8,6 +8,7 @@ from typing import Optional
 import numpy as np
 
 COD_ECAS = 104
+TOP_N_PERMANENCIA = 5
 
 def create_admission_chart(df: pd.DataFrame) -> go.Figure:
     """
@@ -110,52 +111,51 @@ def create_permanence_chart(df: pd.DataFrame) -> go.Figure:
     
     return fig
 
+def rankear_top_n_ecas(df: pd.DataFrame, cod_ecas: int, top_n: int = TOP_N_PERMANENCIA) -> pd.DataFrame:
+    """
+    Top N instituciones por tasa de permanencia en cada año, más ECAS, con la etiqueta ya calculada.
+    Se calcula una vez por versión de datos: los callbacks solo filtran el año.
+    """
+    if df.empty:
+        # Mismas columnas que el ranking, aunque no haya datos (los callbacks filtran por 'anio')
+        columnas = ['anio', 'nomb_inst', 'cod_inst', 'jornada', 'tasa_permanencia_pct', 'ranking', 'anio_txt', 'Institucion']
+        return df.reindex(columns=list(dict.fromkeys([*df.columns, *columnas])))
+
+    # Ranking dentro de cada año (en empates gana el orden de la consulta, que ya viene por tasa desc)
+    ranking = df.groupby('anio')['tasa_permanencia_pct'].rank(method='first', ascending=False)
+
+    # Se conservan todas las filas de una institución que entra al Top N (puede tener más de un nombre)
+    en_top = (ranking <= top_n).groupby([df['anio'], df['cod_inst']]).transform('any')
+    es_ecas = df['cod_inst'] == cod_ecas
+
+    df_ranking = df[en_top | es_ecas].sort_values('anio', kind='stable')
+    return df_ranking.assign(
+        ranking=ranking,
+        anio_txt=df_ranking['anio'].astype(str),
+        Institucion=np.where(df_ranking['cod_inst'] == cod_ecas, "ECAS", df_ranking['nomb_inst']),
+    )
+
 def create_permanence_chart_jornada(df: pd.DataFrame, jornada: str, cod_ecas: int) -> go.Figure:
-    """Crea el gráfico de barras comparativas para una jornada específica."""
+    """Crea el gráfico de barras comparativas para una jornada específica (acepta el ranking ya calculado)."""
     
     if df.empty:
         return go.Figure().update_layout(title=f"Tasa de Permanencia Primer Año: {jornada}", annotations=[dict(text="No hay datos disponibles.", showarrow=False)])
     
-    # 1. Aplicar el Top 5 + ECAS por año (Lógica de Python)
-    df_filtered_list = []
-    for year in df['anio'].unique():
-        df_year = df[df['anio'] == year].copy()
-        
-        # Filtrar solo el Top 5
-        df_top5 = df_year.sort_values(by='tasa_permanencia_pct', ascending=False).head(5)
-        
-        ids_to_keep = df_top5['cod_inst'].tolist()
-        if cod_ecas in df_year['cod_inst'].values:
-            ids_to_keep.append(cod_ecas)
-        
-        ids_to_keep = list(set(ids_to_keep))
-        df_year_filtered = df_year[df_year['cod_inst'].isin(ids_to_keep)]
-        
-        df_filtered_list.append(df_year_filtered)
-
-    df_final_ranking = pd.concat(df_filtered_list, ignore_index=True)
-
-    df_final_ranking['anio'] = df_final_ranking['anio'].astype(str)
-    
-    # Ordenar el DataFrame final por año ascendente (2007, 2008, 2009...)
-    df_final_ranking.sort_values(by='anio', ascending=True, inplace=True)
+    # 1. Top 5 + ECAS por año
+    df_final_ranking = df if 'Institucion' in df.columns else rankear_top_n_ecas(df, cod_ecas)
     
     # 2. Preparar el gráfico
-    df_final_ranking['Institucion'] = df_final_ranking.apply(
-        lambda row: "ECAS" if row['cod_inst'] == cod_ecas else row['nomb_inst'], axis=1
-    )
-    
     color_map = {'ECAS': '#d62728'} 
 
     fig = px.bar(
         df_final_ranking,
-        x='anio',
+        x='anio_txt',
         y='tasa_permanencia_pct',
         color='Institucion',      
         barmode='group',          
         title=f'Tasa de Permanencia de Primer Año: {jornada} (Top 5 + ECAS)',
         labels={
-            'anio': 'Año de Ingreso (Cohorte)',
+            'anio_txt': 'Año de Ingreso (Cohorte)',
             'tasa_permanencia_pct': 'Permanencia (%)',
             'Institucion': 'Institución',
             'total_estudiantes': 'Ingresados en la cohorte',
@@ -869,10 +869,10 @@ def create_tasa_desercion_chart(df: pd.DataFrame, anio_n: Optional[int] = None)
 
     return fig
 
-def create_ingresos_competencia_chart(df: pd.DataFrame) -> go.Figure:
+def create_ingresos_competencia_chart(df: pd.DataFrame, cod_inst_seleccionados: Optional[list] = None) -> go.Figure:
     """
     Gráfico de líneas de ingresos por cohorte.
-    Por defecto muestra SOLO ECAS.
+    Por defecto muestra SOLO ECAS más las instituciones seleccionadas (cod_inst).
     Las demás instituciones se activan desde la leyenda.
     """
 
@@ -899,12 +899,17 @@ def create_ingresos_competencia_chart(df: pd.DataFrame) -> go.Figure:
         template="plotly_white"
     )
 
-    # 🔑 Mostrar SOLO ECAS por defecto
+    # 🔑 Mostrar SOLO ECAS (y las instituciones seleccionadas) por defecto
+    if cod_inst_seleccionados is not None and not isinstance(cod_inst_seleccionados, list):
+        cod_inst_seleccionados = [cod_inst_seleccionados]
+    nombres_ecas = set(df.loc[df["cod_inst"] == COD_ECAS, "nomb_inst"])
+    visibles = set(df.loc[df["cod_inst"].isin([COD_ECAS, *(cod_inst_seleccionados or [])]), "nomb_inst"])
+
     fig.for_each_trace(
         lambda t: t.update(
-            visible=True if t.name == "ECAS" else "legendonly",
-            line=dict(width=4 if t.name == "ECAS" else 2),
-            opacity=1.0 if t.name == "ECAS" else 0.75
+            visible=True if t.name in visibles else "legendonly",
+            line=dict(width=4 if t.name in nombres_ecas else 2),
+            opacity=1.0 if t.name in nombres_ecas else 0.75
         )
     )
 
@@ -0,0 +1,254 @@
+#Instrumentación de callbacks de Dash: tiempo de pared, CPU, filas procesadas y tamaño de la respuesta
+#por invocación, agrupados por id de salida y entradas normalizadas. Se exponen como histogramas y
+#contadores en formato Prometheus en la ruta /metrics del server de Flask.
+#Las métricas son por proceso: con varios workers de gunicorn cada uno reporta las suyas (etiqueta pid).
+#Uso (después de registrar todos los callbacks): instrumentar_app(app)
+#Con ECAS_TRACEMALLOC=1 se registra además el pico de memoria asignada por cada callback (tracemalloc,
+#aproximado si hay callbacks concurrentes en el mismo proceso, porque el pico es global).
+#Los background callbacks no se instrumentan aquí: en el server solo corre el lanzador/sondeo del trabajo
+#y el cálculo ocurre en otro proceso, que se mide a sí mismo (ver dash2/callbacks_fondo.py).
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+#Límites superiores (segundos) de los buckets del histograma de latencia
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+LARGO_MAX_ENTRADAS = 120
+PROPIEDADES_CONTADOR = {"n_clicks", "n_clicks_timestamp", "n_submit", "n_submit_timestamp", "n_intervals"}
+MEDIR_MEMORIA = os.environ.get("ECAS_TRACEMALLOC", "0") == "1"
+
+@dataclass
+class EstadisticaCallback:
+    llamadas: int = 0
+    errores: int = 0
+    prevenidos: int = 0
+    segundos: float = 0.0
+    segundos_cpu: float = 0.0
+    filas: int = 0
+    bytes_respuesta: int = 0
+    memoria_pico_total: int = 0
+    memoria_pico_max: int = 0
+    buckets: list = field(default_factory=lambda: [0] * len(BUCKETS_LATENCIA))
+
+_estadisticas = {}  # (callback, entradas) -> EstadisticaCallback
+_lock = threading.Lock()
+
+# Filas leídas durante el callback en curso (las suman cargar_dataset y leer_sql)
+_filas_callback = contextvars.ContextVar("filas_callback", default=None)
+
+#Proveedores extra de líneas para /metrics (ej: memoria por dataset)
+_proveedores = []
+#Funciones que traen mediciones de otros procesos antes de exportar (ej: trabajos en segundo plano)
+_recolectores = []
+
+def contar_filas(n: int) -> None:
+    """Suma filas procesadas al callback en curso (no hace nada fuera de un callback)."""
+    acumulado = _filas_callback.get()
+    if acumulado is not None:
+        acumulado[0] += int(n)
+
+def normalizar_entradas(contexto) -> str:
+    """
+    Entradas y estados del callback como texto estable y acotado (clave de agrupación).
+    Se descartan los contadores de clicks/intervalos, que cambian en cada invocación.
+    """
+    valores = {
+        **(getattr(contexto, "input_values", None) or {}),
+        **(getattr(contexto, "state_values", None) or {}),
+    }
+    valores = {k: v for k, v in valores.items() if k.rsplit(".", 1)[-1] not in PROPIEDADES_CONTADOR}
+    texto = json.dumps(valores, sort_keys=True, default=str, ensure_ascii=False, separators=(",", ":"))
+    return texto if len(texto) <= LARGO_MAX_ENTRADAS else texto[:LARGO_MAX_ENTRADAS - 3] + "..."
+
+def _contexto_dash():
+    """Entradas del callback en curso cuando Dash no las pasa como argumento (trabajos en segundo plano)."""
+    from dash import ctx
+    try:
+        return SimpleNamespace(input_values=ctx.inputs, state_values=ctx.states)
+    except Exception:
+        return None
+
+def _tamano_respuesta(respuesta) -> int:
+    """Bytes del JSON de respuesta (un trabajo en segundo plano devuelve los objetos, no el JSON)."""
+    if respuesta is None:
+        return 0
+    if isinstance(respuesta, (str, bytes)):
+        return len(respuesta)
+    from plotly.io.json import to_json_plotly
+    return len(to_json_plotly(respuesta))
+
+def _registrar(callback_id: str, entradas: str, segundos: float, cpu: float, filas: int, bytes_respuesta: int, resultado: str, memoria_pico: int = 0) -> None:
+    with _lock:
+        est = _estadisticas.setdefault((callback_id, entradas), EstadisticaCallback())
+        est.llamadas += 1
+        est.errores += resultado == "error"
+        est.prevenidos += resultado == "prevenido"
+        est.segundos += segundos
+        est.segundos_cpu += cpu
+        est.filas += filas
+        est.bytes_respuesta += bytes_respuesta
+        est.memoria_pico_total += memoria_pico
+        est.memoria_pico_max = max(est.memoria_pico_max, memoria_pico)
+        for i, limite in enumerate(BUCKETS_LATENCIA):
+            if segundos <= limite:
+                est.buckets[i] += 1
+                break
+
+def medir_callback(callback_id: str, funcion, registrar=None):
+    """
+    Envuelve la función registrada por Dash (la que devuelve el JSON de respuesta) o, en un background
+    callback, la función del usuario. 'registrar' recibe la medición (por defecto, las métricas del proceso).
+    """
+    registrar = registrar or _registrar
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        entradas = normalizar_entradas(kwargs.get("callback_context") or _contexto_dash())
+
+        token = _filas_callback.set([0])
+        memoria_inicio = None
+        if tracemalloc.is_tracing():
+            memoria_inicio = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+        resultado, respuesta = "ok", None
+        try:
+            respuesta = funcion(*args, **kwargs)
+            return respuesta
+        except Exception as e:
+            resultado = "prevenido" if type(e).__name__ == "PreventUpdate" else "error"
+            raise
+        finally:
+            filas = _filas_callback.get()[0]
+            _filas_callback.reset(token)
+            memoria_pico = 0
+            if memoria_inicio is not None and tracemalloc.is_tracing():
+                memoria_pico = max(tracemalloc.get_traced_memory()[1] - memoria_inicio, 0)
+            registrar(
+                callback_id,
+                entradas,
+                time.perf_counter() - inicio,
+                time.thread_time() - inicio_cpu,
+                filas,
+                _tamano_respuesta(respuesta),
+                resultado,
+                memoria_pico,
+            )
+
+    envoltura._instrumentado = True
+    return envoltura
+
+def instrumentar_callbacks(app) -> int:
+    """
+    Instrumenta los callbacks registrados con app.callback y con dash.callback (páginas).
+    Debe llamarse después de registrarlos. Devuelve la cantidad de callbacks instrumentados.
+    Se omiten los background callbacks (se miden en el proceso del trabajo).
+    """
+    from dash import _callback
+
+    n = 0
+    for mapa in (app.callback_map, _callback.GLOBAL_CALLBACK_MAP):
+        for callback_id, cb in mapa.items():
+            funcion = cb.get("callback")
+            if funcion is None or getattr(funcion, "_instrumentado", False) or inspect.iscoroutinefunction(funcion):
+                continue
+            if cb.get("background"):
+                continue
+            cb["callback"] = medir_callback(callback_id, funcion)
+            n += 1
+    return n
+
+def registrar_proveedor_metricas(proveedor) -> None:
+    """Agrega una función sin argumentos que devuelve líneas extra (formato Prometheus) para /metrics."""
+    _proveedores.append(proveedor)
+
+def registrar_recolector(recolector) -> None:
+    """Agrega una función sin argumentos que se llama antes de exportar /metrics (ej: traer mediciones de otros procesos)."""
+    _recolectores.append(recolector)
+
+def _etiquetas(**valores) -> str:
+    partes = []
+    for clave, valor in valores.items():
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+def exportar_metricas() -> str:
+    """Métricas del proceso en formato de texto de Prometheus."""
+    for recolector in _recolectores:
+        recolector()
+
+    with _lock:
+        estadisticas = {clave: EstadisticaCallback(**{**vars(est), "buckets": list(est.buckets)}) for clave, est in _estadisticas.items()}
+
+    pid = os.getpid()
+    lineas = []
+
+    # Histograma de latencia por callback (todas las entradas juntas, para acotar las series)
+    por_callback = {}
+    for (callback_id, _), est in estadisticas.items():
+        total = por_callback.setdefault(callback_id, EstadisticaCallback())
+        total.llamadas += est.llamadas
+        total.segundos += est.segundos
+        total.buckets = [a + b for a, b in zip(total.buckets, est.buckets)]
+
+    lineas.append("# HELP ecas_callback_latencia_segundos Tiempo de pared por invocación de callback")
+    lineas.append("# TYPE ecas_callback_latencia_segundos histogram")
+    for callback_id, est in sorted(por_callback.items()):
+        acumulado = 0
+        for limite, cantidad in zip(BUCKETS_LATENCIA, est.buckets):
+            acumulado += cantidad
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            lineas.append(f"ecas_callback_latencia_segundos_bucket{_etiquetas(callback=callback_id, pid=pid, le=le)} {acumulado}")
+        lineas.append(f"ecas_callback_latencia_segundos_sum{_etiquetas(callback=callback_id, pid=pid)} {est.segundos:.6f}")
+        lineas.append(f"ecas_callback_latencia_segundos_count{_etiquetas(callback=callback_id, pid=pid)} {est.llamadas}")
+
+    # Contadores por callback y entradas normalizadas
+    contadores = (
+        ("ecas_callback_llamadas_total", "Invocaciones", "llamadas"),
+        ("ecas_callback_errores_total", "Invocaciones con excepción", "errores"),
+        ("ecas_callback_prevenidos_total", "Invocaciones con PreventUpdate", "prevenidos"),
+        ("ecas_callback_segundos_total", "Tiempo de pared acumulado", "segundos"),
+        ("ecas_callback_cpu_segundos_total", "Tiempo de CPU del hilo acumulado", "segundos_cpu"),
+        ("ecas_callback_filas_total", "Filas leídas de datasets y consultas SQL", "filas"),
+        ("ecas_callback_bytes_respuesta_total", "Bytes del JSON de respuesta", "bytes_respuesta"),
+    )
+    if MEDIR_MEMORIA:
+        contadores += (
+            ("ecas_callback_memoria_pico_bytes_total", "Suma de los picos de memoria (tracemalloc) sobre el inicio", "memoria_pico_total"),
+            ("ecas_callback_memoria_pico_max_bytes", "Mayor pico de memoria (tracemalloc) de una invocación", "memoria_pico_max"),
+        )
+    for nombre, ayuda, atributo in contadores:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {'gauge' if nombre.endswith('_max_bytes') else 'counter'}")
+        for (callback_id, entradas), est in sorted(estadisticas.items()):
+            valor = getattr(est, atributo)
+            valor = f"{valor:.6f}" if isinstance(valor, float) else valor
+            lineas.append(f"{nombre}{_etiquetas(callback=callback_id, entradas=entradas, pid=pid)} {valor}")
+
+    for proveedor in _proveedores:
+        lineas.extend(proveedor())
+
+    return "\n".join(lineas) + "\n"
+
+def registrar_endpoint_metricas(server, ruta: str = "/metrics") -> None:
+    from flask import Response
+
+    @server.route(ruta)
+    def _metricas():
+        return Response(exportar_metricas(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def instrumentar_app(app, ruta: str = "/metrics") -> int:
+    """Instrumenta los callbacks de la app y expone /metrics en su server."""
+    n = instrumentar_callbacks(app)
+    if MEDIR_MEMORIA and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    registrar_endpoint_metricas(app.server, ruta)
+    return n
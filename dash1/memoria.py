@@ -0,0 +1,138 @@
+#Contabilidad de memoria: tamaño (memory_usage(deep=True)) de cada dataset del cache de snapshots (por
+#versión) y el RSS del proceso. Los layouts y callbacks leen los datos por versión (cargar_dataset), así
+#que el cache es donde está la memoria: no quedan DataFrames globales en los módulos de las apps.
+#Se imprime al iniciar y se expone en /metrics (ver instrumentacion.py).
+#Ojo: los datasets del cache pueden venir de un snapshot mmap (páginas compartidas entre workers), así
+#que su tamaño deep no es memoria privada de cada proceso; el RSS es la medida real del proceso.
+#Reporte por consola:
+#   python dash1/memoria.py dash1|dash2 [--top 30] [--url http://localhost:8050/metrics]
+import argparse
+import os
+import re
+import sys
+import threading
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import registrar_proveedor_metricas, _etiquetas
+from trayectoria_csr import TrayectoriaCSR
+import snapshots
+
+REPORTE_INICIO = os.environ.get("ECAS_REPORTE_MEMORIA", "1") == "1"
+TOP_REPORTE = 10
+
+_bytes_snapshots = {}  # (versión, nombre) -> bytes (los snapshots no cambian una vez cargados)
+_lock = threading.Lock()
+
+def bytes_objeto(objeto) -> int:
+    """Memoria ocupada por un dataset (incluye el texto de las columnas object)."""
+    if isinstance(objeto, pd.DataFrame):
+        return int(objeto.memory_usage(index=True, deep=True).sum())
+    if isinstance(objeto, (pd.Series, pd.Index)):
+        return int(objeto.memory_usage(deep=True))
+    if isinstance(objeto, np.ndarray):
+        return int(objeto.nbytes)
+    if isinstance(objeto, TrayectoriaCSR):
+        arreglos = (objeto.offsets, objeto.estudiante, objeto.anio, objeto.nivel, objeto.institucion, objeto.area, objeto.carrera, objeto.tipo_inst)
+        return sum(int(a.nbytes) for a in arreglos) + sum(int(e.nbytes) for e in objeto.etiquetas.values()) + bytes_objeto(objeto.meta)
+    return sys.getsizeof(objeto)
+
+def memoria_snapshots() -> dict:
+    """Bytes de cada dataset en el cache de snapshots del proceso: (versión, nombre) -> bytes."""
+    cargados = dict(snapshots._datasets_cargados)
+    with _lock:
+        for clave, objeto in cargados.items():
+            if clave not in _bytes_snapshots:
+                _bytes_snapshots[clave] = bytes_objeto(objeto)
+        for clave in [c for c in _bytes_snapshots if c not in cargados]:
+            del _bytes_snapshots[clave]
+        return dict(_bytes_snapshots)
+
+def rss_proceso() -> int:
+    """Memoria residente actual del proceso (en Linux desde /proc; si no, el máximo histórico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if sys.platform == "darwin" else maximo * 1024
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 ** 2:,.2f} MB"
+
+def lineas_metricas() -> list:
+    """Gauges de memoria para /metrics."""
+    pid = os.getpid()
+    lineas = [
+        "# HELP ecas_proceso_rss_bytes Memoria residente del proceso",
+        "# TYPE ecas_proceso_rss_bytes gauge",
+        f"ecas_proceso_rss_bytes{_etiquetas(pid=pid)} {rss_proceso()}",
+        "# HELP ecas_snapshot_bytes Memoria (deep) de los datasets en el cache de snapshots",
+        "# TYPE ecas_snapshot_bytes gauge",
+    ]
+    for (version, nombre), b in sorted(memoria_snapshots().items(), key=lambda x: (str(x[0][0]), x[0][1])):
+        lineas.append(f"ecas_snapshot_bytes{_etiquetas(version=version, dataset=nombre, pid=pid)} {b}")
+    return lineas
+
+registrar_proveedor_metricas(lineas_metricas)
+
+def reportar_inicio(ambito: str) -> None:
+    """Imprime (si ECAS_REPORTE_MEMORIA=1) los datasets más grandes del cache de snapshots al iniciar una app."""
+    if not REPORTE_INICIO:
+        return
+    en_cache = memoria_snapshots()
+    print(f"✔ Memoria del cache de snapshots en '{ambito}': {_mb(sum(en_cache.values()))} ({len(en_cache)} datasets), RSS {_mb(rss_proceso())}")
+    for (version, nombre), b in sorted(en_cache.items(), key=lambda x: -x[1])[:TOP_REPORTE]:
+        print(f"    {nombre:<40} {str(version):<20} {_mb(b):>12}")
+
+def imprimir_reporte(top: int = 30) -> None:
+    print(f"RSS del proceso: {_mb(rss_proceso())}")
+
+    en_cache = memoria_snapshots()
+    print(f"\nCache de snapshots (total {_mb(sum(en_cache.values()))}):")
+    for (version, nombre), b in sorted(en_cache.items(), key=lambda x: -x[1])[:top]:
+        print(f"    {nombre:<40} {str(version):<20} {_mb(b):>12}")
+
+def imprimir_memoria_callbacks(url: str, top: int = 30) -> None:
+    """Picos de memoria por callback leídos del /metrics de una app corriendo (requiere ECAS_TRACEMALLOC=1)."""
+    texto = urllib.request.urlopen(url, timeout=10).read().decode("utf-8")
+    patron = re.compile(r'^ecas_callback_memoria_pico_max_bytes\{callback="(.*?)",entradas="(.*?)",pid="(\d+)"\} (\d+)$')
+
+    picos = [m.groups() for m in map(patron.match, texto.splitlines()) if m]
+    if not picos:
+        print("\nSin picos de memoria por callback (¿la app corre con ECAS_TRACEMALLOC=1?)")
+        return
+
+    print(f"\nPico de memoria por callback ({url}):")
+    for callback_id, entradas, pid, b in sorted(picos, key=lambda x: -int(x[3]))[:top]:
+        print(f"    {_mb(int(b)):>12}  pid {pid:<7} {callback_id}  {entradas}")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Reporte de memoria por dataset y por callback.")
+    parser.add_argument("app", choices=["dash1", "dash2"], help="App cuyos layouts se arman para medir los datasets que cargan")
+    parser.add_argument("--top", type=int, default=30)
+    parser.add_argument("--url", default=None, help="URL de /metrics de una app corriendo, para los picos por callback")
+    args = parser.parse_args()
+
+    # Las apps importan 'memoria' (no __main__): el reporte de inicio se apaga en ese módulo
+    import memoria
+    memoria.REPORTE_INICIO = False
+
+    # Se arman los layouts para que carguen en el cache los datasets que usan
+    if args.app == "dash1":
+        import dashboard
+        dashboard.layout()
+    else:
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "dash2"))
+        import index
+        index.desertores.layout()
+        index.titulados_ecas.layout()
+
+    memoria.imprimir_reporte(args.top)
+    if args.url:
+        memoria.imprimir_memoria_callbacks(args.url, args.top)
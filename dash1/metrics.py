@@ -2,12 +2,18 @@ from typing import Optional
 import pandas as pd
 import ast
 import numpy as np
-from conn_db import get_db_engine
+from conn_db import get_db_engine, leer_sql, escribir_temporal, borrar_temporal, con_plazo, ConsultaExpirada
+from snapshots import cargar_dataset, cache_por_version
+from trayectoria_csr import CAMPOS_EVENTO, mascara_estudiantes_a_eventos, evento_n, codigos_evento, conteo_por_codigo
+from queries import cargar_extracto_ecas, COHORTE_MIN, COHORTE_MAX
+from conjuntos_mrun import conjunto_mrun, pertenece
 
 db_conn = get_db_engine()
 
-FILE_DESTINO = "fuga_a_destino_todas_cohortes.xlsx"
-FILE_ABANDONO = "abandono_total_todas_cohortes.xlsx"
+#Datasets compartidos (snapshot mapeado en memoria o excel de origen, ver snapshots.py)
+DATASET_DESTINO = "fuga_a_destino"
+DATASET_ABANDONO = "abandono_total"
+DATASET_CSR_DESTINO = "csr_desertores"
 
 def split_pipe_column(x):
     if isinstance(x, str):
@@ -15,6 +21,7 @@ def split_pipe_column(x):
     return []
 
 #Funcion normalizada para calcular KPI de fuga a inst, carr, area, etc. Según columnas de archivo. 
+@cache_por_version
 def get_top_fuga_por_orden(
     columna: str,
     orden: int = 1,
@@ -28,61 +35,31 @@ def get_top_fuga_por_orden(
     orden = 1 → primer destino
     orden = 2 → segundo destino
     orden = 3 → tercer destino
+
+    Se calcula sobre el CSR de desertores (códigos enteros de las dimensiones compartidas);
+    los nombres se resuelven solo para el Top N.
     """
 
-    # 1. Cargar datos base
-    df = pd.read_excel(FILE_DESTINO)
+    # 1. Trayectorias de los desertores con destino
+    csr = cargar_dataset(DATASET_CSR_DESTINO)
+    campo = CAMPOS_EVENTO[columna]
 
     # 2. Filtro por cohorte
+    seleccion = np.ones(csr.n_estudiantes, dtype=bool)
     if anio_n is not None:
-        df["año_cohorte_ecas"] = pd.to_numeric(df["año_cohorte_ecas"], errors="coerce")
-        df = df[df["año_cohorte_ecas"] == anio_n]
-
-    # 3. Columnas a normalizar
-    columnas_pipe = [
-        "institucion_destino",
-        "carrera_destino",
-        "area_conocimiento_destino",
-        "anio_ingreso_destino"
-    ]
-
-    for col in columnas_pipe:
-        df[col] = df[col].apply(split_pipe_column)
-
-    # 4. Explode sincronizado
-    df = df.explode(columnas_pipe)
-
-    df["anio_ingreso_destino"] = pd.to_numeric(
-        df["anio_ingreso_destino"], errors="coerce"
-    )
-
-    df = df.dropna(subset=["anio_ingreso_destino"])
-    df = df[df[columna] != ""]
+        seleccion = (csr.meta["cohorte"] == anio_n).to_numpy()
 
-    # 5. Orden cronológico real
-    df = df.sort_values(["mrun", "anio_ingreso_destino"])
+    # 3. Destino N por estudiante (eventos con año válido, en orden cronológico)
+    mascara = (csr.anio >= 0) & mascara_estudiantes_a_eventos(csr, seleccion)
+    idx = evento_n(csr, orden - 1, mascara)
 
-    # 6. Obtener destino N por estudiante
-    df_orden = (
-        df
-        .groupby("mrun")
-        .nth(orden - 1)  # orden humano → índice Python
-        .reset_index()
-    )
+    # 4. Conteo por código (una fila por estudiante)
+    df_conteo = conteo_por_codigo(codigos_evento(csr, campo, idx), None if campo == "anio" else csr.etiquetas[campo], top_n)
 
-    if df_orden.empty:
+    if df_conteo.empty:
         return pd.DataFrame()
 
-    # 7. Conteo
-    df_conteo = (
-        df_orden
-        .groupby(columna)["mrun"]
-        .nunique()
-        .reset_index(name="estudiantes_recibidos")
-        .sort_values("estudiantes_recibidos", ascending=False)
-        .head(top_n)
-        .reset_index(drop=True)
-    )
+    df_conteo = df_conteo.rename(columns={"valor": columna, "cantidad": "estudiantes_recibidos"})[[columna, "estudiantes_recibidos"]]
 
     df_conteo.index += 1
     df_conteo.index.name = "Ranking"
@@ -90,9 +67,10 @@ def get_top_fuga_por_orden(
     return df_conteo
 
 #KPI para calcular una estimación de la titulación de los estudiantes que abandonaron.
+@con_plazo
 def get_estimation_titulacion_abandono(anio_n: Optional[int] = None):
 
-    df_destino_meta = pd.read_excel(FILE_DESTINO)
+    df_destino_meta = cargar_dataset(DATASET_DESTINO)
 
     df_destino_meta['año_cohorte_ecas'] = pd.to_numeric(df_destino_meta['año_cohorte_ecas'], errors='coerce').fillna(-1)
     df_destino_meta['mrun_str'] = df_destino_meta['mrun'].dropna().astype(str)
@@ -114,9 +92,10 @@ def get_estimation_titulacion_abandono(anio_n: Optional[int] = None):
         return pd.DataFrame()
         
     df_mruns_y_fuga.rename(columns={'mrun_str': 'mrun_fuga', 'año_primer_fuga': 'anio_fuga'}, inplace=True)
-    df_mruns_y_fuga['mrun_fuga'] = df_mruns_y_fuga['mrun_fuga'].astype(str)
+    # mrun como entero: la vista lo expone como BIGINT y las bases locales no comparan texto con enteros
+    df_mruns_y_fuga['mrun_fuga'] = pd.to_numeric(df_mruns_y_fuga['mrun_fuga']).astype('int64')
     
-    df_mruns_y_fuga.to_sql('#TempFugas', db_conn, if_exists='replace', index=False, chunksize=500)
+    escribir_temporal(df_mruns_y_fuga, '#TempFugas', db_conn, chunksize=500)
     
     sql_titulados_reales = f"""
     SELECT DISTINCT
@@ -133,19 +112,18 @@ def get_estimation_titulacion_abandono(anio_n: Optional[int] = None):
     """
 
     try:
-        df_titulados_reales = pd.read_sql(sql_titulados_reales, db_conn)
+        df_titulados_reales = leer_sql(sql_titulados_reales, db_conn)
+    except ConsultaExpirada:
+        raise
     except Exception as e:
         print(f"ERROR al ejecutar la consulta SQL en la vista de titulados: {e}")
         return pd.DataFrame()
     finally:
-        try:
-            db_conn.execute("DROP TABLE #TempFugas;")
-        except Exception:
-            pass 
+        borrar_temporal('#TempFugas', db_conn)
 
-    mruns_titulados_reales = df_titulados_reales['mrun'].astype(str).tolist()
+    mruns_titulados_reales = conjunto_mrun(df_titulados_reales['mrun'])
 
-    df_filtrado_cohorte['es_titulado_real'] = df_filtrado_cohorte['mrun_str'].isin(mruns_titulados_reales)
+    df_filtrado_cohorte['es_titulado_real'] = pertenece(df_filtrado_cohorte['mrun'], mruns_titulados_reales)
 
     df_titulados_final = df_filtrado_cohorte[df_filtrado_cohorte['es_titulado_real']].copy()
     
@@ -163,7 +141,7 @@ def get_estimation_titulacion_abandono(anio_n: Optional[int] = None):
 #KPI Estimacion de años para volver a estudiar
 def get_tiempo_de_descanso(anio_n: Optional[int] = None):
 
-    df = pd.read_excel(FILE_DESTINO)
+    df = cargar_dataset(DATASET_DESTINO)
 
     # ---------- Parseo formato estándar " | " ----------
     df['anio_ingreso_destino'] = df['anio_ingreso_destino'].apply(
@@ -257,14 +235,14 @@ def get_tiempo_de_descanso(anio_n: Optional[int] = None):
 
 def get_total_fugados_por_cohorte(anio_n: Optional[int] = None) -> pd.DataFrame:
     
-    def _load_and_clean(file_path: str) -> pd.DataFrame:
+    def _load_and_clean(dataset: str) -> pd.DataFrame:
         try:
-            df = pd.read_excel(file_path)
+            df = cargar_dataset(dataset)
         except FileNotFoundError:
-            print(f"❌ ERROR: Archivo '{file_path}' no encontrado.")
+            print(f"❌ ERROR: Dataset '{dataset}' no encontrado.")
             return pd.DataFrame()
         except Exception as e:
-            print(f"❌ ERROR al cargar '{file_path}': {e}")
+            print(f"❌ ERROR al cargar '{dataset}': {e}")
             return pd.DataFrame()
         
         df['año_cohorte_ecas'] = pd.to_numeric(df['año_cohorte_ecas'], errors='coerce').fillna(-1)
@@ -272,8 +250,8 @@ def get_total_fugados_por_cohorte(anio_n: Optional[int] = None) -> pd.DataFrame:
 
         return df[['mrun', 'año_cohorte_ecas']]
 
-    df_destino = _load_and_clean(FILE_DESTINO)
-    df_abandono = _load_and_clean(FILE_ABANDONO)
+    df_destino = _load_and_clean(DATASET_DESTINO)
+    df_abandono = _load_and_clean(DATASET_ABANDONO)
 
     df_destino_unicos = df_destino.drop_duplicates(subset=['mrun', 'año_cohorte_ecas']).copy()
     df_abandono_unicos = df_abandono.drop_duplicates(subset=['mrun', 'año_cohorte_ecas']).copy()
@@ -330,22 +308,19 @@ def get_total_fugados_por_cohorte(anio_n: Optional[int] = None) -> pd.DataFrame:
     
     return df_final
 
-def get_tasa_desercion_por_cohorte(anio_n: Optional[int] = None) -> pd.DataFrame:
+@con_plazo
+def get_tasa_desercion_por_cohorte(anio_n: Optional[int] = None, df_extracto: Optional[pd.DataFrame] = None) -> pd.DataFrame:
 
     # -------------------------------------------------
-    # 1) TOTAL DE INGRESADOS A ECAS POR COHORTE
+    # 1) TOTAL DE INGRESADOS A ECAS POR COHORTE (extracto compartido de ECAS)
     # -------------------------------------------------
-    sql_ingresados = """
-        SELECT
-            mrun,
-            anio_ing_carr_ori AS año_cohorte_ecas
-        FROM vista_matricula_unificada
-        WHERE mrun IS NOT NULL
-          AND cod_inst = 104
-          AND anio_ing_carr_ori BETWEEN 2007 AND 2025
-    """
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
 
-    df_ingresados = pd.read_sql(sql_ingresados, db_conn)
+    df_ingresados = (
+        df_extracto.loc[df_extracto["cohorte"].between(COHORTE_MIN, COHORTE_MAX), ["mrun", "cohorte"]]
+        .rename(columns={"cohorte": "año_cohorte_ecas"})
+    )
 
     # Un estudiante cuenta una sola vez por cohorte
     df_ingresados = (
@@ -364,14 +339,14 @@ def get_tasa_desercion_por_cohorte(anio_n: Optional[int] = None) -> pd.DataFrame
     # -------------------------------------------------
     # 2) TOTAL DE DESERTORES POR COHORTE
     # -------------------------------------------------
-    def _load_desertores(file_path: str) -> pd.DataFrame:
-        df = pd.read_excel(file_path)
+    def _load_desertores(dataset: str) -> pd.DataFrame:
+        df = cargar_dataset(dataset)
         df["año_cohorte_ecas"] = pd.to_numeric(df["año_cohorte_ecas"], errors="coerce")
         df = df[(df["año_cohorte_ecas"] >= 2007) & (df["año_cohorte_ecas"] <= 2025)]
         return df[["mrun", "año_cohorte_ecas"]]
 
-    df_destino  = _load_desertores(FILE_DESTINO)
-    df_abandono = _load_desertores(FILE_ABANDONO)
+    df_destino  = _load_desertores(DATASET_DESTINO)
+    df_abandono = _load_desertores(DATASET_ABANDONO)
 
     # Unificar desertores (evita doble conteo)
     df_desertores = pd.concat([df_destino, df_abandono], ignore_index=True)
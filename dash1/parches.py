@@ -0,0 +1,82 @@
+#Actualizaciones parciales de figuras con dash.Patch.
+#Al cambiar la cohorte casi todo el JSON de una figura es el template de plotly (≈6 KB), que no cambia.
+#Cada gráfico guarda en un dcc.Store '<id>-firma' la firma del esqueleto que tiene el navegador
+#(hash del template + claves del layout). Si la figura nueva tiene el mismo esqueleto se envía un
+#Patch con las trazas y el layout sin template; si no (ej: otro tipo de gráfico), la figura completa.
+#Uso:
+#   @callback_figura(app, 'desercion-chart', Input('cohorte-dropdown', 'value'))
+#   def update_desercion_chart(selected_year): return fig
+#   (y en el layout: *stores_firma(['desercion-chart', ...]))
+import functools
+import hashlib
+import json
+
+import plotly.graph_objects as go
+from dash import Patch, dcc
+from dash.dependencies import Output, State
+from dash.exceptions import PreventUpdate
+
+from conn_db import ConsultaExpirada
+
+def id_firma(id_grafico: str) -> str:
+    return f"{id_grafico}-firma"
+
+def stores_firma(ids_graficos: list) -> list:
+    """Stores de firma para los gráficos que se actualizan con Patch (van en el layout)."""
+    return [dcc.Store(id=id_firma(id_grafico)) for id_grafico in ids_graficos]
+
+def firma_figura(figura: dict) -> str:
+    """Firma del esqueleto de la figura: template y conjunto de claves del layout."""
+    layout = figura.get("layout", {})
+    template = json.dumps(layout.get("template"), sort_keys=True, default=str)
+    claves = ",".join(sorted(layout))
+    return hashlib.sha1(f"{template}|{claves}".encode("utf-8")).hexdigest()[:16]
+
+def parche_figura(figura, firma_cliente: str | None):
+    """
+    Devuelve (Patch o figura completa, firma). El Patch reemplaza las trazas y cada clave del
+    layout salvo el template: como el conjunto de claves es el mismo, el resultado es idéntico.
+    """
+    if isinstance(figura, go.Figure):
+        figura = figura.to_dict()
+
+    firma = firma_figura(figura)
+    if firma != firma_cliente:
+        return figura, firma
+
+    parche = Patch()
+    parche["data"] = figura.get("data", [])
+    for clave, valor in figura.get("layout", {}).items():
+        if clave != "template":
+            parche["layout"][clave] = valor
+    return parche, firma
+
+def callback_figura(app, id_grafico: str, *entradas, **opciones):
+    """
+    Registra un callback que devuelve una figura en 'id_grafico.figure', enviándola como Patch
+    cuando el navegador ya tiene el mismo esqueleto. La función decorada sigue devolviendo la
+    figura completa si se la llama directamente. Si vence el plazo de las consultas y no hay un
+    resultado anterior (ver conn_db.con_plazo), el gráfico se queda como está.
+    """
+    def decorador(funcion):
+
+        @app.callback(
+            Output(id_grafico, "figure"),
+            Output(id_firma(id_grafico), "data"),
+            *entradas,
+            State(id_firma(id_grafico), "data"),
+            **opciones,
+        )
+        @functools.wraps(funcion)
+        def envoltura(*args):
+            *valores, firma_cliente = args
+            try:
+                figura = funcion(*valores)
+            except ConsultaExpirada as e:
+                print(f"⚠ {id_grafico}: {e} Se mantiene la figura actual.")
+                raise PreventUpdate
+            return parche_figura(figura, firma_cliente)
+
+        return funcion
+
+    return decorador
@@ -1,41 +1,124 @@
 import pandas as pd
-from conn_db import get_db_engine
+from conn_db import get_db_engine, leer_sql, escribir_temporal, borrar_temporal
+from snapshots import cargar_dataset
+from conjuntos_mrun import conjunto_mrun, pertenece, diferencia, clave_mrun_anio
 import numpy as np
 from collections import defaultdict
 from typing import List, Optional, Tuple
 
 COD_ECAS = 104
 CARRERA_LIKE = '%AUDITOR%'
+#Las consultas de competencia toman el flag de Auditoría (CARRERA_LIKE) de la dimensión de carreras
+#(tabla dim_carrera, ver views.py); duración y región se siguen filtrando por fila de matrícula.
 DURACION_DIURNA_SEMESTRES = 8  # 4 años
 DURACION_VESPERTINA_SEMESTRES = 9 # 4.5 años
 
 db_conn = get_db_engine()
 
-def get_mruns_per_year(db_conn, anio_n = None):
+#Extracto compartido de la matrícula de ECAS: la vista se lee una sola vez por versión de datos y los
+#KPIs por cohorte (ingresos, permanencia, continuidad, titulados desde otra institución, deserción y
+#detector de fugas) se calculan en memoria sobre él. exportar_snapshots.py lo publica con este nombre.
+DATASET_EXTRACTO_ECAS = "dashboard_extracto_ecas"
+COHORTE_MIN = 2007
+COHORTE_MAX = 2025
 
-    #Obtiene todos los mruns por año de ingreso
+def get_extracto_ecas(db_conn) -> pd.DataFrame:
+    """Registros de matrícula en ECAS con las columnas que usan los KPIs (años como int16)."""
 
-    filter_anio = ""
+    sql_query = """
+    SELECT
+        mrun,
+        cat_periodo,
+        CAST(anio_ing_carr_ori AS INT) AS cohorte,
+        jornada,
+        gen_alu,
+        rango_edad,
+        dur_total_carr,
+        nomb_carrera
+    FROM vista_matricula_unificada
+    WHERE mrun IS NOT NULL
+      AND cod_inst = 104
+      AND anio_ing_carr_ori IS NOT NULL
+      AND cat_periodo IS NOT NULL
+    ORDER BY mrun, cat_periodo;
+    """
+
+    df = leer_sql(sql_query, db_conn)
+    return df.astype({'cat_periodo': 'int16', 'cohorte': 'int16'})
+
+def cargar_extracto_ecas(db_conn) -> pd.DataFrame:
+    """Extracto de la versión de datos vigente: snapshot si se publicó, si no se lee una vez de la BD."""
+    return cargar_dataset(DATASET_EXTRACTO_ECAS, construir=lambda: get_extracto_ecas(db_conn))
 
-    if isinstance(anio_n, int): 
-        filter_anio = f"AND anio_ing_carr_ori = {anio_n}"
+def get_titulacion_ecas(db_conn) -> pd.DataFrame:
+    """Primer año de titulación en ECAS (títulos reales) por estudiante y cohorte."""
 
-    sql_query= f"""
-    SELECT anio_ing_carr_ori AS ingreso_primero,
-	COUNT(DISTINCT mrun) AS Total_Mruns
-    FROM  vista_matricula_unificada v
-    WHERE cod_inst LIKE 104 
-    AND anio_ing_carr_ori BETWEEN 2007 AND 2025
-    AND jornada IN ('Diurna', 'Vespertina')
-    AND dur_total_carr BETWEEN 8 AND 10
-    AND nomb_carrera LIKE '%AUDITOR%'
-    GROUP BY anio_ing_carr_ori
-    ORDER BY ingreso_primero ASC
+    sql_query = """
+    SELECT
+        mrun,
+        CAST(anio_ing_carr_ori AS INT) AS cohorte,
+        MIN(cat_periodo) AS anio_titulacion
+    FROM vista_titulados_unificada
+    WHERE mrun IS NOT NULL
+      AND cod_inst = 104
+      AND nombre_titulo_obtenido IS NOT NULL
+    GROUP BY mrun, CAST(anio_ing_carr_ori AS INT);
+    """
+
+    return leer_sql(sql_query, db_conn)
+
+def get_previas_ecas(db_conn) -> pd.DataFrame:
     """
+    Primer año con matrícula en otra institución de cada estudiante que pasó por ECAS
+    (lo único de titulados_en_ecas_desde_otra_institucion que no está en el extracto).
+    """
+
+    sql_query = """
+    SELECT
+        vmu.mrun,
+        MIN(vmu.cat_periodo) AS primer_anio_otra_inst
+    FROM vista_matricula_unificada vmu
+    WHERE vmu.cod_inst <> 104
+      AND vmu.mrun IN (
+            SELECT mrun
+            FROM vista_matricula_unificada
+            WHERE cod_inst = 104
+      )
+    GROUP BY vmu.mrun;
+    """
+
+    return leer_sql(sql_query, db_conn)
+
+def _cohortes_en_rango(df_extracto: pd.DataFrame) -> pd.DataFrame:
+    return df_extracto[df_extracto['cohorte'].between(COHORTE_MIN, COHORTE_MAX)]
+
+def ingresos_desde_extracto(df_extracto: pd.DataFrame, anio_n: Optional[int] = None) -> pd.DataFrame:
+    """Ingresos a Auditoría en ECAS por cohorte (jornada diurna o vespertina, 8 a 10 semestres)."""
+
+    df = _cohortes_en_rango(df_extracto)
+    # Sin distinguir mayúsculas, como el LIKE / IN con la collation de SQL Server
+    df = df[
+        df['jornada'].str.upper().isin(['DIURNA', 'VESPERTINA'])
+        & df['dur_total_carr'].between(8, 10)
+        & df['nomb_carrera'].str.upper().str.contains(CARRERA_LIKE.strip('%'), regex=False, na=False)
+    ]
+    if isinstance(anio_n, int):
+        df = df[df['cohorte'] == anio_n]
+
+    return (
+        df.groupby('cohorte')['mrun']
+        .nunique()
+        .reset_index()
+        .rename(columns={'cohorte': 'ingreso_primero', 'mrun': 'Total_Mruns'})
+    )
+
+def get_mruns_per_year(db_conn, anio_n = None, df_extracto: Optional[pd.DataFrame] = None):
 
-    df_total_mruns = pd.read_sql(sql_query, db_conn)
+    #Obtiene todos los mruns por año de ingreso (desde el extracto compartido de ECAS)
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
 
-    return df_total_mruns
+    return ingresos_desde_extracto(df_extracto, anio_n)
 
 def get_ingresos_competencia_ecas(db_conn) -> pd.DataFrame:
     """
@@ -51,9 +134,12 @@ def get_ingresos_competencia_ecas(db_conn) -> pd.DataFrame:
         v.nomb_inst,
         COUNT(DISTINCT v.mrun) AS total_ingresos
     FROM vista_matricula_unificada v
+    JOIN dim_carrera dc
+        ON (dc.codigo_unico = v.codigo_unico OR (dc.codigo_unico IS NULL AND v.codigo_unico IS NULL))
+       AND dc.nomb_carrera = v.nomb_carrera
     WHERE v.mrun IS NOT NULL
       AND v.anio_ing_carr_ori BETWEEN 2007 AND 2025
-      AND v.nomb_carrera LIKE '%AUDITOR%'
+      AND dc.es_auditoria = 1
       AND v.region_sede = 'Metropolitana'
       AND (
             v.cod_inst = 104
@@ -94,75 +180,23 @@ def get_ingresos_competencia_ecas(db_conn) -> pd.DataFrame:
         b.total_ingresos DESC;
     """
 
-    return pd.read_sql(sql_query, db_conn)
-
-def get_permanencia_per_year(db_conn, anio_n: Optional[int] = None) -> pd.DataFrame:
-    
-    # El filtro 'anio_n' se aplica a la cohorte
-    filter_cohorte = f"AND T1.cohorte = {anio_n}" if isinstance(anio_n, int) else ""
-
-    sql_query = f"""
-        WITH base AS (
-            SELECT 
-                cat_periodo,
-                mrun,
-                CAST(anio_ing_carr_ori AS INT) AS cohorte 
-            FROM vista_matricula_unificada
-            WHERE mrun IS NOT NULL
-            AND cod_inst = 104 -- Solo estudiantes matriculados en ECAS
-            AND anio_ing_carr_ori IS NOT NULL
-            AND anio_ing_carr_ori BETWEEN 2007 AND 2025
-        ),
-        matriculados_n AS (
-            -- T1: Identifica a los estudiantes matriculados en su AÑO DE INGRESO (N)
-            SELECT 
-                mrun, 
-                cohorte,
-                cohorte AS anio_n,
-                cohorte + 1 AS anio_n_plus_1
-            FROM base
-        )
-        -- Consulta principal: Calcula la permanencia de N a N+1 para cada cohorte
-        SELECT 
-            T1.cohorte AS cohorte_ingreso,
-            COUNT(DISTINCT T1.mrun) AS matriculados_base, -- Tamaño de la cohorte inicial
-            COUNT(DISTINCT T2.mrun) AS retencion_conteo, -- Los que se matricularon en el año N+1
-            
-            -- Cálculo de la tasa de retención (permanencia N -> N+1)
-            CAST(
-                CAST(COUNT(DISTINCT T2.mrun) AS FLOAT) * 100 / 
-                CAST(COUNT(DISTINCT T1.mrun) AS FLOAT) AS DECIMAL(5, 2)
-            ) AS tasa_retencion_pct
-            
-        FROM matriculados_n AS T1
-        
-        LEFT JOIN base AS T2
-            -- Condición 1: Mismo estudiante (mrun)
-            ON T1.mrun = T2.mrun
-            -- Condición 2: El estudiante aparece en la matrícula del AÑO SIGUIENTE (N+1)
-            AND T2.cat_periodo = T1.anio_n_plus_1
-        
-        GROUP BY 
-            T1.cohorte
-            
-        ORDER BY 
-            T1.cohorte;
-    """
+    return leer_sql(sql_query, db_conn)
 
-    df_retencion_n1 = pd.read_sql(sql_query, db_conn)
+def get_permanencia_per_year(db_conn, anio_n: Optional[int] = None, df_extracto: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Permanencia N -> N+1 por cohorte, calculada sobre los tramos del extracto compartido de ECAS."""
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
 
-    return df_retencion_n1
+    return permanencia_desde_tramos(tramos_desde_extracto(df_extracto), anio_n)
 
-def get_permanencia_ranking_por_jornada(db_conn, jornada: str, cod_ecas: int = COD_ECAS) -> pd.DataFrame:
+def get_permanencia_ranking_jornadas(db_conn, cod_ecas: int = COD_ECAS) -> pd.DataFrame:
 
     """
     Calcula la tasa de permanencia de primer año para la competencia directa 
-    (carrera de Auditoría, duración 8/9 semestres) en una JORNADA específica.
+    (carrera de Auditoría, duración 8/9 semestres) en TODAS las jornadas con una sola pasada:
+    base, primer_registro y matriculados_n1 se construyen una vez y la jornada queda como columna.
     """
     
-    # Aseguramos el formato de string para SQL
-    jornada_sql = jornada.replace("'", "''") 
-    
     sql_query = f"""
     WITH base AS (
     SELECT
@@ -173,9 +207,12 @@ def get_permanencia_ranking_por_jornada(db_conn, jornada: str, cod_ecas: int = C
         vmu.cat_periodo,
         vmu.jornada
     FROM vista_matricula_unificada vmu
+    LEFT JOIN dim_carrera dc
+        ON (dc.codigo_unico = vmu.codigo_unico OR (dc.codigo_unico IS NULL AND vmu.codigo_unico IS NULL))
+       AND dc.nomb_carrera = vmu.nomb_carrera
     WHERE vmu.mrun IS NOT NULL
       AND (
-            (vmu.nomb_carrera LIKE '{CARRERA_LIKE}'
+            (dc.es_auditoria = 1
              AND vmu.dur_total_carr BETWEEN 8 AND 10
              AND vmu.region_sede = 'Metropolitana'
              AND vmu.tipo_inst_1 = 'Institutos Profesionales')
@@ -209,7 +246,6 @@ def get_permanencia_ranking_por_jornada(db_conn, jornada: str, cod_ecas: int = C
         AND b.cod_inst = pr.cod_inst
         AND b.cohorte = pr.cohorte
         AND b.cat_periodo = pr.primer_anio
-        WHERE b.jornada = '{jornada_sql}'
     ),
 
     matriculados_n1 AS (
@@ -251,170 +287,172 @@ def get_permanencia_ranking_por_jornada(db_conn, jornada: str, cod_ecas: int = C
         c.jornada
 
     ORDER BY
+        c.jornada,
         c.cohorte,
         tasa_permanencia_pct DESC;
     """
 
-    df_all_data = pd.read_sql(sql_query, db_conn)
-    
-    # Aquí puedes añadir la lógica de Top 5 + ECAS por año (vista en la respuesta anterior)
-    # Por simplicidad, esta función devolverá todos los datos por jornada, y el gráfico filtrará.
-    return df_all_data
+    return leer_sql(sql_query, db_conn)
 
+def filtrar_jornada(df_jornadas: pd.DataFrame, jornada: str) -> pd.DataFrame:
+    """Filas de una jornada (sin distinguir mayúsculas, como la collation de SQL Server)."""
+    df = df_jornadas[df_jornadas['jornada'].str.upper() == jornada.upper()]
+    return df.reset_index(drop=True)
 
-def get_continuidad_per_year(db_conn, anio_n=None):
+def get_permanencia_ranking_por_jornada(db_conn, jornada: str, cod_ecas: int = COD_ECAS) -> pd.DataFrame:
+    """
+    Tasa de permanencia de primer año de la competencia directa en una JORNADA específica.
+    Para varias jornadas conviene get_permanencia_ranking_jornadas (una sola consulta).
+    """
+    return filtrar_jornada(get_permanencia_ranking_jornadas(db_conn, cod_ecas), jornada)
 
-    filtro_cohorte_sql = ""
-    if isinstance(anio_n, int):
-        # El filtro se aplicará al final, pero lo definimos aquí si lo queremos en SQL
-        filtro_cohorte_sql = f"AND s.cohorte = {anio_n}"
 
-    sql_query = f"""
-    WITH base AS (
-        SELECT DISTINCT
-            mrun,
-            cat_periodo,
-            CAST(anio_ing_carr_ori AS INT) AS cohorte
-        FROM vista_matricula_unificada
-        WHERE mrun IS NOT NULL
-          AND cod_inst = 104
-          AND anio_ing_carr_ori IS NOT NULL
-    ),
+def get_continuidad_per_year(
+    db_conn,
+    anio_n=None,
+    df_extracto: Optional[pd.DataFrame] = None,
+    df_titulacion: Optional[pd.DataFrame] = None
+):
+    """Supervivencia y titulación acumulada por cohorte, sobre los tramos del extracto compartido de ECAS."""
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
+    if df_titulacion is None:
+        df_titulacion = get_titulacion_ecas(db_conn)
 
-    cohortes AS (
-        SELECT
-            mrun,
-            cohorte
-        FROM base
-        WHERE cat_periodo = cohorte
-    ),
-
-    base_cohorte AS (
-        -- ... (Tu CTE existente para la base de la cohorte) ...
-        SELECT
-            b.mrun,
-            b.cohorte,
-            b.cat_periodo,
-            b.cat_periodo - b.cohorte AS anio_rel
-        FROM base b
-        JOIN cohortes c
-            ON b.mrun = c.mrun AND b.cohorte = c.cohorte
-        WHERE b.cat_periodo >= b.cohorte
-    ),
-
-    supervivencia_individual AS (
-        -- ... (Tu CTE existente para max_anio_rel) ...
-        SELECT
-            mrun,
-            cohorte,
-            MAX(anio_rel) AS max_anio_rel
-        FROM (
-            SELECT
-                mrun, cohorte, anio_rel,
-                COUNT(*) OVER (
-                    PARTITION BY mrun, cohorte
-                    ORDER BY anio_rel
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) - 1 AS secuencia
-            FROM base_cohorte
-        ) t
-        WHERE anio_rel = secuencia
-        GROUP BY mrun, cohorte
-    ),
+    return continuidad_desde_tramos(tramos_desde_extracto(df_extracto, df_titulacion), anio_n)
 
-    titulacion AS (
-        SELECT 
-            t.mrun, 
-            CAST(t.anio_ing_carr_ori AS INT) AS cohorte_ingreso,
-            t.cat_periodo AS anio_titulacion,
-            -- Calcula el año relativo de titulación
-            t.cat_periodo - CAST(t.anio_ing_carr_ori AS INT) AS anio_rel_titulacion
-        FROM vista_titulados_unificada t
-        WHERE t.cod_inst = 104 -- Solo ECAS
-        AND t.nombre_titulo_obtenido IS NOT NULL -- Solo titulados reales
-        AND t.mrun IN (SELECT mrun FROM cohortes) -- Solo alumnos de la cohorte matriculada
-    ),
+def tramos_desde_extracto(df_extracto: pd.DataFrame, df_titulacion: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Tabla derivada con una fila por estudiante y cohorte de ECAS: primer y último año matriculado,
+    años consecutivos desde la cohorte, si se matriculó en N+1 y el año de titulación relativo a la cohorte.
+    Las curvas de continuidad, titulación acumulada y permanencia N->N+1 se agregan sobre esta tabla
+    (ver continuidad_desde_tramos y permanencia_desde_tramos).
+    """
 
-    titulados_por_anio AS (
-    SELECT
-        cohorte_ingreso AS cohorte,
-        anio_rel_titulacion AS anio_rel,
-        COUNT(DISTINCT mrun) AS titulados_anio
-    FROM titulacion
-    GROUP BY
-        cohorte_ingreso,
-        anio_rel_titulacion
-    ),
+    base = (
+        df_extracto[['mrun', 'cohorte', 'cat_periodo']]
+        .drop_duplicates()
+        .sort_values(['mrun', 'cohorte', 'cat_periodo'], ignore_index=True)
+    )
+    claves = ['mrun', 'cohorte']
 
-    scaffold AS (
-        SELECT DISTINCT
-            cohorte,
-            anio_rel
-        FROM base_cohorte
-    ),
+    tramos = (
+        base.assign(matriculado_en_cohorte=(base['cat_periodo'] == base['cohorte']).astype('int8'))
+        .groupby(claves, as_index=False)
+        .agg(
+            primer_anio=('cat_periodo', 'min'),
+            ultimo_anio=('cat_periodo', 'max'),
+            matriculado_en_cohorte=('matriculado_en_cohorte', 'max'),
+        )
+    )
 
-    cohorte_totales AS (
-        SELECT
-            cohorte,
-            COUNT(DISTINCT mrun) AS total_ingreso
-        FROM cohortes
-        GROUP BY cohorte
+    # Un año es consecutivo si su distancia a la cohorte es igual a su posición en la secuencia
+    desde_cohorte = base[base['cat_periodo'] >= base['cohorte']]
+    secuencia = desde_cohorte.groupby(claves).cumcount()
+    consecutivos = (
+        desde_cohorte[(desde_cohorte['cat_periodo'] - desde_cohorte['cohorte']) == secuencia]
+        .groupby(claves)
+        .size()
+        .rename('anios_consecutivos')
+        .reset_index()
     )
+    tramos = tramos.merge(consecutivos, on=claves, how='left')
+    tramos['anios_consecutivos'] = tramos['anios_consecutivos'].fillna(0).astype('int64')
+
+    # Matrícula en N+1 con cualquier cohorte entre 2007 y 2025 (misma base que la permanencia)
+    en_rango = _cohortes_en_rango(base)
+    matriculas = conjunto_mrun(clave_mrun_anio(en_rango['mrun'], en_rango['cat_periodo']))
+    siguiente = clave_mrun_anio(tramos['mrun'], tramos['cohorte'].astype('int64') + 1)
+    tramos['matriculado_n1'] = pertenece(siguiente, matriculas).astype('int64')
+
+    tramos['anio_rel_titulacion'] = np.nan
+    if df_titulacion is not None and not df_titulacion.empty:
+        titulacion = (
+            df_titulacion.dropna(subset=['cohorte'])
+            .astype({'cohorte': 'int64'})
+            .groupby(claves, as_index=False)['anio_titulacion']
+            .min()
+        )
+        anio_titulacion = tramos[claves].astype({'cohorte': 'int64'}).merge(titulacion, on=claves, how='left')['anio_titulacion']
+        tramos['anio_rel_titulacion'] = anio_titulacion.to_numpy() - tramos['cohorte'].to_numpy()
 
-    SELECT
-    s.cohorte,
-    s.anio_rel + 1 AS anio_relativo,
-    s.cohorte + s.anio_rel AS anio_real,
-    
-    -- Supervivencia
-    COUNT(DISTINCT si.mrun) AS estudiantes_sobreviven,
-    CAST(COUNT(DISTINCT si.mrun) AS FLOAT) / ct.total_ingreso AS tasa_supervivencia,
-    
-    -- Titulación acumulada (VENTANA SOBRE AGREGADOS)
-    SUM(COALESCE(tpa.titulados_anio, 0)) OVER (
-        PARTITION BY s.cohorte
-        ORDER BY s.anio_rel
-        ROWS UNBOUNDED PRECEDING
-    ) AS titulados_acumulados,
-    
-    -- Tasa titulación acumulada
-    CAST(
-        SUM(COALESCE(tpa.titulados_anio, 0)) OVER (
-            PARTITION BY s.cohorte
-            ORDER BY s.anio_rel
-            ROWS UNBOUNDED PRECEDING
-        ) AS FLOAT
-    ) / ct.total_ingreso AS tasa_titulacion_acumulada
+    return tramos
 
-    FROM scaffold s
-    JOIN cohorte_totales ct 
-        ON ct.cohorte = s.cohorte
+def get_tramos_matricula_ecas(db_conn, df_extracto: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Tramos de matrícula por estudiante y cohorte (ver tramos_desde_extracto)."""
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
 
-    LEFT JOIN supervivencia_individual si 
-        ON si.cohorte = s.cohorte 
-    AND si.max_anio_rel >= s.anio_rel
+    return tramos_desde_extracto(df_extracto, get_titulacion_ecas(db_conn))
 
-    LEFT JOIN titulados_por_anio tpa
-        ON tpa.cohorte = s.cohorte
-    AND tpa.anio_rel = s.anio_rel
+def permanencia_desde_tramos(df_tramos: pd.DataFrame, anio_n: Optional[int] = None) -> pd.DataFrame:
+    """Permanencia N -> N+1 por cohorte (mismas columnas que get_permanencia_per_year)."""
 
-    WHERE s.anio_rel >= 0 {filtro_cohorte_sql}
+    df = df_tramos[df_tramos['cohorte'].between(2007, 2025)]
+    if isinstance(anio_n, int):
+        df = df[df['cohorte'] == anio_n]
 
-    GROUP BY
-        s.cohorte,
-        s.anio_rel,
-        ct.total_ingreso,
-        tpa.titulados_anio
+    df_retencion = (
+        df.groupby('cohorte')
+        .agg(matriculados_base=('mrun', 'size'), retencion_conteo=('matriculado_n1', 'sum'))
+        .reset_index()
+        .rename(columns={'cohorte': 'cohorte_ingreso'})
+    )
+    df_retencion['tasa_retencion_pct'] = (df_retencion['retencion_conteo'] * 100 / df_retencion['matriculados_base']).round(2)
 
-    ORDER BY
-        s.cohorte,
-        s.anio_rel;
+    return df_retencion
+
+def continuidad_desde_tramos(df_tramos: pd.DataFrame, anio_n: Optional[int] = None) -> pd.DataFrame:
+    """
+    Supervivencia y titulación acumulada por cohorte y año relativo (mismas columnas que
+    get_continuidad_per_year). Los años relativos van de 0 al último año con matrícula de la cohorte.
     """
 
-    # Ejecutar
-    df = pd.read_sql(sql_query, db_conn)
+    df = df_tramos[df_tramos['matriculado_en_cohorte'] == 1]
+    if isinstance(anio_n, int):
+        df = df[df['cohorte'] == anio_n]
+
+    columnas = ['cohorte', 'anio_relativo', 'anio_real', 'estudiantes_sobreviven', 'tasa_supervivencia',
+                'titulados_acumulados', 'tasa_titulacion_acumulada']
+    if df.empty:
+        return pd.DataFrame(columns=columnas)
+
+    # Grilla cohorte x año relativo (0 .. último año matriculado)
+    max_rel = (df['ultimo_anio'] - df['cohorte']).groupby(df['cohorte']).max()
+    cohortes = np.repeat(max_rel.index.to_numpy(), max_rel.to_numpy() + 1)
+    anios_rel = np.concatenate([np.arange(n + 1) for n in max_rel.to_numpy()])
+    grilla = pd.MultiIndex.from_arrays([cohortes, anios_rel], names=['cohorte', 'anio_rel'])
+
+    # Sobreviven en el año r quienes tienen más de r años consecutivos desde la cohorte
+    ultimo_consecutivo = (
+        df[df['anios_consecutivos'] > 0]
+        .groupby([df['cohorte'], df['anios_consecutivos'] - 1])
+        .size()
+        .rename_axis(['cohorte', 'anio_rel'])
+        .reindex(grilla, fill_value=0)
+    )
+    sobreviven = ultimo_consecutivo[::-1].groupby(level='cohorte').cumsum()[::-1]
+
+    titulados_anio = (
+        df.dropna(subset=['anio_rel_titulacion'])
+        .groupby(['cohorte', 'anio_rel_titulacion'])
+        .size()
+        .rename_axis(['cohorte', 'anio_rel'])
+        .reindex(grilla, fill_value=0)
+    )
+    titulados_acumulados = titulados_anio.groupby(level='cohorte').cumsum()
 
-    return df
+    total_ingreso = df.groupby('cohorte').size().reindex(cohortes).to_numpy()
+
+    return pd.DataFrame({
+        'cohorte': cohortes,
+        'anio_relativo': anios_rel + 1,
+        'anio_real': cohortes + anios_rel,
+        'estudiantes_sobreviven': sobreviven.to_numpy(),
+        'tasa_supervivencia': sobreviven.to_numpy() / total_ingreso,
+        'titulados_acumulados': titulados_acumulados.to_numpy(),
+        'tasa_titulacion_acumulada': titulados_acumulados.to_numpy() / total_ingreso,
+    })
 
 def agrupar_trayectoria_por_carrera(df_destino, df_fugas):
 
@@ -516,125 +554,54 @@ def agrupar_trayectoria_por_carrera(df_destino, df_fugas):
 
     return df_salida
 
-def get_fuga_multianual_trayectoria(db_conn, anio_n: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    
-    filtro_cohorte = f"AND anio_ing_carr_ori = {anio_n}" if isinstance(anio_n, int) else ""
-
-    # 1. Identificación de estudiantes en ECAS
-    sql_base_ecas = f"""
-    SELECT 
-    mrun,
-    gen_alu,
-    rango_edad,
-    cat_periodo,
-    anio_ing_carr_ori AS cohorte,
-    cod_inst,
-    jornada, 
-    nomb_carrera 
-    FROM vista_matricula_unificada
-    WHERE mrun IS NOT NULL 
-    AND cod_inst = 104
-    AND anio_ing_carr_ori BETWEEN 2007 AND 2025
-    {filtro_cohorte}
-    ORDER BY mrun, cat_periodo;
+def identificar_desertores(df_ecas_cohortes: pd.DataFrame, mruns_titulados) -> pd.DataFrame:
+    """
+    Pasos 2 a 5 de get_fuga_multianual_trayectoria, sin acceso a la BD:
+    detecta fugas (sin matrícula posterior ni retorno), descarta a los titulados
+    y agrega la metadata de su última matrícula en ECAS.
     """
-    
-    df_ecas_cohortes = pd.read_sql(sql_base_ecas, db_conn)
-    
-    if df_ecas_cohortes.empty:
-        print("No se encontraron datos de matrículas para la cohorte especificada en ECAS.")
-        return pd.DataFrame(), pd.DataFrame()
 
     cohortes_iniciales = (
     df_ecas_cohortes
     .groupby('mrun', as_index=False)
-    .agg(cohorte=('cohorte', 'min'))
+    .agg(cohorte=('cohorte', 'min'), max_anio_en_ecas=('cat_periodo', 'max'))
     )
     cohortes_iniciales.dropna(subset=['cohorte'], inplace=True)
     
     if cohortes_iniciales.empty:
         print("Advertencia: No quedan cohortes válidas después de limpiar los valores nulos.")
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame()
         
     max_anio_registro = df_ecas_cohortes['cat_periodo'].max()
     if pd.isna(max_anio_registro):
         print("Advertencia: max_anio_registro es NaN. Saliendo.")
-        return pd.DataFrame(), pd.DataFrame() 
+        return pd.DataFrame()
     max_anio_registro = int(max_anio_registro)
     
-    
-    matrículas_ecas = set(df_ecas_cohortes[['mrun', 'cat_periodo']].apply(tuple, axis=1))
-    fugas_detectadas_supuestas = []
-
     # 2. Detección de Fugas Supuestas (basado en ausencia de matrícula y no retorno)
-    for index, row in cohortes_iniciales.iterrows():
-        mrun = row['mrun']
-        cohorte = row['cohorte']
-
-        cohorte = int(cohorte)
-
-        matriculas_mrun = df_ecas_cohortes[df_ecas_cohortes['mrun'] == mrun]
-    
-        if matriculas_mrun.empty:
-            continue 
-            
-        max_anio_en_ecas = int(matriculas_mrun['cat_periodo'].max())
-        
-        if max_anio_en_ecas == max_anio_registro:
-            continue
-        
-        anio_primer_fuga = max_anio_en_ecas + 1
-        
-        retorno_detectado = False
-        for anio_posterior in range(anio_primer_fuga + 1, max_anio_registro + 1):
-            if (mrun, anio_posterior) in matrículas_ecas:
-                retorno_detectado = True
-                break
-        if retorno_detectado:
-            continue
-        
-        fugas_detectadas_supuestas.append({
-            'mrun': mrun, 
-            'cohorte': cohorte, 
-            'anio_fuga': anio_primer_fuga
-        })
-    
-    df_fugas_supuestas = pd.DataFrame(fugas_detectadas_supuestas)
+    # La fuga es el año siguiente a su última matrícula en ECAS, así que no hay retorno posible:
+    # solo se descartan los que siguen matriculados en el último año registrado.
+    fugas = cohortes_iniciales[cohortes_iniciales['max_anio_en_ecas'] != max_anio_registro]
+    df_fugas_supuestas = pd.DataFrame({
+        'mrun': fugas['mrun'].to_numpy(),
+        'cohorte': fugas['cohorte'].astype('int64').to_numpy(),
+        'anio_fuga': fugas['max_anio_en_ecas'].astype('int64').to_numpy() + 1,
+    })
 
     if df_fugas_supuestas.empty:
         print("No se detectaron fugas o todos se mantuvieron hasta el final del período registrado.")
-        return pd.DataFrame(), pd.DataFrame()
-        
-    
-    # 3. IDENTIFICAR TITULADOS (EGRESADOS) REALES USANDO VISTA UNIFICADA
-    
-    sql_titulados = """
-    SELECT 
-        DISTINCT mrun
-    FROM vista_titulados_unificada_limpia
-    WHERE mrun IS NOT NULL
-      AND cod_inst = 104; -- Opcional: Filtrar solo titulados de ECAS si es relevante.
-    """
-    df_mruns_titulados = pd.read_sql(sql_titulados, db_conn)
-    
-    mruns_titulados = df_mruns_titulados['mrun'].tolist()
+        return pd.DataFrame()
     
     # 4. CLASIFICACIÓN DE EGRESADOS/TITULADOS (Criterio simple y exacto)
     
     # Los egresados son todas las 'fugas supuestas' que tienen un registro de titulación.
-    df_egresados = df_fugas_supuestas[
-        df_fugas_supuestas['mrun'].isin(mruns_titulados)
-    ].copy()
-    
-    mruns_egresados = df_egresados['mrun'].tolist()
-    
     # Los Desertores son las fugas supuestas que NO son titulados.
-    df_fugas_final_meta = df_fugas_supuestas[~df_fugas_supuestas['mrun'].isin(mruns_egresados)].copy()
-    mruns_solo_desertores = df_fugas_final_meta['mrun'].tolist()
+    es_egresado = pertenece(df_fugas_supuestas['mrun'], conjunto_mrun(mruns_titulados))
+    df_fugas_final_meta = df_fugas_supuestas[~es_egresado].copy()
 
     if df_fugas_final_meta.empty:
         print("Todos los estudiantes que dejaron la institución fueron clasificados como Egresados/Titulados.")
-        return pd.DataFrame(), pd.DataFrame() 
+        return pd.DataFrame() 
     
     # 5. Obtener jornada y merge (Necesario para la función agrupar_trayectoria_por_carrera)
     df_jornada_origen = (
@@ -657,36 +624,22 @@ def get_fuga_multianual_trayectoria(db_conn, anio_n: Optional[int] = None) -> Tu
         on='mrun', 
         how='left'
     )
-    
-    # 6. CONSULTA DE TRAYECTORIA Y CREACIÓN DE TABLA TEMPORAL (Solo para los desertores)
-    
-    df_mruns_temp = pd.DataFrame(mruns_solo_desertores, columns=['mrun_fuga'])
-    df_mruns_temp.to_sql('#TempMrunsFuga', db_conn, if_exists='replace', index=False, chunksize=1000)
 
-    sql_trayectoria = f"""
-    SELECT 
-        t1.mrun,
-        t1.cat_periodo AS anio_matricula_destino,
-        t1.nomb_inst AS institucion_destino,
-        t1.nomb_carrera AS carrera_destino,
-        t1.area_conocimiento AS area_conocimiento_destino,
-        t1.cod_inst,
-        t1.dur_total_carr as duracion_total_carrera,
-        t1.nivel_global,
-        t1.nivel_carrera_1,
-        t1.nivel_carrera_2,
-        t1.tipo_inst_1,
-        t1.tipo_inst_2,
-        t1.tipo_inst_3,
-        t1.requisito_ingreso
-    FROM vista_matricula_unificada t1
-    INNER JOIN #TempMrunsFuga tm ON t1.mrun = tm.mrun_fuga
-    ORDER BY t1.mrun, t1.cat_periodo;
+    return df_fugas_final_meta
+
+def clasificar_destino_abandono(
+    df_trayectoria: pd.DataFrame,
+    df_fugas_final_meta: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Pasos 7 a 9 de get_fuga_multianual_trayectoria, sin acceso a la BD:
+    separa a los desertores en Fuga a Destino (matrícula posterior en otra institución)
+    y Abandono Total.
     """
-    df_trayectoria = pd.read_sql(sql_trayectoria, db_conn)
+    mruns_solo_desertores = conjunto_mrun(df_fugas_final_meta['mrun'])
     
     # 7. Unir las trayectorias con la metadata de fuga
-    df_fugas_matriculas = df_trayectoria[df_trayectoria['mrun'].isin(mruns_solo_desertores)].copy()
+    df_fugas_matriculas = df_trayectoria[pertenece(df_trayectoria['mrun'], mruns_solo_desertores)].copy()
     
     df_fugas_final = pd.merge(
         df_fugas_matriculas, 
@@ -705,11 +658,10 @@ def get_fuga_multianual_trayectoria(db_conn, anio_n: Optional[int] = None) -> Tu
     df_destino.drop_duplicates(subset=['mrun', 'anio_matricula_destino', 'institucion_destino', 'carrera_destino'], inplace=True)
     
     # Clasificar Abandono Total (Fugas sin destino posterior)
-    mruns_con_destino = df_destino['mrun'].unique()
-    mruns_desertores_base = df_fugas_final_meta['mrun'].unique()
-    mruns_abandono_total = [mrun for mrun in mruns_desertores_base if mrun not in mruns_con_destino]
+    mruns_con_destino = conjunto_mrun(df_destino['mrun'])
+    mruns_abandono_total = diferencia(mruns_solo_desertores, mruns_con_destino)
     
-    df_abandono_total = df_fugas_final_meta[df_fugas_final_meta['mrun'].isin(mruns_abandono_total)].copy()
+    df_abandono_total = df_fugas_final_meta[pertenece(df_fugas_final_meta['mrun'], mruns_abandono_total)].copy()
     df_abandono_total = df_abandono_total[['mrun', 'cohorte', 'anio_fuga', 'gen_alu', 'rango_edad', 'jornada']].drop_duplicates()
     
     mapa_genero = {
@@ -729,13 +681,91 @@ def get_fuga_multianual_trayectoria(db_conn, anio_n: Optional[int] = None) -> Tu
     print(df_fugas_final_meta)
 
     df_destino_agrupado = agrupar_trayectoria_por_carrera(df_destino, df_fugas_final_meta) 
+
+    return df_destino_agrupado, df_abandono_total
+
+def base_fugas_desde_extracto(df_extracto: pd.DataFrame, anio_n: Optional[int] = None) -> pd.DataFrame:
+    """Matrículas en ECAS de las cohortes 2007-2025 (paso 1 del detector de fugas), ordenadas por mrun y año."""
+    df = _cohortes_en_rango(df_extracto)
+    if isinstance(anio_n, int):
+        df = df[df['cohorte'] == anio_n]
+
+    return (
+        df.assign(cod_inst=COD_ECAS)
+        [['mrun', 'gen_alu', 'rango_edad', 'cat_periodo', 'cohorte', 'cod_inst', 'jornada', 'nomb_carrera']]
+        .sort_values(['mrun', 'cat_periodo'], kind='stable', ignore_index=True)
+    )
+
+def get_fuga_multianual_trayectoria(
+    db_conn,
+    anio_n: Optional[int] = None,
+    df_extracto: Optional[pd.DataFrame] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+
+    # 1. Identificación de estudiantes en ECAS (extracto compartido)
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
+
+    df_ecas_cohortes = base_fugas_desde_extracto(df_extracto, anio_n)
+    
+    if df_ecas_cohortes.empty:
+        print("No se encontraron datos de matrículas para la cohorte especificada en ECAS.")
+        return pd.DataFrame(), pd.DataFrame()
+        
+    
+    # 3. IDENTIFICAR TITULADOS (EGRESADOS) REALES USANDO VISTA UNIFICADA
+    
+    sql_titulados = """
+    SELECT 
+        DISTINCT mrun
+    FROM vista_titulados_unificada_limpia
+    WHERE mrun IS NOT NULL
+      AND cod_inst = 104; -- Opcional: Filtrar solo titulados de ECAS si es relevante.
+    """
+    df_mruns_titulados = leer_sql(sql_titulados, db_conn)
     
+    mruns_titulados = conjunto_mrun(df_mruns_titulados['mrun'])
+
+    # 2, 4 y 5. Fugas que no son titulados, con su metadata
+    df_fugas_final_meta = identificar_desertores(df_ecas_cohortes, mruns_titulados)
+
+    if df_fugas_final_meta.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    mruns_solo_desertores = df_fugas_final_meta['mrun'].tolist()
+    
+    # 6. CONSULTA DE TRAYECTORIA Y CREACIÓN DE TABLA TEMPORAL (Solo para los desertores)
+    
+    df_mruns_temp = pd.DataFrame(mruns_solo_desertores, columns=['mrun_fuga'])
+    escribir_temporal(df_mruns_temp, '#TempMrunsFuga', db_conn, chunksize=1000)
+
+    sql_trayectoria = f"""
+    SELECT 
+        t1.mrun,
+        t1.cat_periodo AS anio_matricula_destino,
+        t1.nomb_inst AS institucion_destino,
+        t1.nomb_carrera AS carrera_destino,
+        t1.area_conocimiento AS area_conocimiento_destino,
+        t1.cod_inst,
+        t1.dur_total_carr as duracion_total_carrera,
+        t1.nivel_global,
+        t1.nivel_carrera_1,
+        t1.nivel_carrera_2,
+        t1.tipo_inst_1,
+        t1.tipo_inst_2,
+        t1.tipo_inst_3,
+        t1.requisito_ingreso
+    FROM vista_matricula_unificada t1
+    INNER JOIN #TempMrunsFuga tm ON t1.mrun = tm.mrun_fuga
+    ORDER BY t1.mrun, t1.cat_periodo;
+    """
+    df_trayectoria = leer_sql(sql_trayectoria, db_conn)
+    
+    # 7, 8 y 9. Fuga a Destino vs Abandono Total
+    df_destino_agrupado, df_abandono_total = clasificar_destino_abandono(df_trayectoria, df_fugas_final_meta)
   
     # 10. Limpieza de la tabla temporal
-    try:
-        db_conn.execute("DROP TABLE #TempMrunsFuga;")
-    except Exception:
-        pass 
+    borrar_temporal('#TempMrunsFuga', db_conn)
 
     return df_destino_agrupado, df_abandono_total
 
@@ -744,70 +774,52 @@ def get_fuga_multianual_trayectoria(db_conn, anio_n: Optional[int] = None) -> Tu
 #y se titulan exitosamente. Se debe evaluar la trayectoria del estudiantes antes de anio_ing_carr_ori en ECAS 
 #y ver si se titularon luego en ECAS. Se podria tomar como población total todos los estudiantes que vienen de otra institución
 #hacia ECAS, y calcular el porcentaje de titulados vs no titulados
-def titulados_en_ecas_desde_otra_institucion(db_conn, anio_n: Optional[int] = None):
+def titulados_desde_otra_inst(
+    df_extracto: pd.DataFrame,
+    df_previas: pd.DataFrame,
+    df_titulacion: pd.DataFrame,
+    anio_n: Optional[int] = None
+) -> pd.DataFrame:
+    """Estudiantes que llegan a ECAS tras matricularse en otra institución, y cuántos se titulan en ECAS."""
 
-    filtro_cohorte = ""
-    if isinstance(anio_n, int):
-        filtro_cohorte = f"AND pb.cohorte_ecas = {anio_n}"
-
-    sql_query = f"""
-    WITH ingreso_ecas AS (
-        SELECT DISTINCT
-            mrun,
-            CAST(anio_ing_carr_ori AS INT) AS cohorte_ecas
-        FROM vista_matricula_unificada
-        WHERE cod_inst = 104
-          AND mrun IS NOT NULL
-          AND anio_ing_carr_ori BETWEEN 2007 AND 2025
-    ),
+    ingreso_ecas = _cohortes_en_rango(df_extracto)[['mrun', 'cohorte']].drop_duplicates()
 
-    trayectoria_previa AS (
-        SELECT DISTINCT
-            vmu.mrun
-        FROM vista_matricula_unificada vmu
-        JOIN ingreso_ecas ie
-          ON vmu.mrun = ie.mrun
-        WHERE vmu.cod_inst <> 104
-          AND vmu.cat_periodo < ie.cohorte_ecas
-    ),
+    # Basta una matrícula en otra institución antes de alguna de sus cohortes en ECAS
+    con_previas = ingreso_ecas.merge(df_previas, on='mrun')
+    mruns_previos = con_previas.loc[con_previas['primer_anio_otra_inst'] < con_previas['cohorte'], 'mrun'].unique()
 
-    poblacion_base AS (
-        SELECT
-            ie.mrun,
-            ie.cohorte_ecas
-        FROM ingreso_ecas ie
-        JOIN trayectoria_previa tp
-          ON ie.mrun = tp.mrun
-    ),
+    poblacion_base = ingreso_ecas[pertenece(ingreso_ecas['mrun'], conjunto_mrun(mruns_previos))]
+    if isinstance(anio_n, int):
+        poblacion_base = poblacion_base[poblacion_base['cohorte'] == anio_n]
 
-    titulados_ecas AS (
-        SELECT DISTINCT
-            mrun
-        FROM vista_titulados_unificada
-        WHERE cod_inst = 104
-          AND nombre_titulo_obtenido IS NOT NULL
+    df = (
+        poblacion_base
+        .assign(titulado=pertenece(poblacion_base['mrun'], conjunto_mrun(df_titulacion['mrun'])))
+        .groupby('cohorte')
+        .agg(total_provenientes=('mrun', 'size'), titulados_ecas=('titulado', 'sum'))
+        .reset_index()
+        .rename(columns={'cohorte': 'cohorte_ecas'})
     )
+    df['no_titulados_ecas'] = df['total_provenientes'] - df['titulados_ecas']
+    df['tasa_titulacion_ecas'] = (df['titulados_ecas'] * 100 / df['total_provenientes']).round(2)
 
-    SELECT
-        pb.cohorte_ecas,
-        COUNT(DISTINCT pb.mrun) AS total_provenientes,
-        COUNT(DISTINCT te.mrun) AS titulados_ecas,
-        COUNT(DISTINCT pb.mrun) - COUNT(DISTINCT te.mrun) AS no_titulados_ecas,
-        CAST(
-            COUNT(DISTINCT te.mrun) * 100.0 /
-            COUNT(DISTINCT pb.mrun)
-            AS DECIMAL(5,2)
-        ) AS tasa_titulacion_ecas
-    FROM poblacion_base pb
-    LEFT JOIN titulados_ecas te
-      ON pb.mrun = te.mrun
-    WHERE 1 = 1
-    {filtro_cohorte}
-    GROUP BY pb.cohorte_ecas
-    ORDER BY pb.cohorte_ecas;
-    """
+    return df
 
-    return pd.read_sql(sql_query, db_conn)
+def titulados_en_ecas_desde_otra_institucion(
+    db_conn,
+    anio_n: Optional[int] = None,
+    df_extracto: Optional[pd.DataFrame] = None,
+    df_previas: Optional[pd.DataFrame] = None,
+    df_titulacion: Optional[pd.DataFrame] = None
+):
+    if df_extracto is None:
+        df_extracto = cargar_extracto_ecas(db_conn)
+    if df_previas is None:
+        df_previas = get_previas_ecas(db_conn)
+    if df_titulacion is None:
+        df_titulacion = get_titulacion_ecas(db_conn)
+
+    return titulados_desde_otra_inst(df_extracto, df_previas, df_titulacion, anio_n)
 
 def exportar_fuga_a_excel(df_destino_agrupado, df_abandono_total, anio_n):
     # Exporta los DataFrames de Fuga a Destino y Abandono Total a archivos Excel separados
@@ -831,5 +843,6 @@ def exportar_fuga_a_excel(df_destino_agrupado, df_abandono_total, anio_n):
     if df_destino_agrupado.empty and df_abandono_total.empty:
         print("No se generaron archivos de salida.")
 
-df_destino, df_abandono = get_fuga_multianual_trayectoria(db_conn, anio_n=None)
-exportar_excel = exportar_fuga_a_excel(df_destino, df_abandono, anio_n=None)
\ No newline at end of file
+if __name__ == "__main__":
+    df_destino, df_abandono = get_fuga_multianual_trayectoria(db_conn, anio_n=None)
+    exportar_excel = exportar_fuga_a_excel(df_destino, df_abandono, anio_n=None)
\ No newline at end of file
@@ -0,0 +1,449 @@
+#Snapshots de datos en formato mapeable en memoria (Arrow IPC sin compresión y columnas .npy).
+#Los archivos se abren con mmap: todos los workers de un mismo host comparten una sola copia
+#física de los datos (page cache), por lo que agregar workers casi no agrega memoria.
+import contextvars
+import functools
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    ARROW_DISPONIBLE = True
+except ImportError:
+    ARROW_DISPONIBLE = False
+
+from trayectoria_csr import TrayectoriaCSR, construir_trayectoria_csr, construir_dimension, DIMENSIONES
+from instrumentacion import contar_filas
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DASH1_DIR = BASE_DIR / "dash1"
+DASH2_DIR = BASE_DIR / "dash2"
+
+SNAPSHOT_DIR = Path(os.environ.get("ECAS_SNAPSHOT_DIR", BASE_DIR / "snapshots"))
+ARCHIVO_VERSION = "VERSION"
+
+# Con copy-on-write, las copias superficiales que entrega cargar_dataset nunca escriben
+# sobre los buffers compartidos (en pandas >= 3 ya es el comportamiento por defecto).
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+#Fuentes originales (excel generados por queries.py y queries_l.py)
+FUENTES_EXCEL = {
+    "trayectoria_titulados": (DASH2_DIR / "trayectoria_post_ecas.xlsx", "Trayectoria_Resumen"),
+    "fuga_a_destino": (DASH1_DIR / "fuga_a_destino_todas_cohortes.xlsx", 0),
+    "abandono_total": (DASH1_DIR / "abandono_total_todas_cohortes.xlsx", 0),
+}
+
+#Fuentes de trayectorias sobre las que se arman las dimensiones compartidas
+FUENTES_TRAYECTORIA = ("trayectoria_titulados", "fuga_a_destino")
+
+def dimensiones_trayectoria() -> dict:
+    """campo -> nombres ordenados por código, desde los datasets de dimensión (ver DIMENSIONES)."""
+    return {campo: cargar_dataset(nombre)["nombre"].to_numpy(dtype=object) for campo, nombre in DIMENSIONES.items()}
+
+def _constructor_dimension(campo: str) -> Callable:
+    return lambda: construir_dimension([cargar_dataset(fuente) for fuente in FUENTES_TRAYECTORIA], campo)
+
+#Datasets derivados de otros datasets (las dimensiones van antes que los CSR que las usan)
+CONSTRUCTORES = {
+    **{nombre: _constructor_dimension(campo) for campo, nombre in DIMENSIONES.items()},
+    "csr_titulados": lambda: construir_trayectoria_csr(
+        cargar_dataset("trayectoria_titulados").dropna(subset=["mrun", "año_titulacion_ecas"]),
+        columna_corte="año_titulacion_ecas",
+        dimensiones=dimensiones_trayectoria()
+    ),
+    "csr_desertores": lambda: construir_trayectoria_csr(cargar_dataset("fuga_a_destino"), dimensiones=dimensiones_trayectoria()),
+}
+
+REFRESCO_SEGUNDOS = int(os.environ.get("ECAS_REFRESCO_SEGUNDOS", 60))
+
+_datasets_cargados = {}
+
+#Versión activa: la que ven las requests nuevas. Cada request fija la suya al comenzar,
+#así un callback en curso termina con la misma versión aunque se publique otra.
+_SIN_INICIALIZAR = object()
+_version_activa = _SIN_INICIALIZAR
+_version_anterior = None
+_lock_version = threading.Lock()
+_version_request = contextvars.ContextVar("version_snapshot", default=_SIN_INICIALIZAR)
+
+_caches_por_version = []
+_precalentadores = []
+
+#Versiones
+def version_actual(directorio: Path = SNAPSHOT_DIR) -> Optional[str]:
+    """Lee el token de versión publicado (None si no hay snapshots)."""
+    try:
+        version = (Path(directorio) / ARCHIVO_VERSION).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+def version_activa() -> Optional[str]:
+    """Versión fijada por la request en curso o, si no hay, la versión activa del proceso."""
+    global _version_activa
+
+    version = _version_request.get()
+    if version is not _SIN_INICIALIZAR:
+        return version
+
+    if _version_activa is _SIN_INICIALIZAR:
+        with _lock_version:
+            if _version_activa is _SIN_INICIALIZAR:
+                _version_activa = version_actual()
+    return _version_activa
+
+def ruta_version(version: str, directorio: Path = SNAPSHOT_DIR) -> Path:
+    return Path(directorio) / version
+
+def _escribir_atomico(ruta: Path, contenido: str) -> None:
+    tmp = ruta.with_name(ruta.name + ".tmp")
+    tmp.write_text(contenido, encoding="utf-8")
+    os.replace(tmp, ruta)
+
+#DataFrames (Arrow IPC)
+def _es_mixta(serie: pd.Series) -> bool:
+    if serie.dtype != object:
+        return False
+    tipos = {type(v) for v in serie.dropna()}
+    return len(tipos) > 1
+
+def guardar_dataframe(df: pd.DataFrame, ruta: Path) -> None:
+    """
+    Guarda un DataFrame como Arrow IPC sin compresión (mapeable en memoria).
+    Conserva nombres de columna no-string (ej: cohortes como int) y columnas
+    de tipos mixtos (ej: 2010, ..., 'TOTAL GENERAL') codificándolas en JSON.
+    """
+    columnas = []
+    datos = {}
+    for i, col in enumerate(df.columns):
+        serie = df.iloc[:, i]
+        mixta = _es_mixta(serie)
+        columnas.append({
+            "nombre": col if isinstance(col, str) else int(col) if isinstance(col, (int, np.integer)) else str(col),
+            "mixta": mixta
+        })
+        datos[str(col)] = serie.map(json.dumps, na_action="ignore") if mixta else serie
+
+    tabla = pa.Table.from_pandas(pd.DataFrame(datos), preserve_index=False)
+    metadata = dict(tabla.schema.metadata or {})
+    metadata[b"ecas"] = json.dumps({"columnas": columnas}).encode("utf-8")
+    tabla = tabla.replace_schema_metadata(metadata)
+
+    with pa.OSFile(str(ruta), "wb") as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+
+def _mapeo_tipos():
+    # pandas >= 3 ya convierte los strings de Arrow sin copiarlos
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return None
+    tipo = pd.StringDtype("pyarrow_numpy")
+    return {pa.string(): tipo, pa.large_string(): tipo}.get
+
+def leer_dataframe(ruta: Path) -> pd.DataFrame:
+    """Abre un Arrow IPC con mmap; las columnas numéricas sin nulos no se copian."""
+    fuente = pa.memory_map(str(ruta), "r")
+    tabla = pa.ipc.open_file(fuente).read_all()
+
+    df = tabla.to_pandas(split_blocks=True, types_mapper=_mapeo_tipos())
+
+    metadata = (tabla.schema.metadata or {}).get(b"ecas")
+    if metadata:
+        columnas = json.loads(metadata)["columnas"]
+        for i, col in enumerate(columnas):
+            if col["mixta"]:
+                df.isetitem(i, df.iloc[:, i].map(json.loads, na_action="ignore").astype(object))
+        df.columns = [col["nombre"] for col in columnas]
+
+    return df
+
+#Trayectorias CSR (.npy por columna)
+def guardar_csr(csr: TrayectoriaCSR, ruta: Path) -> None:
+    ruta.mkdir(parents=True, exist_ok=True)
+    for campo in ("offsets", "estudiante", "anio", "nivel", "institucion", "area", "carrera", "tipo_inst"):
+        np.save(ruta / f"{campo}.npy", getattr(csr, campo))
+
+    etiquetas = {campo: [str(e) for e in valores] for campo, valores in csr.etiquetas.items()}
+    (ruta / "etiquetas.json").write_text(json.dumps(etiquetas, ensure_ascii=False), encoding="utf-8")
+
+    guardar_dataframe(csr.meta, ruta / "meta.arrow")
+
+def leer_csr(ruta: Path) -> TrayectoriaCSR:
+    """Abre un CSR con np.load(mmap_mode='r'): los arreglos se comparten entre procesos."""
+    campos = {
+        campo: np.load(ruta / f"{campo}.npy", mmap_mode="r")
+        for campo in ("offsets", "estudiante", "anio", "nivel", "institucion", "area", "carrera", "tipo_inst")
+    }
+    etiquetas = json.loads((ruta / "etiquetas.json").read_text(encoding="utf-8"))
+
+    return TrayectoriaCSR(
+        etiquetas={campo: np.asarray(valores, dtype=object) for campo, valores in etiquetas.items()},
+        meta=leer_dataframe(ruta / "meta.arrow"),
+        **campos
+    )
+
+#Lectura y publicación
+def ruta_snapshot(nombre: str, version: str, directorio: Path = SNAPSHOT_DIR) -> Optional[Path]:
+    base = ruta_version(version, directorio)
+    if (base / f"{nombre}.arrow").exists():
+        return base / f"{nombre}.arrow"
+    if (base / nombre / "offsets.npy").exists():
+        return base / nombre
+    return None
+
+def cargar_snapshot(nombre: str, version: Optional[str] = None, directorio: Path = SNAPSHOT_DIR):
+    """DataFrame o TrayectoriaCSR del snapshot indicado, o None si no existe."""
+    version = version or version_actual(directorio)
+    if version is None or not ARROW_DISPONIBLE:
+        return None
+
+    ruta = ruta_snapshot(nombre, version, directorio)
+    if ruta is None:
+        return None
+    if ruta.suffix == ".arrow":
+        return leer_dataframe(ruta)
+    return leer_csr(ruta)
+
+def cargar_dataset(nombre: str, construir: Optional[Callable] = None):
+    """
+    Devuelve un dataset compartido del proceso, en este orden:
+    1) snapshot publicado (mmap), 2) excel de origen, 3) construir() o CONSTRUCTORES.
+
+    Se carga una sola vez por versión. Los DataFrames se entregan como copia superficial:
+    no copian datos y, con copy-on-write, modificarlos no altera el dataset compartido.
+    """
+    version = version_activa()
+    clave = (version, nombre)
+
+    if clave not in _datasets_cargados:
+        objeto = cargar_snapshot(nombre, version) if version is not None else None
+
+        if objeto is None and nombre in FUENTES_EXCEL:
+            archivo, hoja = FUENTES_EXCEL[nombre]
+            objeto = pd.read_excel(archivo, sheet_name=hoja)
+        if objeto is None:
+            constructor = construir or CONSTRUCTORES.get(nombre)
+            if constructor is None:
+                raise KeyError(f"Dataset '{nombre}' no tiene snapshot ni fuente.")
+            objeto = constructor()
+
+        # Un resultado de respaldo (consulta vencida, ver conn_db.con_plazo) no queda fijo para la versión
+        if es_desactualizado(objeto):
+            return objeto
+        _datasets_cargados[clave] = objeto
+
+    objeto = _datasets_cargados[clave]
+    if isinstance(objeto, pd.DataFrame):
+        contar_filas(len(objeto))
+        return objeto.copy(deep=False)
+    if isinstance(objeto, TrayectoriaCSR):
+        contar_filas(objeto.n_eventos)
+    return objeto
+
+def datasets_disponibles(version: Optional[str] = None, directorio: Path = SNAPSHOT_DIR) -> list:
+    """Nombres de los datasets publicados en una versión."""
+    version = version or version_activa()
+    if version is None:
+        return []
+
+    base = ruta_version(version, directorio)
+    if not base.exists():
+        return []
+    return sorted(
+        ruta.stem if ruta.suffix == ".arrow" else ruta.name
+        for ruta in base.iterdir()
+        if ruta.suffix == ".arrow" or (ruta / "offsets.npy").exists()
+    )
+
+def precargar_datasets(nombres: Optional[list] = None) -> list:
+    """
+    Carga los datasets en el proceso actual. Pensado para el proceso maestro
+    (gunicorn preload_app): los workers heredan los objetos ya cargados tras el fork.
+    """
+    if nombres is None:
+        nombres = list(dict.fromkeys(list(FUENTES_EXCEL) + list(CONSTRUCTORES) + datasets_disponibles()))
+
+    for nombre in nombres:
+        cargar_dataset(nombre)
+
+    return nombres
+
+def publicar_snapshot(
+    datasets: dict,
+    version: Optional[str] = None,
+    directorio: Path = SNAPSHOT_DIR
+) -> str:
+    """
+    Escribe los datasets en una nueva carpeta de versión y luego actualiza
+    el token VERSION de forma atómica. Devuelve la versión publicada.
+    """
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    version = version or datetime.now().strftime("%Y%m%d%H%M%S")
+    destino = ruta_version(version, directorio)
+    tmp = directorio / f".{version}.tmp"
+
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir()
+
+    for nombre, objeto in datasets.items():
+        if isinstance(objeto, TrayectoriaCSR):
+            guardar_csr(objeto, tmp / nombre)
+        else:
+            guardar_dataframe(objeto, tmp / f"{nombre}.arrow")
+
+    if destino.exists():
+        shutil.rmtree(destino)
+    os.replace(tmp, destino)
+    _escribir_atomico(directorio / ARCHIVO_VERSION, version)
+
+    return version
+
+def agregar_a_version(datasets: dict, version: str, directorio: Path = SNAPSHOT_DIR) -> None:
+    """
+    Agrega DataFrames a una versión ya publicada (ej: resultados precalculados de KPIs).
+    Cada archivo se reemplaza de forma atómica; no cambia el token VERSION.
+    """
+    base = ruta_version(version, Path(directorio))
+    if not base.exists():
+        raise FileNotFoundError(f"No existe la versión '{version}' en {directorio}.")
+
+    for nombre, df in datasets.items():
+        tmp = base / f".{nombre}.arrow.tmp"
+        guardar_dataframe(df, tmp)
+        os.replace(tmp, base / f"{nombre}.arrow")
+
+#Caches invalidadas por versión
+def es_desactualizado(objeto) -> bool:
+    """True para los DataFrames de respaldo que devuelve un KPI cuando vence su plazo de consultas."""
+    return isinstance(objeto, pd.DataFrame) and bool(objeto.attrs.get("desactualizado"))
+
+def cache_por_version(funcion: Callable) -> Callable:
+    """
+    Memoiza una función según (versión de datos, argumentos). Al retirar una versión
+    se descartan sus entradas. Los DataFrames se devuelven como copia superficial.
+    """
+    cache = {}
+    _caches_por_version.append(cache)
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        clave = (version_activa(), args, tuple(sorted(kwargs.items())))
+        if clave not in cache:
+            resultado = funcion(*args, **kwargs)
+            if es_desactualizado(resultado):
+                return resultado
+            cache[clave] = resultado
+
+        resultado = cache[clave]
+        if isinstance(resultado, pd.DataFrame):
+            return resultado.copy(deep=False)
+        return resultado
+
+    envoltura.cache = cache
+    return envoltura
+
+def registrar_precalentador(funcion: Callable) -> Callable:
+    """Registra una función sin argumentos que se ejecuta con cada versión nueva antes de activarla."""
+    _precalentadores.append(funcion)
+    return funcion
+
+#Refresco en caliente
+def activar_version(version: str) -> None:
+    """
+    Carga y precalienta la versión indicada en segundo plano y luego la activa de forma
+    atómica. Las requests en curso siguen con su versión; se conserva solo la anterior.
+    """
+    global _version_activa, _version_anterior
+
+    token = _version_request.set(version)
+    try:
+        precargar_datasets()
+        for precalentar in _precalentadores:
+            precalentar()
+    finally:
+        _version_request.reset(token)
+
+    with _lock_version:
+        if _version_activa is not _SIN_INICIALIZAR:
+            _version_anterior = _version_activa
+        _version_activa = version
+
+    vigentes = {version, _version_anterior}
+    for clave in [c for c in list(_datasets_cargados) if c[0] not in vigentes]:
+        _datasets_cargados.pop(clave, None)
+    for cache in _caches_por_version:
+        for clave in [c for c in list(cache) if c[0] not in vigentes]:
+            cache.pop(clave, None)
+
+def revisar_version() -> bool:
+    """Activa la versión publicada si cambió. Devuelve True si hubo cambio."""
+    publicada = version_actual()
+    if publicada is None or publicada == version_activa():
+        return False
+
+    activar_version(publicada)
+    print(f"✔ Snapshot actualizado a la versión {publicada}")
+    return True
+
+def _bucle_refresco(intervalo: int, detener: threading.Event) -> None:
+    while not detener.wait(intervalo):
+        try:
+            revisar_version()
+        except Exception as e:
+            print(f"❌ ERROR al refrescar snapshot: {e}")
+
+def iniciar_refresco(intervalo: int = REFRESCO_SEGUNDOS) -> Optional[threading.Event]:
+    """
+    Inicia un hilo que revisa el token VERSION cada 'intervalo' segundos.
+    Debe llamarse en cada worker (los hilos no sobreviven al fork). 0 lo desactiva.
+    Devuelve el evento para detenerlo.
+    """
+    if intervalo <= 0:
+        return None
+
+    detener = threading.Event()
+    hilo = threading.Thread(
+        target=_bucle_refresco,
+        args=(intervalo, detener),
+        name="refresco-snapshots",
+        daemon=True
+    )
+    hilo.start()
+    return detener
+
+def fijar_version(version: Optional[str]):
+    """
+    Fija la versión de datos del contexto en curso, como hace cada request de Flask
+    (procesos batch, ej: el precálculo de KPIs). Devuelve el token del contextvar.
+    """
+    return _version_request.set(version)
+
+def registrar_version_por_request(server) -> None:
+    """Fija la versión de datos al inicio de cada request de Flask y la libera al terminar."""
+    from flask import g
+
+    @server.before_request
+    def _fijar_version():
+        g.token_version_snapshot = _version_request.set(version_activa())
+
+    @server.teardown_request
+    def _liberar_version(_error=None):
+        token = g.pop("token_version_snapshot", None)
+        if token is not None:
+            try:
+                _version_request.reset(token)
+            except ValueError:
+                # la request terminó en otro contexto; el contexto se descarta igual
+                pass
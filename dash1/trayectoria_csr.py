@@ -0,0 +1,444 @@
+#Representación compacta (CSR) de las trayectorias post-ECAS.
+#Cada estudiante ocupa un segmento [offsets[i], offsets[i+1]) dentro de arreglos planos y tipados,
+#de modo que las consultas típicas (primer evento tras un año, nivel máximo, n-ésimo evento...)
+#se resuelven con kernels de NumPy (o Numba, si está instalado) en vez de bucles por fila.
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    NUMBA_DISPONIBLE = True
+except ImportError:
+    NUMBA_DISPONIBLE = False
+
+#Columna de origen (formato " | " de los excel de trayectoria) -> campo del CSR
+CAMPOS_EVENTO = {
+    "anio_ingreso_destino": "anio",
+    "nivel_global": "nivel",
+    "institucion_destino": "institucion",
+    "area_conocimiento_destino": "area",
+    "carrera_destino": "carrera",
+    "tipo_inst_1": "tipo_inst",
+}
+
+CAMPOS_CATEGORICOS = ("nivel", "institucion", "area", "carrera", "tipo_inst")
+
+#Tablas de dimensión compartidas por los CSR (campo -> dataset con columnas codigo, nombre).
+#Con ellas los códigos de titulados y desertores son comparables y los KPIs agrupan por código;
+#los nombres se resuelven solo para las filas que se muestran.
+DIMENSIONES = {
+    "nivel": "dim_nivel",
+    "institucion": "dim_institucion",
+    "area": "dim_area",
+    "carrera": "dim_nombre_carrera",
+    "tipo_inst": "dim_tipo_inst",
+}
+
+#Columna de origen -> columna de la metadata por estudiante
+COLUMNAS_META = {
+    "mrun": "mrun",
+    "año_cohorte_ecas": "cohorte",
+    "gen_alu": "gen_alu",
+    "jornada": "jornada",
+    "rango_edad": "rango_edad",
+}
+
+ORDEN_NIVEL = {
+    'Pregrado': 1,
+    'Postítulo': 2,
+    'Postgrado': 3
+}
+
+@dataclass(frozen=True)
+class TrayectoriaCSR:
+    offsets: np.ndarray      # int64, n_estudiantes + 1
+    estudiante: np.ndarray   # int32, segmento al que pertenece cada evento
+    anio: np.ndarray         # int16, -1 si el año no es válido
+    nivel: np.ndarray        # int8, código -> etiquetas["nivel"]
+    institucion: np.ndarray  # int32
+    area: np.ndarray         # int16
+    carrera: np.ndarray      # int32
+    tipo_inst: np.ndarray    # int8
+    etiquetas: dict          # campo -> np.ndarray con el texto de cada código
+    meta: pd.DataFrame       # una fila por estudiante, alineada con los segmentos
+
+    @property
+    def n_estudiantes(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_eventos(self) -> int:
+        return int(self.offsets[-1])
+
+def _como_lista(x) -> list:
+    if isinstance(x, (list, tuple, np.ndarray)):
+        return [str(v).strip() for v in x]
+    if isinstance(x, str):
+        return [p.strip() for p in x.split("|") if p.strip() != ""]
+    return []
+
+def _tipo_codigo(n_categorias: int):
+    if n_categorias < np.iinfo(np.int8).max:
+        return np.int8
+    if n_categorias < np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+def construir_dimension(dfs: list, campo: str) -> pd.DataFrame:
+    """
+    Dimensión de un campo categórico: código entero (orden alfabético) -> nombre,
+    con todos los valores que aparecen en los dataframes de trayectorias indicados.
+    """
+    columna = next(col for col, c in CAMPOS_EVENTO.items() if c == campo)
+    valores = set()
+    for df in dfs:
+        if columna in df.columns:
+            for lista in df[columna].map(_como_lista):
+                valores.update(lista)
+
+    nombres = sorted(valores)
+    return pd.DataFrame({
+        "codigo": np.arange(len(nombres), dtype=_tipo_codigo(len(nombres))),
+        "nombre": pd.Series(nombres, dtype=object),
+    })
+
+def construir_trayectoria_csr(
+    df: pd.DataFrame,
+    columna_corte: Optional[str] = None,
+    dimensiones: Optional[dict] = None
+) -> TrayectoriaCSR:
+    """
+    Construye el CSR a partir de un dataframe de trayectorias (una fila por mrun),
+    con las columnas de eventos serializadas con " | " o como listas.
+
+    columna_corte: año de referencia por estudiante (ej: 'año_titulacion_ecas').
+    Si no se indica, el corte es -1 y todo evento con año válido queda "después".
+    dimensiones: campo -> nombres ordenados por código (ver DIMENSIONES). Los campos
+    con dimensión se codifican contra ella; el resto, con sus propios valores.
+    """
+    dimensiones = dimensiones or {}
+
+    df = df.dropna(subset=["mrun"]).reset_index(drop=True)
+    n = len(df)
+
+    listas = {}
+    for col in CAMPOS_EVENTO:
+        if col in df.columns:
+            listas[col] = df[col].map(_como_lista).tolist()
+        else:
+            listas[col] = [[] for _ in range(n)]
+
+    # Las columnas son paralelas: se recorta cada fila al largo común (igual que zip)
+    largos = np.array(
+        [min(len(listas[col][i]) for col in CAMPOS_EVENTO) for i in range(n)],
+        dtype=np.int64
+    )
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(largos, out=offsets[1:])
+
+    estudiante = np.repeat(np.arange(n, dtype=np.int32), largos)
+
+    planos = {
+        col: np.array(
+            [v for fila, k in zip(listas[col], largos) for v in fila[:k]],
+            dtype=object
+        )
+        for col in CAMPOS_EVENTO
+    }
+
+    anios = pd.Series(planos["anio_ingreso_destino"], dtype=object).astype(str)
+    anio = np.where(
+        anios.str.isdigit(),
+        pd.to_numeric(anios.where(anios.str.isdigit()), errors="coerce"),
+        -1
+    ).astype(np.int16)
+
+    campos = {"anio": anio}
+    etiquetas = {}
+    for col, campo in CAMPOS_EVENTO.items():
+        if campo == "anio":
+            continue
+        if campo in dimensiones:
+            uniques = np.asarray(dimensiones[campo], dtype=object)
+            codigos = pd.Index(uniques).get_indexer(planos[col])
+            if (codigos < 0).any():
+                faltantes = sorted(set(planos[col][codigos < 0]))[:5]
+                raise ValueError(f"Valores de '{campo}' sin código en la dimensión: {faltantes}")
+        else:
+            codigos, uniques = pd.factorize(planos[col], sort=True)
+        campos[campo] = codigos.astype(_tipo_codigo(len(uniques)))
+        etiquetas[campo] = np.asarray(uniques, dtype=object)
+
+    # Orden cronológico estable dentro de cada estudiante
+    orden = np.lexsort((campos["anio"], estudiante))
+    campos = {k: v[orden] for k, v in campos.items()}
+
+    meta = pd.DataFrame({
+        destino: df[origen].to_numpy() if origen in df.columns else np.full(n, np.nan)
+        for origen, destino in COLUMNAS_META.items()
+    })
+    meta["mrun"] = pd.to_numeric(meta["mrun"], errors="coerce").astype(np.int64)
+    meta["cohorte"] = pd.to_numeric(meta["cohorte"], errors="coerce")
+
+    if columna_corte is not None:
+        meta["anio_corte"] = pd.to_numeric(df[columna_corte], errors="coerce").fillna(-1).to_numpy()
+    else:
+        meta["anio_corte"] = -1
+
+    return TrayectoriaCSR(
+        offsets=offsets,
+        estudiante=estudiante,
+        etiquetas=etiquetas,
+        meta=meta,
+        **campos
+    )
+
+#Utilidades de máscaras y decodificación
+def decodificar(csr: TrayectoriaCSR, campo: str, codigos: np.ndarray) -> np.ndarray:
+    if campo == "anio":
+        return codigos
+    return csr.etiquetas[campo][codigos]
+
+def mascara_estudiantes_a_eventos(csr: TrayectoriaCSR, seleccion: np.ndarray) -> np.ndarray:
+    """Expande una máscara booleana por estudiante a una máscara por evento."""
+    return seleccion[csr.estudiante]
+
+def mascara_posterior(
+    csr: TrayectoriaCSR,
+    corte: Optional[np.ndarray] = None,
+    estricto: bool = True
+) -> np.ndarray:
+    """
+    Eventos con año válido posteriores al corte de su estudiante
+    (por defecto, la columna de corte de la metadata).
+    """
+    if corte is None:
+        corte = csr.meta["anio_corte"].to_numpy()
+    corte_evento = np.asarray(corte)[csr.estudiante]
+
+    validos = csr.anio >= 0
+    if estricto:
+        return validos & (csr.anio > corte_evento)
+    return validos & (csr.anio >= corte_evento)
+
+#Índices bitmap de filtros por estudiante.
+#Cada valor de una dimensión de filtro tiene un bitmap (bits empaquetados, un bit por fila en el
+#orden de la metadata). Una combinación de filtros se resuelve con OR entre los valores elegidos
+#de una dimensión y AND entre dimensiones, sin volver a comparar columnas de texto.
+DIMENSIONES_FILTRO = ("cohorte", "jornada", "gen_alu", "rango_edad")
+
+@dataclass(frozen=True)
+class IndiceBitmaps:
+    n_filas: int
+    bitmaps: dict            # dimensión -> {valor: np.ndarray uint8 con los bits empaquetados}
+
+def construir_indice_bitmaps(meta: pd.DataFrame, dimensiones: tuple = DIMENSIONES_FILTRO) -> IndiceBitmaps:
+    """Bitmaps por valor de cada dimensión presente en 'meta' (los nulos no entran en ningún bitmap)."""
+    bitmaps = {}
+    for dimension in dimensiones:
+        if dimension not in meta.columns:
+            continue
+        codigos, valores = pd.factorize(meta[dimension])
+        bitmaps[dimension] = {
+            (v.item() if isinstance(v, np.generic) else v): np.packbits(codigos == k)
+            for k, v in enumerate(valores)
+        }
+    return IndiceBitmaps(n_filas=len(meta), bitmaps=bitmaps)
+
+def seleccionar_bitmaps(indice: IndiceBitmaps, **filtros) -> np.ndarray:
+    """
+    Máscara booleana por fila para filtros dimensión=valor o dimensión=[valores]
+    (None o lista vacía = sin filtro). Un valor sin bitmap no selecciona filas.
+    """
+    vacio = np.zeros((indice.n_filas + 7) // 8, dtype=np.uint8)
+    bits = None
+
+    for dimension, valores in filtros.items():
+        if valores is None:
+            continue
+        if not isinstance(valores, (list, tuple)):
+            valores = [valores]
+        elif not valores:
+            continue
+
+        por_valor = indice.bitmaps.get(dimension, {})
+        elegidos = np.bitwise_or.reduce([por_valor.get(v, vacio) for v in valores])
+        bits = elegidos if bits is None else bits & elegidos
+
+    if bits is None:
+        return np.ones(indice.n_filas, dtype=bool)
+    return np.unpackbits(bits, count=indice.n_filas).astype(bool)
+
+def rango_nivel(csr: TrayectoriaCSR, orden: dict = ORDEN_NIVEL) -> np.ndarray:
+    """Rango ordinal del nivel de cada evento (0 si el nivel no está en el orden)."""
+    por_codigo = np.array([orden.get(e, 0) for e in csr.etiquetas["nivel"]], dtype=np.int8)
+    if len(por_codigo) == 0:
+        return np.zeros(csr.n_eventos, dtype=np.int8)
+    return por_codigo[csr.nivel]
+
+#Kernels
+def _primeros_por_segmento(posiciones: np.ndarray, segmentos: np.ndarray, n: int) -> np.ndarray:
+    salida = np.full(n, -1, dtype=np.int64)
+    if len(posiciones) == 0:
+        return salida
+    es_primero = np.r_[True, segmentos[1:] != segmentos[:-1]]
+    salida[segmentos[es_primero]] = posiciones[es_primero]
+    return salida
+
+if NUMBA_DISPONIBLE:
+    @njit(cache=True)
+    def _evento_n_numba(offsets, mascara, n_objetivo):
+        salida = np.full(len(offsets) - 1, -1, dtype=np.int64)
+        for i in range(len(offsets) - 1):
+            k = 0
+            for j in range(offsets[i], offsets[i + 1]):
+                if mascara[j]:
+                    if k == n_objetivo:
+                        salida[i] = j
+                        break
+                    k += 1
+        return salida
+
+def evento_n(csr: TrayectoriaCSR, n: int, mascara: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Índice (en los arreglos planos) del n-ésimo evento (0 = primero) de cada estudiante,
+    en orden cronológico y considerando solo los eventos de la máscara. -1 si no existe.
+    """
+    if mascara is None:
+        mascara = np.ones(csr.n_eventos, dtype=bool)
+
+    if NUMBA_DISPONIBLE:
+        return _evento_n_numba(csr.offsets, mascara, n)
+
+    posiciones = np.flatnonzero(mascara)
+    segmentos = csr.estudiante[posiciones]
+
+    if n == 0:
+        return _primeros_por_segmento(posiciones, segmentos, csr.n_estudiantes)
+
+    # rango de cada evento válido dentro de su segmento
+    inicio = np.r_[True, segmentos[1:] != segmentos[:-1]] if len(posiciones) else np.array([], dtype=bool)
+    idx_inicio = np.maximum.accumulate(np.where(inicio, np.arange(len(posiciones)), 0))
+    rango = np.arange(len(posiciones)) - idx_inicio
+
+    salida = np.full(csr.n_estudiantes, -1, dtype=np.int64)
+    sel = rango == n
+    salida[segmentos[sel]] = posiciones[sel]
+    return salida
+
+def primer_evento(csr: TrayectoriaCSR, mascara: Optional[np.ndarray] = None) -> np.ndarray:
+    return evento_n(csr, 0, mascara)
+
+def primer_evento_posterior(
+    csr: TrayectoriaCSR,
+    corte: Optional[np.ndarray] = None,
+    estricto: bool = True,
+    mascara: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Primer evento de cada estudiante posterior a su año de corte."""
+    m = mascara_posterior(csr, corte, estricto)
+    if mascara is not None:
+        m &= mascara
+    return primer_evento(csr, m)
+
+def nivel_maximo(
+    csr: TrayectoriaCSR,
+    mascara: Optional[np.ndarray] = None,
+    orden: dict = ORDEN_NIVEL
+) -> np.ndarray:
+    """
+    Índice del evento con el nivel más alto de cada estudiante (según 'orden').
+    En caso de empate gana el primero cronológicamente. -1 si no hay eventos.
+    """
+    if mascara is None:
+        mascara = np.ones(csr.n_eventos, dtype=bool)
+
+    posiciones = np.flatnonzero(mascara)
+    segmentos = csr.estudiante[posiciones]
+    rangos = rango_nivel(csr, orden)[posiciones]
+
+    orden_eventos = np.lexsort((posiciones, -rangos.astype(np.int16), segmentos))
+    return _primeros_por_segmento(posiciones[orden_eventos], segmentos[orden_eventos], csr.n_estudiantes)
+
+def eventos_por_nivel(csr: TrayectoriaCSR, mascara: Optional[np.ndarray] = None) -> np.ndarray:
+    """Matriz (n_estudiantes x n_niveles) con la cantidad de eventos por nivel."""
+    if mascara is None:
+        mascara = np.ones(csr.n_eventos, dtype=bool)
+
+    k = max(len(csr.etiquetas["nivel"]), 1)
+    claves = csr.estudiante[mascara].astype(np.int64) * k + csr.nivel[mascara]
+    conteo = np.bincount(claves, minlength=csr.n_estudiantes * k)
+    return conteo.reshape(csr.n_estudiantes, k)
+
+def alguno_por_estudiante(csr: TrayectoriaCSR, mascara: np.ndarray) -> np.ndarray:
+    """True para los estudiantes que tienen al menos un evento en la máscara."""
+    return np.bincount(csr.estudiante[mascara], minlength=csr.n_estudiantes) > 0
+
+def codigos_evento(
+    csr: TrayectoriaCSR,
+    campo: str,
+    indices: np.ndarray,
+    etiquetas: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Códigos de 'campo' de los eventos indicados (se ignoran los -1). Con 'etiquetas'
+    (ej: la dimensión compartida) se expresan en esa lista si el CSR usa otros códigos,
+    como los CSR de snapshots publicados antes de las dimensiones.
+    """
+    indices = np.asarray(indices)
+    codigos = getattr(csr, campo)[indices[indices >= 0]]
+    if etiquetas is None or campo == "anio":
+        return codigos
+
+    propias = csr.etiquetas[campo]
+    if propias is etiquetas or (len(propias) == len(etiquetas) and np.array_equal(propias, etiquetas)):
+        return codigos
+    return pd.Index(etiquetas).get_indexer(propias)[codigos]
+
+def conteo_por_codigo(
+    codigos: np.ndarray,
+    etiquetas: Optional[np.ndarray] = None,
+    top_n: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Cantidad por código, de mayor a menor (empates por código). Se agrupa sobre los enteros
+    y solo se decodifican las filas devueltas. Sin etiquetas (ej: años) el código es el valor.
+    """
+    codigos = np.asarray(codigos)
+    if etiquetas is None:
+        etiquetas, conteo = np.unique(codigos, return_counts=True)
+    else:
+        conteo = np.bincount(codigos.astype(np.int64), minlength=len(etiquetas))
+
+    orden = np.flatnonzero(conteo)
+    orden = orden[np.argsort(-conteo[orden], kind="stable")]
+    if top_n is not None:
+        orden = orden[:top_n]
+
+    return pd.DataFrame({
+        "codigo": orden,
+        "valor": np.asarray(etiquetas)[orden],
+        "cantidad": conteo[orden],
+    })
+
+def eventos_a_dataframe(
+    csr: TrayectoriaCSR,
+    indices: np.ndarray,
+    campos: tuple = ("anio", "nivel")
+) -> pd.DataFrame:
+    """
+    Materializa los eventos indicados (índices planos; se ignoran los -1)
+    junto a la metadata de su estudiante.
+    """
+    indices = np.asarray(indices)
+    indices = indices[indices >= 0]
+    est = csr.estudiante[indices]
+
+    df = csr.meta.iloc[est].reset_index(drop=True)
+    for campo in campos:
+        df[campo] = decodificar(csr, campo, getattr(csr, campo)[indices])
+
+    return df
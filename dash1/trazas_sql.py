@@ -0,0 +1,204 @@
+#Trazas de ejecución SQL: por cada consulta de leer_sql se registra la huella (consulta sin literales),
+#los parámetros, el tiempo hasta la primera fila, el tiempo total de lectura, filas, bytes y
+#opcionalmente el plan estimado (EXPLAIN en bases locales, SHOWPLAN_TEXT en SQL Server).
+#Se activa con variables de entorno:
+#   ECAS_TRAZA_SQL=trazas_sql.jsonl   archivo de log (una línea JSON por consulta)
+#   ECAS_TRAZA_PLAN=1                 captura también el plan estimado (una consulta extra por ejecución)
+#Resumen por huella:
+#   python dash1/trazas_sql.py [--log trazas_sql.jsonl] [--top 20] [--orden total|max|primera_fila]
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+
+RUTA_LOG = os.environ.get("ECAS_TRAZA_SQL") or None
+CAPTURAR_PLAN = os.environ.get("ECAS_TRAZA_PLAN", "0") == "1"
+LARGO_MAX_PARAMETRO = 200
+
+_lock = threading.Lock()
+
+_RE_COMENTARIO = re.compile(r"--[^\n]*")
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w#.])\d+(?:\.\d+)?\b")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+def huella_sql(sql: str) -> tuple[str, str, list]:
+    """
+    Normaliza la consulta reemplazando literales por '?' (las consultas arman sus filtros con f-strings).
+    Devuelve (hash corto, consulta normalizada, literales encontrados en orden).
+    """
+    sql = _RE_COMENTARIO.sub("", sql)
+    literales = []
+
+    def _extraer(m):
+        literales.append(m.group(0))
+        return "?"
+
+    normalizada = _RE_TEXTO.sub(_extraer, sql)
+    normalizada = _RE_NUMERO.sub(_extraer, normalizada)
+    normalizada = _RE_LISTA.sub("(?)", normalizada)
+    normalizada = _RE_ESPACIOS.sub(" ", normalizada).strip()
+    return hashlib.sha1(normalizada.encode("utf-8")).hexdigest()[:12], normalizada, literales
+
+def _origen() -> str:
+    """Primera función fuera de la capa de conexión en la pila (ej: queries.get_continuidad_per_year)."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        modulo = frame.f_globals.get("__name__", "")
+        if modulo not in (__name__, "conn_db"):
+            return f"{modulo}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "desconocido"
+
+def capturar_plan(sql: str, engine) -> str:
+    """Plan estimado de la consulta ya traducida al dialecto del engine (sin ejecutarla)."""
+    dialecto = engine.dialect.name
+    try:
+        with engine.connect() as connection:
+            if dialecto == "mssql":
+                connection.exec_driver_sql("SET SHOWPLAN_TEXT ON")
+                try:
+                    filas = connection.exec_driver_sql(sql).fetchall()
+                finally:
+                    connection.exec_driver_sql("SET SHOWPLAN_TEXT OFF")
+            elif dialecto == "sqlite":
+                filas = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            else:
+                filas = connection.exec_driver_sql(f"EXPLAIN {sql}").fetchall()
+        return "\n".join(str(fila[-1]) for fila in filas)
+    except Exception as e:
+        return f"(sin plan: {type(e).__name__}: {e})"
+
+def _escribir_log(registro: dict, ruta: str) -> None:
+    linea = json.dumps(registro, ensure_ascii=False, default=str)
+    with _lock:
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+def ejecutar_con_traza(
+    sql_original: str,
+    sql: str,
+    engine,
+    params=None,
+    ruta_log: str | None = None,
+    plan: bool | None = None,
+    conexion=None
+) -> pd.DataFrame:
+    """
+    Ejecuta la consulta (ya traducida) y registra su traza en el log.
+    sql_original es la consulta en T-SQL, así la huella es la misma en todos los backends.
+    Con 'conexion' se ejecuta en esa conexión abierta (la que vigila el plazo de leer_sql).
+    """
+    ruta_log = ruta_log or RUTA_LOG
+    plan = CAPTURAR_PLAN if plan is None else plan
+    huella, normalizada, literales = huella_sql(sql_original)
+
+    registro = {
+        "fecha": datetime.now().isoformat(timespec="milliseconds"),
+        "huella": huella,
+        "origen": _origen(),
+        "dialecto": engine.dialect.name,
+        "parametros": params,
+        "literales": [l[:LARGO_MAX_PARAMETRO] for l in literales],
+        "pid": os.getpid(),
+    }
+
+    inicio = time.perf_counter()
+    try:
+        with (contextlib.nullcontext(conexion) if conexion is not None else engine.connect()) as connection:
+            resultado = connection.exec_driver_sql(sql, params) if params else connection.exec_driver_sql(sql)
+            registro["ejecucion_s"] = time.perf_counter() - inicio
+
+            filas = resultado.fetchmany(1)
+            registro["primera_fila_s"] = time.perf_counter() - inicio
+            filas += resultado.fetchall()
+            columnas = list(resultado.keys())
+
+        df = pd.DataFrame.from_records(filas, columns=columnas, coerce_float=True)
+        registro["total_s"] = time.perf_counter() - inicio
+        registro["filas"] = len(df)
+        registro["bytes"] = int(df.memory_usage(deep=True).sum())
+    except Exception as e:
+        registro["total_s"] = time.perf_counter() - inicio
+        registro["error"] = f"{type(e).__name__}: {e}"
+        registro["consulta"] = normalizada
+        if ruta_log:
+            _escribir_log(registro, ruta_log)
+        raise
+
+    registro["consulta"] = normalizada
+    if plan:
+        registro["plan"] = capturar_plan(sql, engine)
+    if ruta_log:
+        _escribir_log(registro, ruta_log)
+    return df
+
+def leer_trazas(ruta: str) -> pd.DataFrame:
+    with open(ruta, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(linea) for linea in f if linea.strip()])
+
+def resumen_trazas(ruta: str, top: int = 20, orden: str = "total") -> pd.DataFrame:
+    """Agrega las trazas por huella: ejecuciones, tiempos (total, mediana, máximo, primera fila), filas y bytes."""
+    trazas = leer_trazas(ruta)
+    if trazas.empty:
+        return trazas
+
+    for columna in ("primera_fila_s", "filas", "bytes", "error"):
+        if columna not in trazas.columns:
+            trazas[columna] = None
+
+    resumen = (
+        trazas.groupby("huella")
+        .agg(
+            origen=("origen", "first"),
+            ejecuciones=("huella", "size"),
+            errores=("error", "count"),
+            total_s=("total_s", "sum"),
+            mediana_s=("total_s", "median"),
+            max_s=("total_s", "max"),
+            primera_fila_s=("primera_fila_s", "median"),
+            filas=("filas", "median"),
+            bytes=("bytes", "median"),
+            consulta=("consulta", "first"),
+        )
+        .reset_index()
+    )
+    columna_orden = {"total": "total_s", "max": "max_s", "primera_fila": "primera_fila_s"}[orden]
+    return resumen.sort_values(columna_orden, ascending=False).head(top).reset_index(drop=True)
+
+def imprimir_resumen(resumen: pd.DataFrame, ruta: str) -> None:
+    trazas = leer_trazas(ruta)
+    print(f"{len(trazas)} consultas, {trazas['total_s'].sum():.3f} s en total")
+    print(f"{'huella':<13} {'origen':<50} {'n':>5} {'total s':>9} {'med s':>8} {'máx s':>8} {'1ª fila':>8} {'filas':>10} {'MB':>8}")
+    for r in resumen.itertuples():
+        mb = (r.bytes or 0) / 1024 ** 2
+        print(
+            f"{r.huella:<13} {r.origen[:50]:<50} {r.ejecuciones:>5} {r.total_s:>9.3f} {r.mediana_s:>8.3f} "
+            f"{r.max_s:>8.3f} {r.primera_fila_s or 0:>8.3f} {int(r.filas or 0):>10} {mb:>8.2f}"
+        )
+
+    # Plan de la ejecución más lenta de cada huella, si se capturó
+    if "plan" in trazas.columns:
+        for huella in resumen["huella"]:
+            lentas = trazas[(trazas["huella"] == huella) & trazas["plan"].notna()]
+            if not lentas.empty:
+                fila = lentas.loc[lentas["total_s"].idxmax()]
+                print(f"\n--- Plan {huella} ({fila['origen']}, {fila['total_s']:.3f} s) ---\n{fila['plan']}")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Resumen de las trazas SQL por huella de consulta.")
+    parser.add_argument("--log", default=RUTA_LOG or "trazas_sql.jsonl")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--orden", choices=["total", "max", "primera_fila"], default="total")
+    args = parser.parse_args()
+
+    imprimir_resumen(resumen_trazas(args.log, args.top, args.orden), args.log)
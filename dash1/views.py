@@ -1,6 +1,7 @@
 #Archivo para la creación de vistas, como la vista unificada.
 
 from conn_db import get_db_engine
+from dialecto_sql import traducir_sql
 from sqlalchemy import text
 
 #Metodo para obtener los nombres de las tablas que utilizaremos.
@@ -101,6 +102,46 @@ def create_derived_view(view_name: str, select_sql: str):
     except Exception as e:
         return False, f"❌ ERROR al crear la vista '{view_name}': {e}"
 
+#Tablas de dimensión
+def create_dimension_table(table_name: str, select_sql: str, indices: dict, engine=None):
+    """
+    Crea o reemplaza una tabla materializada a partir de select_sql (escrito en T-SQL) y sus índices
+    ({nombre_indice: columnas}). En las bases locales la consulta se traduce con dialecto_sql.
+    """
+    engine = engine or get_db_engine()
+    if not engine:
+        return False, "❌ Error de conexión a la DB."
+
+    dialecto = engine.dialect.name
+    if dialecto == "mssql":
+        drop_query = f"""
+        IF OBJECT_ID('dbo.{table_name}', 'U') IS NOT NULL
+            DROP TABLE dbo.{table_name};
+        """
+        create_query = f"""
+        SELECT * INTO dbo.{table_name}
+        FROM ({select_sql}) AS dimension;
+        """
+    else:
+        drop_query = f"DROP TABLE IF EXISTS {table_name}"
+        create_query = f"CREATE TABLE {table_name} AS {traducir_sql(select_sql, dialecto)}"
+
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(drop_query))
+            connection.execute(text(create_query))
+            for index_name, columns in indices.items():
+                connection.execute(text(f"CREATE INDEX {index_name} ON {'dbo.' if dialecto == 'mssql' else ''}{table_name} ({columns})"))
+            # SQLite no tiene estadísticas automáticas: sin ellas recorre la matrícula una vez por carrera
+            if dialecto == "sqlite":
+                connection.execute(text(f"ANALYZE {table_name}"))
+            connection.commit()
+
+        return True, f"✅ Tabla '{table_name}' creada con {len(indices)} índices."
+
+    except Exception as e:
+        return False, f"❌ ERROR al crear la tabla '{table_name}': {e}"
+
 #Bloque de ejecución
 
 consulta_matricula = """ 
@@ -205,11 +246,42 @@ FROM dbo.vista_titulados_unificada
 WHERE fecha_obtencion_titulo IS NOT NULL
 """
 
-success, message = create_unified_view("matricula", consulta_matricula)
-print(message)
+#Dimensión de carreras: una fila por codigo_unico (institución-sede-carrera-jornada) y nombre de
+#carrera con el flag es_auditoria, para filtrar la competencia con un join indexado en vez de recorrer
+#toda la matrícula con nomb_carrera LIKE '%AUDITOR%'. Va por par (codigo_unico, nomb_carrera) porque el
+#nombre de una oferta puede cambiar entre años: así el flag es el mismo que daría el LIKE en cada fila.
+#Un codigo_unico nulo queda como NULL y las consultas lo igualan con IS NULL en el join: así la columna de
+#la vista no pasa por ninguna función y el motor puede buscar en ella desde las pocas filas es_auditoria = 1
+#(índice ix_dim_carrera_auditoria). Duración y región no van aquí: también cambian entre años y se
+#filtran por fila en las consultas.
+sql_dim_carrera = """
+SELECT
+    codigo_unico,
+    nomb_carrera,
+    MAX(cod_carrera) AS cod_carrera,
+    MAX(cod_inst) AS cod_inst,
+    CASE WHEN nomb_carrera LIKE '%AUDITOR%' THEN 1 ELSE 0 END AS es_auditoria
+FROM dbo.vista_matricula_unificada
+WHERE nomb_carrera IS NOT NULL
+GROUP BY codigo_unico, nomb_carrera
+"""
+
+indices_dim_carrera = {
+    "ix_dim_carrera_codigo_unico": "codigo_unico, nomb_carrera",
+    "ix_dim_carrera_cod_carrera": "cod_carrera",
+    "ix_dim_carrera_auditoria": "es_auditoria, codigo_unico, nomb_carrera",
+}
+
+if __name__ == "__main__":
+
+    success, message = create_unified_view("matricula", consulta_matricula)
+    print(message)
+
+    success, message = create_unified_view("titulados", consulta_titulados)
+    print(message)
 
-success, message = create_unified_view("titulados", consulta_titulados)
-print(message)
+    successs, message = create_derived_view("vista_titulados_unificada_limpia", sql_vista_titulados_limpia)
+    print(message)
 
-successs, message = create_derived_view("vista_titulados_unificada_limpia", sql_vista_titulados_limpia)
-print(message)
\ No newline at end of file
+    success, message = create_dimension_table("dim_carrera", sql_dim_carrera, indices_dim_carrera)
+    print(message)
@@ -0,0 +1,23 @@
+#Punto de entrada WSGI del dashboard de deserción (dashboard.py).
+#Uso: gunicorn -c gunicorn.conf.py dash1.wsgi:server
+import sys
+from pathlib import Path
+
+DASH1_DIR = Path(__file__).resolve().parent
+if str(DASH1_DIR) not in sys.path:
+    sys.path.insert(0, str(DASH1_DIR))
+
+from snapshots import precargar_datasets
+
+def crear_app():
+    """
+    Precarga los snapshots y construye la app. Con preload_app=True se ejecuta una
+    sola vez en el proceso maestro y los workers comparten los datos tras el fork.
+    """
+    precargar_datasets()
+
+    import dashboard
+    return dashboard.app
+
+app = crear_app()
+server = app.server
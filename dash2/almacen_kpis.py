@@ -0,0 +1,108 @@
+#Almacén de resultados precalculados de los KPIs de dash2 (ver precalcular_kpis.py).
+#Los resultados se guardan en la versión de snapshot de los datos con que se calcularon:
+#   kpi_<función>: los resultados de todas las combinaciones de filtros, uno tras otro, con su 'clave'
+#   kpi_claves:    kpi, clave, filas [inicio, fin) en kpi_<función> y columnas del resultado
+#Los KPIs decorados con @precalculado responden con un corte de su tabla si la combinación
+#está en el almacén; si no (o si se pide un motor explícito) se calculan como siempre.
+import functools
+import inspect
+import json
+
+import numpy as np
+import pandas as pd
+
+from snapshots import cargar_dataset, cache_por_version, ruta_snapshot, version_activa
+
+PREFIJO = "kpi_"
+INDICE = "kpi_claves"
+
+def nombre_dataset(kpi: str) -> str:
+    return f"{PREFIJO}{kpi}"
+
+def _normalizar(valor):
+    # Filtros equivalentes comparten clave: [x] filtra igual que x y [] igual que None
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, (list, tuple)):
+        valores = sorted(str(v) for v in valor)
+        return None if not valores else valores[0] if len(valores) == 1 else valores
+    return valor
+
+def _clave(firma: inspect.Signature, args: tuple, kwargs: dict) -> str:
+    parametros = firma.bind(*args, **kwargs)
+    parametros.apply_defaults()
+    valores = {k: _normalizar(v) for k, v in parametros.arguments.items() if k != "motor"}
+    return json.dumps(valores, sort_keys=True, ensure_ascii=False, default=str)
+
+def clave_kpi(funcion, *args, **kwargs) -> str:
+    """Clave de una llamada: sus argumentos (con defaults, sin 'motor') normalizados como JSON."""
+    return _clave(inspect.signature(funcion), args, kwargs)
+
+def tabla_almacen(resultados: dict) -> dict:
+    """
+    Arma los datasets del almacén a partir de {kpi: [(clave, DataFrame), ...]}.
+    Devuelve {nombre_dataset: DataFrame} con la tabla de cada KPI y el índice.
+    """
+    datasets, indice = {}, []
+    for kpi, pares in resultados.items():
+        partes, inicio = [], 0
+        for clave, df in sorted(pares, key=lambda par: par[0]):
+            df = df.reset_index(drop=True)
+            indice.append({
+                "kpi": kpi,
+                "clave": clave,
+                "inicio": inicio,
+                "fin": inicio + len(df),
+                "columnas": json.dumps([str(c) for c in df.columns], ensure_ascii=False),
+            })
+            if len(df):
+                partes.append(df.assign(clave=clave))
+            inicio += len(df)
+
+        datasets[nombre_dataset(kpi)] = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame({"clave": []})
+
+    datasets[INDICE] = pd.DataFrame(indice, columns=["kpi", "clave", "inicio", "fin", "columnas"])
+    return datasets
+
+@cache_por_version
+def _indice() -> dict:
+    df = cargar_dataset(INDICE)
+    return {
+        (kpi, clave): (int(inicio), int(fin), json.loads(columnas))
+        for kpi, clave, inicio, fin, columnas in df[["kpi", "clave", "inicio", "fin", "columnas"]].itertuples(index=False)
+    }
+
+def buscar_resultado(kpi: str, clave: str):
+    """Resultado precalculado de la versión activa, o None si no está en el almacén."""
+    version = version_activa()
+    # El almacén se agrega después de publicar la versión: mientras no exista no se cachea nada
+    if version is None or ruta_snapshot(INDICE, version) is None:
+        return None
+
+    ubicacion = _indice().get((kpi, clave))
+    if ubicacion is None:
+        return None
+
+    inicio, fin, columnas = ubicacion
+    if inicio == fin:
+        return pd.DataFrame(columns=columnas)
+
+    df = cargar_dataset(nombre_dataset(kpi)).iloc[inicio:fin]
+    return df[columnas].reset_index(drop=True)
+
+def precalculado(funcion):
+    """Consulta el almacén antes de calcular el KPI (salvo que se pida un motor explícito)."""
+    kpi = funcion.__name__
+    firma = inspect.signature(funcion)
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if firma.bind_partial(*args, **kwargs).arguments.get("motor") is None:
+            resultado = buscar_resultado(kpi, _clave(firma, args, kwargs))
+            if resultado is not None:
+                return resultado
+        return funcion(*args, **kwargs)
+
+    return envoltura
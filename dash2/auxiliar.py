@@ -1,10 +1,29 @@
 from typing import Optional, Literal
+import importlib.util
+import os
+import sys
+import numpy as np
 import pandas as pd 
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DASH1_DIR = BASE_DIR / "dash1"
 
+if str(DASH1_DIR) not in sys.path:
+    sys.path.append(str(DASH1_DIR))
+
+from trayectoria_csr import *
+from snapshots import cargar_dataset, dimensiones_trayectoria, cache_por_version
+from almacen_kpis import precalculado
+from conjuntos_mrun import conjunto_mrun, pertenece, clave_mrun_anio
+
+#Motor de ejecución de los KPIs: "pandas" (por defecto) o "duckdb" (ver motor_duckdb.py)
+MOTOR_KPI = os.environ.get("ECAS_MOTOR_KPI", "pandas").lower()
+
+if MOTOR_KPI == "duckdb" and importlib.util.find_spec("duckdb") is None:
+    print("⚠ ECAS_MOTOR_KPI=duckdb pero duckdb no está instalado; se usa pandas.")
+    MOTOR_KPI = "pandas"
+
 FILE_TRAYECTORIA = "trayectoria_post_ecas.xlsx"
 FILE_DESTINO = DASH1_DIR / "fuga_a_destino_todas_cohortes.xlsx"
 FILE_ABANDONO = DASH1_DIR / "abandono_total_todas_cohortes.xlsx"
@@ -37,64 +56,176 @@ def clasificar_nivel_post(nivel: str) -> dict:
         )
     }
 
-def construir_universo_ex_ecas(anio_n: Optional[int] = None) -> pd.DataFrame:
+def flags_niveles(csr: TrayectoriaCSR) -> dict:
+    """
+    Aplica clasificar_nivel_post una sola vez por etiqueta de nivel
+    y devuelve, por flag, una máscara booleana por evento.
+    """
+    etiquetas = csr.etiquetas["nivel"]
+    flags = {}
+    for flag in ("pregrado", "postitulo", "postgrado"):
+        por_codigo = np.array(
+            [clasificar_nivel_post(e).get(flag, False) for e in etiquetas],
+            dtype=bool
+        )
+        flags[flag] = por_codigo[csr.nivel] if len(por_codigo) else np.zeros(csr.n_eventos, dtype=bool)
+    return flags
+
+@cache_por_version
+def indice_estudiantes(origen: Literal["titulados", "desertores"]) -> IndiceBitmaps:
+    """Bitmaps de los filtros de perfil sobre los estudiantes del CSR del origen (orden de su metadata)."""
+    return construir_indice_bitmaps(cargar_trayectoria_csr(origen).meta)
+
+def seleccionar_estudiantes(
+    origen: Literal["titulados", "desertores"],
+    cohorte_n: Optional[int] = None,
+    jornada: Optional[str] = None,
+    gen_alu: Optional[str] = None,
+    rango_edad: Optional[str | list] = None
+) -> np.ndarray:
+    """Máscara booleana por estudiante del CSR del origen según los filtros de perfil (None = sin filtro)."""
+    return seleccionar_bitmaps(
+        indice_estudiantes(origen),
+        cohorte=cohorte_n,
+        jornada=jornada,
+        gen_alu=gen_alu,
+        rango_edad=rango_edad or None
+    )
+
+def motor_kpi(motor: Optional[str] = None) -> str:
+    """Motor a usar en un KPI: el indicado en la llamada o el del despliegue."""
+    return (motor or MOTOR_KPI).lower()
+
+def cargar_trayectoria_csr(origen: Literal["titulados", "desertores"]) -> TrayectoriaCSR:
+    """
+    CSR de trayectorias post-ECAS (snapshot mapeado en memoria si existe):
+    - titulados: hoja Trayectoria_Resumen, con corte en el año de titulación
+    - desertores: fuga a destino, sin corte
+    """
+    return cargar_dataset(f"csr_{origen}")
+
+def construir_universo_ex_ecas(anio_n: Optional[int] = None, motor: Optional[str] = None) -> pd.DataFrame:
     """
     Universo total de ex-ECAS:
     - Titulados
     - Desertores con destino
     - Desertores sin destino
+
+    Se arma una vez por versión de datos para todas las cohortes; con anio_n se devuelve
+    el tramo de esa cohorte del universo por cohorte (sin copiar datos).
     """
+    if motor_kpi(motor) == "duckdb":
+        import motor_duckdb
+        return motor_duckdb.construir_universo_ex_ecas(anio_n)
 
-    # TITULADOS
-    df_tit = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-    df_tit["cohorte"] = pd.to_numeric(df_tit["año_cohorte_ecas"], errors="coerce")
-    df_tit = df_tit[(df_tit["cohorte"] >= 2007) & (df_tit["cohorte"] <= 2025)]
+    if anio_n is None:
+        return universo_todas_cohortes()
 
-    if anio_n is not None:
-        df_tit = df_tit[df_tit["cohorte"] == anio_n]
+    df_cohortes, filas = universo_indexado_por_cohorte()
+    inicio, fin = filas.get(anio_n, (0, 0))
+    return df_cohortes.iloc[inicio:fin].reset_index(drop=True)
 
-    df_tit["mrun"] = df_tit["mrun"].astype(str)
-    df_tit["origen"] = "Titulados ECAS"
+@cache_por_version
+def _universo_origen(nombre: str) -> pd.DataFrame:
+    df = cargar_dataset(nombre)
+    df["cohorte"] = pd.to_numeric(df["año_cohorte_ecas"], errors="coerce")
+    df = df[(df["cohorte"] >= 2007) & (df["cohorte"] <= 2025)]
 
-    titulados_mrun = set(df_tit["mrun"])
+    df["mrun"] = df["mrun"].astype(str)
+    return df[["mrun", "cohorte"]]
 
-    # DESERTORES CON DESTINO
-    df_fd = pd.read_excel(FILE_DESTINO)
-    df_fd["cohorte"] = pd.to_numeric(df_fd["año_cohorte_ecas"], errors="coerce")
-    df_fd = df_fd[(df_fd["cohorte"] >= 2007) & (df_fd["cohorte"] <= 2025)]
+def _claves_universo(df: pd.DataFrame, claves: list) -> np.ndarray:
+    # mrun o (mrun, cohorte) como un entero por fila
+    return clave_mrun_anio(df["mrun"], df["cohorte"]) if "cohorte" in claves else df["mrun"].to_numpy()
 
-    if anio_n is not None:
-        df_fd = df_fd[df_fd["cohorte"] == anio_n]
+def _excluir(df: pd.DataFrame, excluidos: pd.DataFrame, claves: list) -> pd.DataFrame:
+    # Anti-join: filas de df cuyas claves no están en excluidos (conjunto int64 ordenado)
+    excluidas = conjunto_mrun(_claves_universo(excluidos, claves))
+    return df[~pertenece(_claves_universo(df, claves), excluidas)]
 
-    df_fd["mrun"] = df_fd["mrun"].astype(str)
-    df_fd = df_fd[~df_fd["mrun"].isin(titulados_mrun)]
-    df_fd["origen"] = "Desertores ECAS"
+def _armar_universo(claves: list) -> pd.DataFrame:
+    # Titulados, luego desertores con destino y abandono total sin los ya incluidos (según claves)
+    df_tit = _universo_origen("trayectoria_titulados").assign(origen="Titulados ECAS")
+    df_fd = _excluir(_universo_origen("fuga_a_destino"), df_tit, claves).assign(origen="Desertores ECAS")
+    df_ab = _excluir(
+        _universo_origen("abandono_total"),
+        pd.concat([df_tit, df_fd], ignore_index=True),
+        claves
+    ).assign(origen="Abandono total")
 
-    desertores_mrun = set(df_fd["mrun"])
+    return pd.concat([df_tit, df_fd, df_ab], ignore_index=True)
 
-    # DESERTORES SIN DESTINO
-    df_ab = pd.read_excel(FILE_ABANDONO)
-    df_ab["cohorte"] = pd.to_numeric(df_ab["año_cohorte_ecas"], errors="coerce")
-    df_ab = df_ab[(df_ab["cohorte"] >= 2007) & (df_ab["cohorte"] <= 2025)]
+@cache_por_version
+def universo_todas_cohortes() -> pd.DataFrame:
+    """Universo sin filtro de cohorte: un desertor se descarta si es titulado de cualquier cohorte."""
+    return _armar_universo(["mrun"])
 
-    if anio_n is not None:
-        df_ab = df_ab[df_ab["cohorte"] == anio_n]
+@cache_por_version
+def construir_universo_por_cohorte() -> pd.DataFrame:
+    """
+    construir_universo_ex_ecas(c) de todas las cohortes c en una pasada. La exclusión entre orígenes
+    es por (mrun, cohorte): un desertor de la cohorte c solo se descarta si es titulado de la misma
+    cohorte, igual que al pedir una cohorte (con anio_n=None se descarta si es titulado de cualquiera).
+    """
+    return _armar_universo(["mrun", "cohorte"])
 
-    df_ab["mrun"] = df_ab["mrun"].astype(str)
-    df_ab = df_ab[
-        ~df_ab["mrun"].isin(titulados_mrun | desertores_mrun)
-    ]
+@cache_por_version
+def universo_indexado_por_cohorte() -> tuple:
+    """
+    Universo por cohorte ordenado por cohorte (orden estable: dentro de cada cohorte quedan los
+    orígenes en el mismo orden) y {cohorte: (inicio, fin)} con el tramo de filas de cada una.
+    """
+    df = construir_universo_por_cohorte().sort_values("cohorte", kind="stable", ignore_index=True)
+    cohortes, inicios, cantidades = np.unique(df["cohorte"].to_numpy(), return_index=True, return_counts=True)
+    filas = {c.item(): (int(i), int(i + n)) for c, i, n in zip(cohortes, inicios, cantidades)}
+    return df, filas
+
+def cruzar_universo(df: pd.DataFrame, df_universo: pd.DataFrame, claves: list) -> pd.DataFrame:
+    """Filas de df cuyas claves están en df_universo (semi-join: no repite filas de df)."""
+    return df.merge(df_universo[claves].drop_duplicates(), on=claves)
+
+#Modo lote: los KPIs se calculan para todas las cohortes y jornadas en una sola pasada agrupada y
+#devuelven un dataframe largo con las claves clave_cohorte y clave_jornada. TODAS marca las filas
+#sin filtro de cohorte o de jornada. La API por cohorte es un corte del lote (ver cortar_lote).
+TODAS = "Todas"
+CLAVES_LOTE = ["clave_cohorte", "clave_jornada"]
+
+def agrupar_lote(
+    df: pd.DataFrame,
+    por: list,
+    agregaciones: dict,
+    df_todas: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    Agrupa por las claves del lote y 'por', con las jornadas y además TODAS (grouping sets).
+    df trae clave_cohorte y clave_jornada por fila; df_todas son las filas que valen para
+    clave_cohorte = TODAS (por defecto, las mismas de df).
+    """
+    df_todas = df if df_todas is None else df_todas
+    partes = []
+    for base in (df, df_todas.assign(clave_cohorte=TODAS)):
+        for datos in (base, base.assign(clave_jornada=TODAS)):
+            partes.append(
+                datos.groupby(CLAVES_LOTE + por, dropna=False, sort=False, observed=True)
+                .agg(**agregaciones)
+                .reset_index()
+            )
+    return pd.concat(partes, ignore_index=True)
 
-    df_ab["origen"] = "Abandono total"
+def claves_estudiante(csr: TrayectoriaCSR) -> pd.DataFrame:
+    """Claves del lote (cohorte y jornada de la metadata) de cada estudiante del CSR."""
+    return pd.DataFrame({
+        "clave_cohorte": csr.meta["cohorte"].to_numpy(),
+        "clave_jornada": csr.meta["jornada"].astype(str).to_numpy(),
+    })
 
-    return pd.concat(
-        [
-            df_tit[["mrun", "cohorte", "origen"]],
-            df_fd[["mrun", "cohorte", "origen"]],
-            df_ab[["mrun", "cohorte", "origen"]],
-        ],
-        ignore_index=True
+def cortar_lote(lote: pd.DataFrame, cohorte_n: Optional[int] = None, jornada: Optional[str] = None) -> pd.DataFrame:
+    """Filas del lote de una cohorte y una jornada (None = todas), sin las columnas de clave."""
+    mascara = (
+        (lote["clave_cohorte"] == (TODAS if cohorte_n is None else cohorte_n)).to_numpy()
+        & (lote["clave_jornada"] == (TODAS if jornada is None else jornada)).to_numpy()
     )
+    return lote[mascara].drop(columns=CLAVES_LOTE).reset_index(drop=True)
 
 def ordenar_trayectoria_por_anio(row):
     """
@@ -0,0 +1,94 @@
+#Callbacks en segundo plano (background callbacks de Dash) para los cálculos pesados de las páginas.
+#Corren en procesos aparte administrados por un DiskcacheManager local: los workers web siguen
+#atendiendo mientras tanto, la página muestra el progreso y el cálculo se cancela si el usuario
+#vuelve a cambiar los filtros. Requiere dash[diskcache] (diskcache, multiprocess y psutil); sin
+#eso el callback corre en el worker como siempre ('running' se sigue mostrando).
+#Las métricas (latencia, filas, bytes) se toman en el proceso del trabajo y vuelven por el mismo diskcache:
+#el worker que atiende /metrics las recoge antes de exportar. Un trabajo cancelado no deja medición.
+#Uso:
+#   @callback_fondo(Output(...), Input(...), progress=[Output(...)], cancel=[Input(...)])
+#   def update_x(set_progress, valor): ...
+import functools
+import os
+from pathlib import Path
+
+from dash import callback, _callback
+
+from instrumentacion import medir_callback, registrar_recolector, _registrar
+
+try:
+    import diskcache
+    import multiprocess  # noqa: F401 (lo usa DiskcacheManager para lanzar los procesos)
+    import psutil  # noqa: F401 (lo usa DiskcacheManager para cancelar los procesos)
+    from dash import DiskcacheManager
+    FONDO_DISPONIBLE = True
+except ImportError:
+    FONDO_DISPONIBLE = False
+
+DIR_CACHE_CALLBACKS = Path(os.environ.get(
+    "ECAS_CACHE_CALLBACKS",
+    Path(__file__).resolve().parent.parent / "cache_callbacks"
+))
+
+MANAGER_FONDO = DiskcacheManager(diskcache.Cache(str(DIR_CACHE_CALLBACKS))) if FONDO_DISPONIBLE else None
+PREFIJO_MEDICIONES = "ecas-medicion"
+
+def _guardar_medicion(*medicion):
+    """Deja la medición de un trabajo en la cola del diskcache (corre en el proceso del trabajo)."""
+    MANAGER_FONDO.handle.push(medicion, prefix=PREFIJO_MEDICIONES)
+
+def _traer_mediciones():
+    """Pasa a las métricas de este proceso las mediciones pendientes de los trabajos."""
+    while True:
+        _, medicion = MANAGER_FONDO.handle.pull(prefix=PREFIJO_MEDICIONES)
+        if medicion is None:
+            return
+        _registrar(*medicion)
+
+if FONDO_DISPONIBLE:
+    registrar_recolector(_traer_mediciones)
+
+def _sin_progreso(*_):
+    pass
+
+def callback_fondo(*dependencias, progress=None, running=None, cancel=None, **opciones):
+    """
+    Registra un callback de página que corre en segundo plano si hay DiskcacheManager.
+    Con 'progress' la función recibe set_progress como primer argumento (sin manager no hace nada).
+    En segundo plano se mide la función del usuario dentro del trabajo, no el lanzador ni los sondeos.
+    """
+    def decorador(funcion):
+        if FONDO_DISPONIBLE:
+            # El id del callback recién se conoce al registrarlo: se registra una envoltura y luego
+            # se le asigna la función medida (los procesos del trabajo la heredan al hacer fork)
+            medida = [funcion]
+
+            @functools.wraps(funcion)
+            def trabajo(*args):
+                return medida[0](*args)
+
+            antes = set(_callback.GLOBAL_CALLBACK_MAP)
+            callback(
+                *dependencias,
+                background=True,
+                manager=MANAGER_FONDO,
+                progress=progress,
+                running=running,
+                cancel=cancel,
+                **opciones
+            )(trabajo)
+            callback_id = next(iter(set(_callback.GLOBAL_CALLBACK_MAP) - antes), funcion.__name__)
+            medida[0] = medir_callback(callback_id, funcion, registrar=_guardar_medicion)
+            return funcion
+
+        if progress is None:
+            return callback(*dependencias, running=running, **opciones)(funcion)
+
+        @functools.wraps(funcion)
+        def envoltura(*args):
+            return funcion(_sin_progreso, *args)
+
+        callback(*dependencias, running=running, **opciones)(envoltura)
+        return funcion
+
+    return decorador
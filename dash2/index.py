@@ -1,14 +1,28 @@
+import sys
+from pathlib import Path
+
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html
 from dash.dependencies import Input, Output
 
+# Las páginas usan imports planos (auxiliar, metricas_2, ...): se agrega esta carpeta
+# al path para poder levantar la app desde cualquier directorio (gunicorn, wsgi).
+DASH2_DIR = Path(__file__).resolve().parent
+if str(DASH2_DIR) not in sys.path:
+    sys.path.insert(0, str(DASH2_DIR))
+
 # Importamos el layout de cada página
 from pages import desertores, titulados_ecas
+from snapshots import registrar_version_por_request, iniciar_refresco
+from instrumentacion import instrumentar_app
+from memoria import reportar_inicio
 
 FONT_AWESOME = "https://use.fontawesome.com/releases/v5.15.4/css/all.css"
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, FONT_AWESOME],suppress_callback_exceptions=True)
+server = app.server
+registrar_version_por_request(server)
 
 # Diseño base con Navbar y un contenedor vacío para el contenido
 app.layout = html.Div([
@@ -30,11 +44,17 @@ app.layout = html.Div([
               [Input('url', 'pathname')])
 def display_page(pathname):
     if pathname == '/desertores':
-        return desertores.layout
+        return desertores.layout()
     elif pathname == '/titulados_ecas':
-        return titulados_ecas.layout
+        return titulados_ecas.layout()
     else:
         return "404 Page Not Found"
 
+# Latencia, CPU, filas y tamaño de respuesta de cada callback (incluidas las páginas) en /metrics
+instrumentar_app(app)
+# Memoria del proceso y del cache de snapshots en /metrics (y por consola al iniciar)
+reportar_inicio("index")
+
 if __name__ == '__main__':
+    iniciar_refresco()
     app.run(debug=True)
\ No newline at end of file
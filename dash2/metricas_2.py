@@ -2,121 +2,85 @@ import pandas as pd
 from typing import Optional
 from auxiliar import *
 
-#KPI 1: Porcentaje de estudiantes EX ECAS que llegan a postitulo o postgrado
-def kpi1_pct_llegan_postitulo_postgrado(
-    anio_n: Optional[int] = None,
-    jornada: Optional[str] = None
-) -> pd.DataFrame:
-
-    # ---------- 1) UNIVERSO ----------
-    df_universo = construir_universo_ex_ecas(anio_n)
-    df_universo["mrun"] = df_universo["mrun"].astype(str)
-
-    universo_mrun = set(df_universo["mrun"])
-
-    # Inicializar flags
-    df_universo["llega_postitulo"] = False
-    df_universo["llega_postgrado"] = False
-
-    # ---------- 2) TITULADOS ----------
-    df_tit = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-    df_tit["mrun"] = df_tit["mrun"].astype(str)
+#Universos del modo lote: el de cada cohorte (clave = su cohorte) y el de todas (clave TODAS)
+def _universos_lote(origenes: list) -> tuple:
+    df_cohortes = construir_universo_por_cohorte()
+    df_todas = construir_universo_ex_ecas(None, motor="pandas")
+    return (
+        df_cohortes[df_cohortes["origen"].isin(origenes)].assign(clave_cohorte=lambda df: df["cohorte"]),
+        df_todas[df_todas["origen"].isin(origenes)],
+    )
 
-    if anio_n is not None:
-        df_tit["año_cohorte_ecas"] = pd.to_numeric(
-            df_tit["año_cohorte_ecas"], errors="coerce"
-        )
-        df_tit = df_tit[df_tit["año_cohorte_ecas"] == anio_n]
-    
-    if jornada is not None:
-        df_tit["jornada"] = df_tit["jornada"].astype(str)
-        df_tit = df_tit[df_tit["jornada"] == jornada]
-
-    for _, row in df_tit.iterrows():
-        anio_tit = row["año_titulacion_ecas"]
-
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-
-        llega_postitulo = False
-        llega_postgrado = False
-
-        for anio, nivel in zip(ingresos, niveles):
-            if not str(anio).isdigit():
-                continue
-            if int(anio) <= anio_tit:
-                continue
-
-            flags = clasificar_nivel_post(nivel)
-
-            llega_postitulo |= flags["postitulo"]
-            llega_postgrado |= flags["postgrado"] 
-
-        if llega_postitulo:
-            df_universo.loc[
-                (df_universo["mrun"] == row["mrun"]) &
-                (df_universo["origen"] == "Titulados ECAS"),
-                "llega_postitulo"
-            ] = True
-
-        if llega_postgrado:
-            df_universo.loc[
-                (df_universo["mrun"] == row["mrun"]) &
-                (df_universo["origen"] == "Titulados ECAS"),
-                "llega_postgrado"
-            ] = True
-
-    # ---------- 3) DESERTORES CON DESTINO ----------
-    df_fd = pd.read_excel(FILE_DESTINO)
-    df_fd["mrun"] = df_fd["mrun"].astype(str)
-
-    if anio_n is not None:
-        df_fd["año_cohorte_ecas"] = pd.to_numeric(
-            df_fd["año_cohorte_ecas"], errors="coerce"
-        )
-        df_fd = df_fd[df_fd["año_cohorte_ecas"] == anio_n]
+@cache_por_version
+def kpi1_lote() -> pd.DataFrame:
+    """
+    Lote del KPI 1: por clave de cohorte, jornada y origen, el total del universo y cuántos llegan a
+    postítulo y postgrado. La jornada solo filtra a los que llegan (el universo no tiene jornada).
+    """
+    df_universo, df_universo_todas = _universos_lote(["Titulados ECAS", "Desertores ECAS", "Abandono total"])
+
+    # ---------- 1) TITULADOS Y DESERTORES CON DESTINO QUE LLEGAN ----------
+    # Titulados: solo eventos posteriores a su titulación en ECAS.
+    # Desertores: cualquier evento de su trayectoria.
+    llegan = []
+    for origen, csr, solo_posteriores in (
+        ("Titulados ECAS", cargar_trayectoria_csr("titulados"), True),
+        ("Desertores ECAS", cargar_trayectoria_csr("desertores"), False),
+    ):
+        mascara = mascara_posterior(csr) if solo_posteriores else np.ones(csr.n_eventos, dtype=bool)
+        flags = flags_niveles(csr)
+
+        df_origen = claves_estudiante(csr)
+        df_origen["mrun"] = csr.meta["mrun"].astype(str).to_numpy()
+        df_origen["origen"] = origen
+        df_origen["llega_postitulo"] = alguno_por_estudiante(csr, mascara & flags["postitulo"])
+        df_origen["llega_postgrado"] = alguno_por_estudiante(csr, mascara & flags["postgrado"])
+        llegan.append(df_origen[df_origen["llega_postitulo"] | df_origen["llega_postgrado"]])
+
+    df_llegan = pd.concat(llegan, ignore_index=True)
+
+    # Con una cohorte el estudiante del CSR debe ser de esa cohorte; sin cohorte basta el mrun
+    conteo_llegan = agrupar_lote(
+        cruzar_universo(df_llegan, df_universo, ["mrun", "origen", "clave_cohorte"]),
+        ["origen"],
+        {"llegan_postitulo": ("llega_postitulo", "sum"), "llegan_postgrado": ("llega_postgrado", "sum")},
+        df_todas=cruzar_universo(df_llegan, df_universo_todas, ["mrun", "origen"])
+    )
 
-    if jornada is not None:
-        df_fd["jornada"] = df_fd["jornada"].astype(str)
-        df_fd = df_fd[df_fd["jornada"] == jornada]
+    # ---------- 2) UNIVERSO POR COHORTE, REPETIDO PARA CADA JORNADA ----------
+    totales = (
+        pd.concat([df_universo, df_universo_todas.assign(clave_cohorte=TODAS)], ignore_index=True)
+        .groupby(["clave_cohorte", "origen"], sort=False)
+        .size()
+        .rename("total_mrun")
+        .reset_index()
+    )
+    jornadas = [TODAS] + [j for j in conteo_llegan["clave_jornada"].unique() if j != TODAS]
 
-    for _, row in df_fd.iterrows():
+    lote = pd.concat([totales.assign(clave_jornada=j) for j in jornadas], ignore_index=True).merge(
+        conteo_llegan, on=CLAVES_LOTE + ["origen"], how="left"
+    )
+    columnas = ["llegan_postitulo", "llegan_postgrado"]
+    lote[columnas] = lote[columnas].fillna(0).astype(int)
 
-        niveles = split_pipe_list(row["nivel_global"])
+    return lote
 
-        llega_postitulo = False
-        llega_postgrado = False
+#KPI 1: Porcentaje de estudiantes EX ECAS que llegan a postitulo o postgrado
+@precalculado
+def kpi1_pct_llegan_postitulo_postgrado(
+    anio_n: Optional[int] = None,
+    jornada: Optional[str] = None
+) -> pd.DataFrame:
 
-        for nivel in niveles:
-            flags = clasificar_nivel_post(nivel)
-            llega_postitulo |= flags["postitulo"]
-            llega_postgrado |= flags["postgrado"]
+    lote = kpi1_lote()
 
-            if llega_postitulo:
-                df_universo.loc[
-                    (df_universo["mrun"] == row["mrun"]) &
-                    (df_universo["origen"] == "Desertores ECAS"),
-                    "llega_postitulo"
-                ] = True
+    # Una jornada sin estudiantes en los CSR no cambia el universo: nadie llega
+    if jornada is not None and not (lote["clave_jornada"] == jornada).any():
+        resumen = cortar_lote(lote, anio_n).assign(llegan_postitulo=0, llegan_postgrado=0)
+    else:
+        resumen = cortar_lote(lote, anio_n, jornada)
 
-            if llega_postgrado:
-                df_universo.loc[
-                    (df_universo["mrun"] == row["mrun"]) &
-                    (df_universo["origen"] == "Desertores ECAS"),
-                    "llega_postgrado"
-                ] = True
-
-    # ---------- 4) AGREGACIÓN ----------
-    resumen = (
-        df_universo
-        .groupby("origen")
-        .agg(
-            total_mrun=("mrun", "count"),
-            llegan_postitulo=("llega_postitulo", "sum"),
-            llegan_postgrado=("llega_postgrado", "sum")
-        )
-        .reset_index()
-    )
+    resumen = resumen.sort_values("origen").reset_index(drop=True)
 
     resumen["pct_postitulo"] = (
         resumen["llegan_postitulo"] / resumen["total_mrun"] * 100
@@ -126,7 +90,7 @@ def kpi1_pct_llegan_postitulo_postgrado(
         resumen["llegan_postgrado"] / resumen["total_mrun"] * 100
     ).round(2)
 
-    # ---------- 5) TOTAL GENERAL ----------
+    # ---------- TOTAL GENERAL ----------
     total = resumen["total_mrun"].sum()
     total_postitulo = resumen["llegan_postitulo"].sum()
     total_postgrado = resumen["llegan_postgrado"].sum()
@@ -148,320 +112,254 @@ def kpi1_pct_llegan_postitulo_postgrado(
 
     return resumen
 
-#KPI 2: Institución, tipo de institución, area, carrera a la que se van separado por cohorte y por si es postgrado o postitulo.
-#Que permita mostrar el top 10. Metodo generico que tome la columna y analice en base a ella. 
-def calcular_top_reingreso_por_columna(
-    columna_objetivo: str,          
-    cohorte_n: int | None = None,
-    top_n: int = 10,
+@cache_por_version
+def top_reingreso_lote(
+    columna_objetivo: str,
     nivel_objetivo: str | None = None,
     gen_alu: str | None = None,
-    jornada: str | None = None,
     solo_desertores: bool = False,
     solo_titulados: bool = False
 ) -> pd.DataFrame:
-
-    df_universo = construir_universo_ex_ecas(cohorte_n)
-    df_universo = df_universo[df_universo["origen"] != "Abandono total"].copy()
-
+    """
+    Lote del KPI 2: por clave de cohorte y jornada, reingresos por código de columna_objetivo
+    (primer evento del nivel de cada estudiante) y el total que reingresa.
+    """
+    origenes = ["Titulados ECAS", "Desertores ECAS"]
     if solo_desertores:
-        df_universo = df_universo[df_universo["origen"] == "Desertores ECAS"].copy()
-    
+        origenes = [o for o in origenes if o == "Desertores ECAS"]
     if solo_titulados:
-        df_universo = df_universo[df_universo["origen"] == "Titulados ECAS"].copy()
-
-    mruns_validos = set(df_universo["mrun"].astype(str))
-
-    resultados = []
-
-    df_tit = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-    df_tit["mrun"] = df_tit["mrun"].astype(str)
-
-    if cohorte_n is not None:
-        df_tit["año_cohorte_ecas"] = pd.to_numeric(
-            df_tit["año_cohorte_ecas"], errors="coerce"
-        )
-        df_tit = df_tit[df_tit["año_cohorte_ecas"] == cohorte_n]
-
-    if gen_alu is not None:
-        df_tit["gen_alu"] = df_tit["gen_alu"].astype(str)
-        df_tit = df_tit[df_tit["gen_alu"] == gen_alu]
-
-    if jornada is not None:
-        df_tit["jornada"] = df_tit["jornada"].astype(str)
-        df_tit = df_tit[df_tit["jornada"] == jornada]
-
-
-    df_tit = df_tit[df_tit["mrun"].isin(mruns_validos)]
-
-    for _, row in df_tit.iterrows():
-
-        anio_tit = row["año_titulacion_ecas"]
-
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-        valores = split_pipe_list(row[columna_objetivo])
+        origenes = [o for o in origenes if o == "Titulados ECAS"]
 
-        eventos = []
+    df_universo, df_universo_todas = _universos_lote(origenes)
 
-        for anio, nivel, valor in zip(ingresos, niveles, valores):
-            if not anio.isdigit():
-                continue
-            anio = int(anio)
-            if anio <= anio_tit:
-                continue
+    campo = CAMPOS_EVENTO[columna_objetivo]
+    # Códigos de la dimensión compartida: titulados y desertores se suman sin decodificar
+    etiquetas = None if campo == "anio" else dimensiones_trayectoria()[campo]
+    eventos = []
 
-            flags = clasificar_nivel_post(nivel)
+    # Titulados: eventos posteriores a la titulación en ECAS (corte = año de titulación)
+    # Desertores con destino: cualquier evento con año válido (corte = -1)
+    for origen in ("titulados", "desertores"):
+        csr = cargar_trayectoria_csr(origen)
 
-            if nivel_objetivo is None:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "postitulo" and flags["postitulo"]:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "postgrado" and flags["postgrado"]:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "pregrado" and flags["pregrado"]:
-                eventos.append((anio, valor))
+        seleccion = seleccionar_estudiantes(origen, gen_alu=gen_alu)
+        mascara = mascara_posterior(csr) & mascara_estudiantes_a_eventos(csr, seleccion)
 
-        if not eventos:
-            continue
+        if nivel_objetivo is not None:
+            mascara &= flags_niveles(csr).get(nivel_objetivo, np.zeros(csr.n_eventos, dtype=bool))
 
         # primer evento cronológico de ese nivel
-        _, valor_sel = min(eventos, key=lambda x: x[0])
-
-        resultados.append({
-            "mrun": row["mrun"],
-            columna_objetivo: valor_sel
-        })
-
-    # ======================================================
-    # 3) DESERTORES CON DESTINO → fuga_a_destino
-    # ======================================================
-    df_fd = pd.read_excel(FILE_DESTINO)
-    df_fd["mrun"] = df_fd["mrun"].astype(str)
-
-    if cohorte_n is not None:
-        df_fd["año_cohorte_ecas"] = pd.to_numeric(
-            df_fd["año_cohorte_ecas"], errors="coerce"
-        )
-        df_fd = df_fd[df_fd["año_cohorte_ecas"] == cohorte_n]
+        idx = primer_evento(csr, mascara)
+        idx = idx[idx >= 0]
+        est = csr.estudiante[idx]
 
-    if gen_alu is not None:
-        df_fd["gen_alu"] = df_fd["gen_alu"].astype(str)
-        df_fd = df_fd[df_fd["gen_alu"] == gen_alu]
+        df_origen = claves_estudiante(csr).iloc[est].reset_index(drop=True)
+        df_origen["mrun"] = csr.meta["mrun"].astype(str).to_numpy()[est]
+        df_origen["codigo"] = codigos_evento(csr, campo, idx, etiquetas)
+        eventos.append(df_origen)
 
-    if jornada is not None:
-        df_fd["jornada"] = df_fd["jornada"].astype(str)
-        df_fd = df_fd[df_fd["jornada"] == jornada]
+    df_eventos = pd.concat(eventos, ignore_index=True)
 
-    df_fd = df_fd[df_fd["mrun"].isin(mruns_validos)]
+    # Válidos: mrun en el universo de la cohorte (de cualquier origen) o, sin cohorte, en el de todas
+    df_cohortes = cruzar_universo(df_eventos, df_universo, ["mrun", "clave_cohorte"])
+    df_todas = cruzar_universo(df_eventos, df_universo_todas, ["mrun"])
 
-    for _, row in df_fd.iterrows():
+    conteo = agrupar_lote(df_cohortes, ["codigo"], {"cantidad": ("mrun", "size")}, df_todas=df_todas).merge(
+        agrupar_lote(df_cohortes, [], {"total_reingresan": ("mrun", "nunique")}, df_todas=df_todas),
+        on=CLAVES_LOTE
+    )
 
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-        valores = split_pipe_list(row[columna_objetivo])
+    codigos = conteo["codigo"].to_numpy()
+    conteo["valor"] = codigos if etiquetas is None else np.asarray(etiquetas)[codigos]
+    conteo["porcentaje"] = (conteo["cantidad"] / conteo["total_reingresan"] * 100).round(2)
 
-        eventos = []
+    return conteo
 
-        for anio, nivel, valor in zip(ingresos, niveles, valores):
-            if not anio.isdigit():
-                continue
-            anio = int(anio)
+#KPI 2: Institución, tipo de institución, area, carrera a la que se van separado por cohorte y por si es postgrado o postitulo.
+#Que permita mostrar el top 10. Metodo generico que tome la columna y analice en base a ella. 
+@precalculado
+def calcular_top_reingreso_por_columna(
+    columna_objetivo: str,          
+    cohorte_n: int | None = None,
+    top_n: int = 10,
+    nivel_objetivo: str | None = None,
+    gen_alu: str | None = None,
+    jornada: str | None = None,
+    solo_desertores: bool = False,
+    solo_titulados: bool = False,
+    motor: str | None = None
+) -> pd.DataFrame:
 
-            flags = clasificar_nivel_post(nivel)
+    if motor_kpi(motor) == "duckdb":
+        import motor_duckdb
+        return motor_duckdb.calcular_top_reingreso_por_columna(
+            columna_objetivo, cohorte_n, top_n, nivel_objetivo, gen_alu, jornada, solo_desertores, solo_titulados
+        )
 
-            if nivel_objetivo is None:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "postitulo" and flags["postitulo"]:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "postgrado" and flags["postgrado"]:
-                eventos.append((anio, valor))
-            elif nivel_objetivo == "pregrado" and flags["pregrado"]:
-                eventos.append((anio, valor))
+    conteo = cortar_lote(
+        top_reingreso_lote(columna_objetivo, nivel_objetivo, gen_alu, solo_desertores, solo_titulados),
+        cohorte_n,
+        jornada
+    )
 
-        if not eventos:
-            continue
+    if conteo.empty:
+        return pd.DataFrame()
 
-        _, valor_sel = min(eventos, key=lambda x: x[0])
+    # De mayor a menor, empates por código
+    conteo = conteo.sort_values(["cantidad", "codigo"], ascending=[False, True], kind="stable")
+    if top_n is not None:
+        conteo = conteo.head(top_n)
 
-        resultados.append({
-            "mrun": row["mrun"],
-            columna_objetivo: valor_sel
-        })
+    return (
+        conteo.rename(columns={"valor": columna_objetivo})
+        [[columna_objetivo, "cantidad", "total_reingresan", "porcentaje"]]
+        .reset_index(drop=True)
+    )
 
-    df_res = pd.DataFrame(resultados)
+@cache_por_version
+def eventos_desercion() -> pd.DataFrame:
+    """Desertores con destino y abandono total en una sola tabla, con el año de fuga/abandono y el perfil."""
+    # Nota: Se asume que estos archivos contienen el campo 'año_primer_fuga'
+    df_eventos = pd.concat([cargar_dataset("fuga_a_destino"), cargar_dataset("abandono_total")], ignore_index=True)
+    df_eventos["mrun"] = df_eventos["mrun"].astype(str)
+    return df_eventos[["mrun", "año_primer_fuga", "jornada", "gen_alu", "rango_edad"]]
 
-    if df_res.empty:
-        return df_res
+@cache_por_version
+def indice_desercion() -> IndiceBitmaps:
+    """Bitmaps de los filtros de perfil sobre las filas de eventos_desercion()."""
+    return construir_indice_bitmaps(eventos_desercion())
 
-    total = df_res["mrun"].nunique()
+@cache_por_version
+def permanencia_desertores_lote(gen_alu: str | None = None, rango_edad: str | tuple | None = None) -> pd.DataFrame:
+    """Lote de permanencia: desertores por cohorte, años de permanencia y origen para cada clave de cohorte y jornada."""
 
-    conteo = (
-        df_res
-        .groupby(columna_objetivo)
-        .size()
-        .rename("cantidad")
-        .reset_index()
-        .sort_values("cantidad", ascending=False)
+    # 1. Obtener el universo base (Desertores + Abandono Total)
+    df_universo, df_universo_todas = _universos_lote(["Desertores ECAS", "Abandono Total"])
+
+    # 2-3. Eventos de fuga/abandono filtrados por perfil con sus bitmaps (la cohorte y la jornada son claves del lote)
+    seleccion = seleccionar_bitmaps(indice_desercion(), gen_alu=gen_alu or None, rango_edad=rango_edad or None)
+    df_eventos = eventos_desercion()[seleccion][["mrun", "año_primer_fuga", "jornada"]]
+
+    # 4. Cruzar cada universo con los eventos
+    analisis = []
+    for universo in (df_universo, df_universo_todas):
+        df_analisis = pd.merge(universo, df_eventos, on="mrun", how="inner")
+        df_analisis["clave_jornada"] = df_analisis["jornada"].astype(object)
+
+        # Cuántos años alcanzó a estar en la institución antes de irse
+        df_analisis["años_permanencia"] = df_analisis["año_primer_fuga"] - df_analisis["cohorte"]
+        analisis.append(df_analisis)
+
+    return agrupar_lote(
+        analisis[0],
+        ["cohorte", "años_permanencia", "origen"],
+        {"cantidad_alumnos": ("mrun", "size")},
+        df_todas=analisis[1]
     )
 
-    conteo["total_reingresan"] = total
-    conteo["porcentaje"] = (conteo["cantidad"] / total * 100).round(2)
-
-    return conteo.head(top_n)
-
+@precalculado
 def calcular_permanencia_desertores(
     cohorte_n: int | None = None,
     jornada: str | None = None,
     gen_alu: str | None = None,
     rango_edad: str | None = None,
+    motor: str | None = None,
 ) -> pd.DataFrame:
-    
-    # 1. Obtener el universo base (Desertores + Abandono Total)
-    df_universo = construir_universo_ex_ecas(cohorte_n)
-    
-    # Corrección del filtro: Usamos .isin para incluir ambos grupos
-    df_universo = df_universo[
-        df_universo["origen"].isin(["Desertores ECAS", "Abandono Total"])
-    ].copy()
 
-    # 2. Cargar datos de trayectoria para obtener el año de fuga/abandono
-    # Nota: Se asume que estos archivos contienen el campo 'año_primer_fuga'
-    df_fuga = pd.read_excel(FILE_DESTINO)
-    df_abandono = pd.read_excel(FILE_ABANDONO)
+    if motor_kpi(motor) == "duckdb":
+        import motor_duckdb
+        return motor_duckdb.calcular_permanencia_desertores(cohorte_n, jornada, gen_alu, rango_edad)
     
-    # Unificamos ambos orígenes de deserción en un solo DataFrame de eventos
-    df_eventos = pd.concat([df_fuga, df_abandono], ignore_index=True)
-    df_eventos["mrun"] = df_eventos["mrun"].astype(str)
-
-    # 3. Cruzar Universo con Eventos
-    # Esto asegura que solo analizamos a los alumnos que pertenecen al universo filtrado
-    df_universo["mrun"] = df_universo["mrun"].astype(str)
-    df_analisis = pd.merge(
-        df_universo, 
-        df_eventos[["mrun", "año_primer_fuga", "gen_alu", "rango_edad", "jornada"]], 
-        on="mrun", 
-        how="inner"
+    # Los filtros vacíos ("" o []) equivalen a no filtrar
+    if isinstance(rango_edad, list):
+        rango_edad = tuple(rango_edad)
+
+    resumen = cortar_lote(
+        permanencia_desertores_lote(gen_alu or None, rango_edad or None),
+        cohorte_n or None,
+        jornada or None
     )
 
-    # 4. Aplicar filtros de Perfil
-    if cohorte_n:
-        df_analisis = df_analisis[df_analisis["cohorte"] == cohorte_n]
-    if jornada:
-        df_analisis = df_analisis[df_analisis["jornada"] == jornada]
-    if gen_alu:
-        df_analisis = df_analisis[df_analisis["gen_alu"] == gen_alu]
-    if rango_edad:
-        if isinstance(rango_edad, list):
-            df_analisis = df_analisis[df_analisis["rango_edad"].isin(rango_edad)]
-        else:
-            # Si es un string único, la comparación normal funciona
-            df_analisis = df_analisis[df_analisis["rango_edad"] == rango_edad]
-
-    if df_analisis.empty:
+    if resumen.empty:
         return pd.DataFrame()
 
-    # 5. Cálculo de Permanencia (Delta de años)
-    # Cuántos años alcanzó a estar en la institución antes de irse
-    df_analisis["años_permanencia"] = (
-        df_analisis["año_primer_fuga"] - df_analisis["cohorte"]
-    )
-
-    # 6. Agrupación de resultados por Cohorte y Tiempo
-    resumen = (
-        df_analisis.groupby(["cohorte", "años_permanencia", "origen"])
-        .size()
-        .reset_index(name="cantidad_alumnos")
-    )
+    # Agrupación por Cohorte y Tiempo (sin los años de permanencia desconocidos)
+    resumen = resumen.dropna(subset=["años_permanencia"])
+    resumen = resumen[["cohorte", "años_permanencia", "origen", "cantidad_alumnos"]]
 
     # Calcular el porcentaje de cada grupo respecto al total de la cohorte analizada
     total_cohorte = resumen["cantidad_alumnos"].sum()
     resumen["tasa_sobre_desercion"] = (resumen["cantidad_alumnos"] / total_cohorte * 100).round(2)
 
-    return resumen.sort_values(["cohorte", "años_permanencia"])
+    return resumen.sort_values(["cohorte", "años_permanencia", "origen"])
+
+@cache_por_version
+def continuidad_origen_lote(gen_alu: str | None = None, rango_edad: str | tuple | None = None) -> pd.DataFrame:
+    """Lote de continuidad: postítulos y postgrados por cohorte ECAS y origen para cada clave de cohorte y jornada."""
+    df_universo, df_universo_todas = _universos_lote(["Titulados ECAS", "Desertores ECAS"])
+
+    resultados = []
+
+    for origen, nombre_csr in (("Titulados ECAS", "titulados"), ("Desertores ECAS", "desertores")):
+        csr = cargar_trayectoria_csr(nombre_csr)
+        seleccion = seleccionar_estudiantes(nombre_csr, gen_alu=gen_alu, rango_edad=rango_edad)
+
+        # Titulados ECAS: Solo si el ingreso es posterior o igual a su titulación en ECAS
+        # Desertores: Se asume que cualquier postítulo/grado implica título previo externo
+        mascara = mascara_posterior(csr, estricto=(origen != "Titulados ECAS"))
+        mascara &= mascara_estudiantes_a_eventos(csr, seleccion)
+
+        flags = flags_niveles(csr)
+        hizo_postitulo = alguno_por_estudiante(csr, mascara & flags["postitulo"])
+        hizo_postgrado = alguno_por_estudiante(csr, mascara & flags["postgrado"])
+
+        continua = hizo_postitulo | hizo_postgrado
+
+        resultados.append(pd.DataFrame({
+            "mrun": csr.meta["mrun"].astype(str).to_numpy()[continua],
+            "clave_jornada": csr.meta["jornada"].astype(str).to_numpy()[continua],
+            "año_cohorte_ecas": csr.meta["cohorte"].to_numpy()[continua],
+            "origen": origen,
+            "postitulo": hizo_postitulo[continua].astype(int),
+            "postgrado": hizo_postgrado[continua].astype(int)
+        }))
+
+    df_res = pd.concat(resultados, ignore_index=True)
+
+    # La cohorte solo filtra por pertenencia al universo de ese origen (clave = cohorte del universo)
+    return agrupar_lote(
+        df_res.merge(df_universo[["mrun", "origen", "clave_cohorte"]].drop_duplicates(), on=["mrun", "origen"]),
+        ["año_cohorte_ecas", "origen"],
+        {"postitulo": ("postitulo", "sum"), "postgrado": ("postgrado", "sum")},
+        df_todas=cruzar_universo(df_res, df_universo_todas, ["mrun", "origen"])
+    )
 
 #Calcular continuidad post ECAS (postitulo o postgrado) segun origen (titulados o desertores)
 #Nota: rango edad toma:
 #Para los titulados: edad de titulacion
 #Para los desertores: edad de desercion
 #Por ende, se entiende que la evaluación por rango de edad es independiente del origen
-def calcular_kpi_continuidad_origen(cohorte_n: int | None = None, jornada: str | None = None, gen_alu: str | None = None, rango_edad: str | None = None) -> pd.DataFrame:
-
-    df_universo = construir_universo_ex_ecas(cohorte_n)
-    
-    df_universo = df_universo[df_universo["origen"].isin(["Titulados ECAS", "Desertores ECAS"])].copy()
-    df_universo["mrun"] = df_universo["mrun"].astype(str)
-
-    df_tray = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-    df_verificacion = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-    df_tray["mrun"] = df_tray["mrun"].astype(str)
-
-    df_fd = pd.read_excel(FILE_DESTINO)
-    df_fd["mrun"] = df_fd["mrun"].astype(str)
-
-    df_tray_total = pd.concat([df_tray, df_fd], ignore_index=True).drop_duplicates(subset=["mrun"], keep="first")
+def calcular_kpi_continuidad_origen(cohorte_n: int | None = None, jornada: str | None = None, gen_alu: str | None = None, rango_edad: str | None = None, motor: str | None = None) -> pd.DataFrame:
 
-    df_merge = pd.merge(df_universo, df_tray_total, on="mrun", how="inner")
+    if motor_kpi(motor) == "duckdb":
+        import motor_duckdb
+        return motor_duckdb.calcular_kpi_continuidad_origen(cohorte_n, jornada, gen_alu, rango_edad)
 
-    if gen_alu:
-        df_merge = df_merge[df_merge["gen_alu"] == gen_alu]
-    if jornada:
-        df_merge = df_merge[df_merge["jornada"] == jornada]
-    if rango_edad:
-        df_merge = df_merge[df_merge["rango_edad"] == rango_edad]
+    if isinstance(rango_edad, list):
+        rango_edad = tuple(rango_edad)
 
-    resultados = []
+    resumen = cortar_lote(continuidad_origen_lote(gen_alu, rango_edad), cohorte_n, jornada)
 
-    for _, row in df_merge.iterrows():
-        # Parámetros de control
-        anio_tit_ecas = row.get("año_titulacion_ecas", 0)
-        es_titulado_ecas = (row["origen"] == "Titulados ECAS")
-
-        # Procesar listas de trayectoria (asumiendo formato pipe '|')
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-        
-        hizo_postitulo = 0
-        hizo_postgrado = 0
-
-        for anio, nivel in zip(ingresos, niveles):
-            if not str(anio).isdigit(): 
-                continue
-            
-            anio_ingreso = int(anio)
-            flags = clasificar_nivel_post(nivel)
-
-            if es_titulado_ecas:
-                # Titulados ECAS: Solo si el ingreso es posterior o igual a su titulación en ECAS
-                if anio_ingreso >= anio_tit_ecas:
-                    if flags["postitulo"]: hizo_postitulo = 1
-                    if flags["postgrado"]: hizo_postgrado = 1
-            else:
-                # Desertores: Se asume que cualquier postítulo/grado implica título previo externo
-                if flags["postitulo"]: hizo_postitulo = 1
-                if flags["postgrado"]: hizo_postgrado = 1
-
-        if hizo_postitulo or hizo_postgrado:
-            resultados.append({
-                "año_cohorte_ecas": row["año_cohorte_ecas"],
-                "origen": row["origen"],
-                "postitulo": hizo_postitulo,
-                "postgrado": hizo_postgrado
-            })
-
-    df_res = pd.DataFrame(resultados)
-    
-    if df_res.empty:
+    if resumen.empty:
         return pd.DataFrame(columns=["año_cohorte_ecas", "origen", "postitulo", "postgrado"])
 
-    # 4. Agrupación Final
-    resumen = df_res.groupby(["año_cohorte_ecas", "origen"]).agg({
-        "postitulo": "sum",
-        "postgrado": "sum"
-    }).reset_index()
+    # 4. Agrupación Final (sin cohorte ECAS desconocida)
+    resumen = (
+        resumen.dropna(subset=["año_cohorte_ecas"])
+        .sort_values(["año_cohorte_ecas", "origen"])
+        .reset_index(drop=True)
+    )
 
     df_final = calcular_contribucion_porcentual(resumen)
 
     return df_final
-
-
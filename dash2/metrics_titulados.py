@@ -3,136 +3,89 @@ import pandas as pd
 from typing import Optional
 from auxiliar import *
 
-FILE_PATH = 'trayectoria_post_ecas.xlsx'
+orden_nivel = ORDEN_NIVEL
 
-df_trayectorias_titulados = pd.read_excel(FILE_PATH, sheet_name="Trayectoria_Resumen")
+def csr_titulados_actual() -> TrayectoriaCSR:
+    """CSR de titulados de la versión de datos vigente (se recarga al publicar un snapshot nuevo)."""
+    return cargar_trayectoria_csr("titulados")
 
-orden_nivel = {
-    'Pregrado': 1,
-    'Postítulo': 2,
-    'Postgrado': 3
-}
+def seleccionar_titulados(cohorte_n: int | None = None, jornada: str | None = None) -> np.ndarray:
+    """Máscara por estudiante del CSR de titulados según cohorte y jornada."""
+    return seleccionar_estudiantes("titulados", cohorte_n=cohorte_n, jornada=jornada)
 
-#KPI 1: Nivel de reingreso a la educación superior
-#Evalua si los estudiantes ingresan a un pregrado, postitulo o postgrado tras titularse en ECAS.
-#Solo evalua el maximo nivel alcanzado tras titulación en ECAS. 
-def calcular_nivel_reingreso(cohorte_n: int | None = None, jornada: str | None = None):
-
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
+def eventos_post_titulacion(cohorte_n: int | None = None, jornada: str | None = None) -> np.ndarray:
+    """Máscara por evento: eventos posteriores a la titulación en ECAS de los titulados seleccionados."""
+    csr_titulados = csr_titulados_actual()
+    seleccion = seleccionar_titulados(cohorte_n, jornada)
+    return mascara_posterior(csr_titulados) & mascara_estudiantes_a_eventos(csr_titulados, seleccion)
 
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(df_reingreso["año_cohorte_ecas"], errors="coerce")
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-
-    resultados = []
-
-    for _, row in df_reingreso.iterrows():
-        anio_tit = row["año_titulacion_ecas"]
-
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
+@cache_por_version
+def conteo_reingreso_lote(campo: str, criterio: str = "max") -> pd.DataFrame:
+    """
+    Lote de los conteos de reingreso post-ECAS de todas las cohortes y jornadas: por clave de
+    cohorte y jornada, titulados por código de 'campo' (un evento por estudiante según criterio)
+    y el total que reingresa.
+    """
+    csr_titulados = csr_titulados_actual()
+    mascara = mascara_posterior(csr_titulados)
+
+    if criterio == "max":
+        idx = nivel_maximo(csr_titulados, mascara, orden_nivel)
+    elif criterio == "min":
+        idx = primer_evento(csr_titulados, mascara)
+    else:
+        raise ValueError("criterio debe ser 'max' o 'min'")
+
+    idx = idx[idx >= 0]
+    est = csr_titulados.estudiante[idx]
+    df_sel = claves_estudiante(csr_titulados).iloc[est].reset_index(drop=True)
+    df_sel["mrun"] = csr_titulados.meta["mrun"].to_numpy()[est]
+    df_sel["codigo"] = codigos_evento(csr_titulados, campo, idx)
+
+    conteo = agrupar_lote(df_sel, ["codigo"], {"cantidad": ("mrun", "size")}).merge(
+        agrupar_lote(df_sel, [], {"total_reingresan": ("mrun", "nunique")}),
+        on=CLAVES_LOTE
+    )
 
-        # Seguridad: listas paralelas
-        eventos = zip(ingresos, niveles)
+    # Solo se decodifican los códigos del lote, no cada evento
+    codigos = conteo["codigo"].to_numpy()
+    conteo["valor"] = codigos if campo == "anio" else np.asarray(csr_titulados.etiquetas[campo])[codigos]
+    conteo["porcentaje"] = (conteo["cantidad"] / conteo["total_reingresan"] * 100).round(2)
 
-        # Solo eventos posteriores a ECAS
-        niveles_post_ecas = [
-            nivel
-            for anio, nivel in eventos
-            if anio.isdigit() and int(anio) > anio_tit
-        ]
+    return conteo
 
-        if not niveles_post_ecas:
-            continue
+def _conteo_reingreso(campo: str, criterio: str, cohorte_n: int | None, jornada: str | None, columna: str) -> pd.DataFrame:
+    conteo = cortar_lote(conteo_reingreso_lote(campo, criterio), cohorte_n, jornada)
+    return conteo.rename(columns={"valor": columna})
 
-        # Nivel máximo alcanzado
-        nivel_max = max(
-            niveles_post_ecas,
-            key=lambda n: orden_nivel.get(n, 0)
-        )
+#KPI 1: Nivel de reingreso a la educación superior
+#Evalua si los estudiantes ingresan a un pregrado, postitulo o postgrado tras titularse en ECAS.
+#Solo evalua el maximo nivel alcanzado tras titulación en ECAS. 
+@precalculado
+def calcular_nivel_reingreso(cohorte_n: int | None = None, jornada: str | None = None):
 
-        resultados.append({
-            "mrun": row["mrun"],
-            "nivel_global": nivel_max
-        })
+    # Nivel máximo alcanzado (kernel CSR), corte del lote de todas las cohortes
+    conteo = _conteo_reingreso("nivel", "max", cohorte_n, jornada, "nivel_global")
 
-    if not resultados:
+    if conteo.empty:
         return pd.DataFrame(columns=["nivel_global", "cantidad", "total_reingresan", "porcentaje"])
 
-    df_max = pd.DataFrame(resultados)
-    total = df_max["mrun"].nunique()
-
-    conteo = (
-        df_max.groupby("nivel_global")
-        .size()
-        .rename("cantidad")
-        .reset_index()
-    )
-
-    conteo["total_reingresan"] = total
-    conteo["porcentaje"] = (conteo["cantidad"] / total * 100).round(2)
-
-    return conteo.sort_values("nivel_global")
+    return conteo[["nivel_global", "cantidad", "total_reingresan", "porcentaje"]].sort_values("nivel_global")
 
 #KPI1.1: Nivel inmediato de reingreso
 #Evalua el nivel al que ingresan los estudiantes inmediatamente después de titularse en ECAS.
+@precalculado
 def calcular_nivel_reingreso_inmediato(cohorte_n: int | None = None, jornada: str | None = None):
 
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
+    # Primer evento cronológico post-ECAS (kernel CSR), corte del lote de todas las cohortes
+    conteo = _conteo_reingreso("nivel", "min", cohorte_n, jornada, "nivel_global")
 
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(df_reingreso["año_cohorte_ecas"], errors="coerce")
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-    resultados = []
-
-    for _, row in df_reingreso.iterrows():
-        anio_tit = row["año_titulacion_ecas"]
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-
-        eventos_post_ecas = [
-            (int(anio), nivel)
-            for anio, nivel in zip(ingresos, niveles)
-            if anio.isdigit() and int(anio) > anio_tit
-        ]
-
-        if not eventos_post_ecas:
-            continue
-
-        anio_min, nivel_inmediato = min(eventos_post_ecas, key=lambda x: x[0])
-        resultados.append({
-            "mrun": row["mrun"],
-            "nivel_global": nivel_inmediato
-        })
-
-    if not resultados:
+    if conteo.empty:
         return pd.DataFrame(columns=["nivel_global", "cantidad", "total_reingresan", "porcentaje"])
 
-    df_min = pd.DataFrame(resultados)
-
-    total = df_min["mrun"].nunique()
-
-    conteo = (
-        df_min.groupby("nivel_global")
-        .size()
-        .rename("cantidad")
-        .reset_index()
-    )
-
-    conteo["total_reingresan"] = total
-    conteo["porcentaje"] = (conteo["cantidad"] / total * 100).round(2)
-
-    return conteo.sort_values("nivel_global")
+    return conteo[["nivel_global", "cantidad", "total_reingresan", "porcentaje"]].sort_values("nivel_global")
 
+@precalculado
 def calcular_top_reingreso_por_columna_titulados(
     columna_objetivo: str,
     cohorte_n: int | None = None,
@@ -143,7 +96,7 @@ def calcular_top_reingreso_por_columna_titulados(
     """
     KPI genérica de reingreso post-ECAS.
     
-    - columna_objetivo: columna a analizar (ej: 'tipo_institucion_1', 'area_conocimiento_destino')
+    - columna_objetivo: columna a analizar (ej: 'tipo_inst_1', 'area_conocimiento_destino')
     - cohorte_n: cohorte ECAS (opcional)
     - criterio:
         - 'max' → nivel máximo alcanzado
@@ -151,73 +104,48 @@ def calcular_top_reingreso_por_columna_titulados(
     - top_n: limitar al top N (opcional)
     """
 
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
-
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(df_reingreso["año_cohorte_ecas"], errors="coerce")
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-
-    resultados = []
-
-    for _, row in df_reingreso.iterrows():
-        anio_tit = row["año_titulacion_ecas"]
-
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-        valores = split_pipe_list(row[columna_objetivo])
-
-        eventos = [
-            (int(anio), nivel, valor)
-            for anio, nivel, valor in zip(ingresos, niveles, valores)
-            if anio.isdigit() and int(anio) > anio_tit
-        ]
-
-        if not eventos:
-            continue
-
-        # Selección según criterio
-        if criterio == "max":
-            _, _, valor_sel = max(
-                eventos,
-                key=lambda x: orden_nivel.get(x[1], 0)
-            )
-        elif criterio == "min":
-            _, _, valor_sel = min(
-                eventos,
-                key=lambda x: x[0]
-            )
-        else:
-            raise ValueError("criterio debe ser 'max' o 'min'")
-
-        resultados.append({
-            "mrun": row["mrun"],
-            columna_objetivo: valor_sel
-        })
-
-    df_res = pd.DataFrame(resultados)
-
-    total = df_res["mrun"].nunique()
-
-    conteo = (
-        df_res.groupby(columna_objetivo)
-        .size()
-        .rename("cantidad")
-        .reset_index()
-    )
-
-    conteo["total_reingresan"] = total
-    conteo["porcentaje"] = (conteo["cantidad"] / total * 100).round(2)
-
-    conteo = conteo.sort_values("cantidad", ascending=False)
+    # Conteo sobre los códigos (un evento por estudiante); se ordena de mayor a menor, empates por código
+    conteo = _conteo_reingreso(CAMPOS_EVENTO[columna_objetivo], criterio, cohorte_n, jornada, columna_objetivo)
+    conteo = conteo.sort_values(["cantidad", "codigo"], ascending=[False, True], kind="stable")
 
     if top_n is not None:
         conteo = conteo.head(top_n)
 
-    return conteo
+    return conteo[[columna_objetivo, "cantidad", "total_reingresan", "porcentaje"]].reset_index(drop=True)
+
+def _eventos_demora() -> pd.DataFrame:
+    """Cada trayectoria post-ECAS de todos los titulados como una observación, con su demora en años."""
+    csr_titulados = csr_titulados_actual()
+    df_eventos = eventos_a_dataframe(csr_titulados, np.flatnonzero(mascara_posterior(csr_titulados)), campos=("anio", "nivel"))
+
+    df_eventos["demora_anios"] = df_eventos["anio"] - df_eventos["anio_corte"]
+    df_eventos["clave_cohorte"] = df_eventos["cohorte"]
+    df_eventos["clave_jornada"] = df_eventos["jornada"].astype(str)
+
+    return df_eventos.rename(columns={"nivel": "nivel_global"})
+
+def _cortar_por_cohorte(lote: pd.DataFrame, cohorte_n: int | None, jornada: str | None, orden: list) -> pd.DataFrame:
+    # Estos KPIs ya vienen por cohorte: sin cohorte_n se devuelven todas (salvo la cohorte nula)
+    df = cortar_lote(lote, cohorte_n, jornada)
+    return df[df["cohorte"].notna()].sort_values(orden).reset_index(drop=True)
+
+@cache_por_version
+def demora_reingreso_lote() -> pd.DataFrame:
+    """Lote del KPI 4: estadísticas de demora por cohorte y nivel_global para cada clave de cohorte y jornada."""
+    resumen = agrupar_lote(
+        _eventos_demora(),
+        ["cohorte", "nivel_global"],
+        {
+            "promedio_demora": ("demora_anios", "mean"),
+            "mediana_demora": ("demora_anios", "median"),
+            "minimo_demora": ("demora_anios", "min"),
+            "maximo_demora": ("demora_anios", "max"),
+            "cantidad_trayectorias": ("demora_anios", "count"),
+        }
+    )
+    resumen["promedio_demora"] = resumen["promedio_demora"].round(2)
+
+    return resumen
 
 #KPI 4: Tiempo de demora en acceder a otra carrera tras titularse en ECAS,
 #separado por nivel_global (pregrado, postitulo, postgrado).
@@ -234,71 +162,29 @@ def calcular_demora_reingreso_por_nivel(
     Cada trayectoria post-ECAS se contabiliza como una observación.
     """
 
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
-
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(
-            df_reingreso["año_cohorte_ecas"], errors="coerce"
-        )
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-
-    registros = []
+    resumen = _cortar_por_cohorte(demora_reingreso_lote(), cohorte_n, jornada, ["cohorte", "nivel_global"])
 
-    for _, row in df_reingreso.iterrows():
+    if resumen.empty:
+        return pd.DataFrame()
 
-        anio_tit = row["año_titulacion_ecas"]
-        cohorte = row["año_cohorte_ecas"]
+    return resumen
 
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
+@cache_por_version
+def distribucion_demora_lote() -> pd.DataFrame:
+    """Lote del KPI 4.b: titulados por cohorte, nivel_global y demora para cada clave de cohorte y jornada."""
+    df_eventos = _eventos_demora()
 
-        for anio, nivel in zip(ingresos, niveles):
-
-            if not anio.isdigit():
-                continue
-
-            anio = int(anio)
-
-            if anio <= anio_tit:
-                continue
-
-            demora = anio - anio_tit
-
-            registros.append({
-                "cohorte": cohorte,
-                "nivel_global": nivel,
-                "demora_anios": demora
-            })
-
-    df_eventos = pd.DataFrame(registros)
-
-    if df_eventos.empty:
-        return df_eventos
-
-    resumen = (
-        df_eventos
-        .groupby(["cohorte", "nivel_global"])
-        .agg(
-            promedio_demora=("demora_anios", "mean"),
-            mediana_demora=("demora_anios", "median"),
-            minimo_demora=("demora_anios", "min"),
-            maximo_demora=("demora_anios", "max"),
-            cantidad_trayectorias=("demora_anios", "count")
-        )
-        .reset_index()
+    # Menor demora de cada titulado en cada nivel (los filtros son por estudiante, no la cambian)
+    df_eventos = df_eventos.sort_values("demora_anios", kind="stable").drop_duplicates(
+        subset=["mrun", "nivel_global"], 
+        keep="first"
     )
 
-    resumen["promedio_demora"] = resumen["promedio_demora"].round(2)
-
-    return resumen.sort_values(["cohorte", "nivel_global"])
+    return agrupar_lote(df_eventos, ["cohorte", "nivel_global", "demora_anios"], {"cantidad_alumnos": ("mrun", "size")})
 
 #KPI 4.1: Tiempo de demora en acceder a otra carrera tras titularse en ECAS,
 #separado por cantidad
+@precalculado
 def calcular_distribucion_demora_reingreso(
     cohorte_n: int | None = None,
     jornada: str | None = None
@@ -311,134 +197,52 @@ def calcular_distribucion_demora_reingreso(
     Cada trayectoria post-ECAS se contabiliza como una observación.
     """
 
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
-
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(
-            df_reingreso["año_cohorte_ecas"], errors="coerce"
-        )
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-
-    registros = []
-
-    for _, row in df_reingreso.iterrows():
+    distribucion = _cortar_por_cohorte(distribucion_demora_lote(), cohorte_n, jornada, ["cohorte", "nivel_global", "demora_anios"])
 
-        anio_tit = row["año_titulacion_ecas"]
-        cohorte = row["año_cohorte_ecas"]
+    if distribucion.empty:
+        return pd.DataFrame()
 
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-
-        for anio, nivel in zip(ingresos, niveles):
-
-            if not anio.isdigit():
-                continue
-
-            anio = int(anio)
+    return distribucion
 
-            if anio <= anio_tit:
-                continue
+@cache_por_version
+def ruta_titulados_lote() -> pd.DataFrame:
+    """Lote del KPI 5: titulados por ruta secuencial para cada clave de cohorte y jornada."""
+    csr_titulados = csr_titulados_actual()
 
-            demora = anio - anio_tit
+    # Eventos post-ECAS ya en orden cronológico dentro de cada estudiante
+    posiciones = np.flatnonzero(mascara_posterior(csr_titulados))
+    segmentos = csr_titulados.estudiante[posiciones]
+    niveles = csr_titulados.nivel[posiciones]
 
-            registros.append({
-                "mrun": row["mrun"],
-                "cohorte": cohorte,
-                "nivel_global": nivel,
-                "demora_anios": demora
-            })
+    # Eliminar niveles repetidos consecutivos (manteniendo orden)
+    nuevo = np.r_[True, (segmentos[1:] != segmentos[:-1]) | (niveles[1:] != niveles[:-1])] if len(posiciones) else np.array([], dtype=bool)
 
-    df_eventos = pd.DataFrame(registros)
+    df_niveles = pd.DataFrame({
+        "estudiante": segmentos[nuevo],
+        "nivel": decodificar(csr_titulados, "nivel", niveles[nuevo])
+    })
+    sufijos = df_niveles.groupby("estudiante")["nivel"].agg(" → ".join)
 
-    if df_eventos.empty:
-        return df_eventos
+    df_rutas = claves_estudiante(csr_titulados)
+    df_rutas["mrun"] = csr_titulados.meta["mrun"].to_numpy()
+    df_rutas["ruta_secuencial"] = ("Pregrado → " + sufijos.reindex(np.arange(len(df_rutas)))).fillna("Pregrado").to_numpy()
 
-    df_eventos = df_eventos.sort_values("demora_anios").drop_duplicates(
-        subset=["mrun", "nivel_global"], 
-        keep="first"
-    )
-
-    distribucion = (
-        df_eventos
-        .groupby(["cohorte", "nivel_global", "demora_anios"])
-        .size()
-        .rename("cantidad_alumnos") # Cambiamos el nombre para ser precisos
-        .reset_index()
+    conteo = agrupar_lote(df_rutas, ["ruta_secuencial"], {"cantidad": ("mrun", "size")}).merge(
+        agrupar_lote(df_rutas, [], {"total_titulados": ("mrun", "nunique")}),
+        on=CLAVES_LOTE
     )
+    conteo["porcentaje"] = (conteo["cantidad"] / conteo["total_titulados"] * 100).round(2)
 
-    return distribucion
+    return conteo
 
 # KPI5: En promedio, ¿Cómo se ve la ruta de los titulados de ECAS?
 # Evaluamos los porcentajes de cuantos hacen un pregrado (titulacion) > postítulo > magister > doctorado. 
+@precalculado
 def calcular_ruta_promedio_titulados(
     cohorte_n: Optional[int] = None,
     jornada: Optional[str] = None
 ) -> pd.DataFrame:
 
-    df_reingreso = df_trayectorias_titulados.copy()
-
-    df_reingreso = df_reingreso.dropna(subset=["mrun", "año_titulacion_ecas"])
-
-    if cohorte_n is not None:
-        df_reingreso["año_cohorte_ecas"] = pd.to_numeric(
-            df_reingreso["año_cohorte_ecas"], errors="coerce"
-        )
-        df_reingreso = df_reingreso[df_reingreso["año_cohorte_ecas"] == cohorte_n]
-
-    if jornada is not None:
-        df_reingreso = df_reingreso[df_reingreso["jornada"] == jornada]
-
-    rutas = []
-
-    for _, row in df_reingreso.iterrows():
-        anio_tit = row["año_titulacion_ecas"]
-
-        ingresos = split_pipe_list(row["anio_ingreso_destino"])
-        niveles = split_pipe_list(row["nivel_global"])
-
-        # Reconstruir eventos post-ECAS
-        eventos = [
-            (int(anio), nivel)
-            for anio, nivel in zip(ingresos, niveles)
-            if anio.isdigit() and int(anio) > anio_tit
-        ]
-
-        if not eventos:
-            ruta = ["Pregrado"]
-        else:
-            # Ordenar cronológicamente
-            eventos.sort(key=lambda x: x[0])
-
-            # Eliminar niveles repetidos (manteniendo orden)
-            niveles_unicos = []
-            for _, nivel in eventos:
-                if not niveles_unicos or niveles_unicos[-1] != nivel:
-                    niveles_unicos.append(nivel)
-
-            ruta = ["Pregrado"] + niveles_unicos
-
-        rutas.append({
-            "mrun": row["mrun"],
-            "ruta_secuencial": " → ".join(ruta)
-        })
-
-    df_rutas = pd.DataFrame(rutas)
-
-    total_titulados = df_rutas["mrun"].nunique()
-
-    conteo = (
-        df_rutas.groupby("ruta_secuencial")
-        .size()
-        .rename("cantidad")
-        .reset_index()
-    )
-
-    conteo["total_titulados"] = total_titulados
-    conteo["porcentaje"] = (conteo["cantidad"] / total_titulados * 100).round(2)
+    conteo = cortar_lote(ruta_titulados_lote(), cohorte_n, jornada)
 
-    return conteo.sort_values("cantidad", ascending=False)
\ No newline at end of file
+    return conteo.sort_values(["cantidad", "ruta_secuencial"], ascending=[False, True], kind="stable").reset_index(drop=True)
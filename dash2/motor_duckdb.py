@@ -0,0 +1,378 @@
+#Motor DuckDB para los KPIs de dash2: las mismas métricas expresadas en SQL y ejecutadas
+#en proceso por DuckDB (vectorizado y multihilo) sobre los snapshots ya mapeados en memoria.
+#Se activa por despliegue con ECAS_MOTOR_KPI=duckdb (ver auxiliar.motor_kpi).
+#Verificación contra pandas: python motor_duckdb.py
+import argparse
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import duckdb
+    DUCKDB_DISPONIBLE = True
+except ImportError:
+    DUCKDB_DISPONIBLE = False
+
+from auxiliar import (
+    CAMPOS_EVENTO,
+    calcular_contribucion_porcentual,
+    cargar_dataset,
+    cargar_trayectoria_csr,
+    clasificar_nivel_post,
+)
+from snapshots import cache_por_version
+
+HILOS_DUCKDB = int(os.environ.get("ECAS_DUCKDB_HILOS", 0))  # 0 = todos los núcleos
+
+ORIGENES_CSR = ("titulados", "desertores")
+FLAGS_NIVEL = ("pregrado", "postitulo", "postgrado")
+
+_base = None
+_lock_base = threading.Lock()
+
+#Tablas registradas (una vez por versión de datos, sin copiar los arreglos del snapshot)
+def _texto(serie: pd.Series) -> pd.Series:
+    # mismo criterio que pandas en los KPIs: comparaciones sobre astype(str)
+    return serie.astype(str)
+
+@cache_por_version
+def _tablas() -> dict:
+    tablas = {}
+
+    df_tit = cargar_dataset("trayectoria_titulados")
+    tablas["titulados"] = pd.DataFrame({
+        "mrun": _texto(df_tit["mrun"]),
+        "cohorte": pd.to_numeric(df_tit["año_cohorte_ecas"], errors="coerce"),
+    })
+
+    for nombre, dataset in (("fuga", "fuga_a_destino"), ("abandono", "abandono_total")):
+        df = cargar_dataset(dataset)
+        tablas[nombre] = pd.DataFrame({
+            "mrun": _texto(df["mrun"]),
+            "cohorte": pd.to_numeric(df["año_cohorte_ecas"], errors="coerce"),
+            "año_primer_fuga": df["año_primer_fuga"],
+            "gen_alu": df["gen_alu"],
+            "rango_edad": df["rango_edad"],
+            "jornada": df["jornada"],
+        })
+
+    for origen in ORIGENES_CSR:
+        csr = cargar_trayectoria_csr(origen)
+
+        # pa.table sobre los .npy mapeados no copia los datos
+        tablas[f"eventos_{origen}"] = pa.table({
+            "pos": np.arange(csr.n_eventos, dtype=np.int64),
+            "estudiante": csr.estudiante,
+            "anio": csr.anio,
+            **{campo: getattr(csr, campo) for campo in ("nivel", "institucion", "area", "carrera", "tipo_inst")},
+        })
+
+        meta = csr.meta
+        tablas[f"meta_{origen}"] = pd.DataFrame({
+            "estudiante": np.arange(csr.n_estudiantes, dtype=np.int32),
+            "mrun": _texto(meta["mrun"]),
+            "cohorte": meta["cohorte"],
+            "jornada": _texto(meta["jornada"]),
+            "gen_alu": _texto(meta["gen_alu"]),
+            "rango_edad": meta["rango_edad"],
+            "anio_corte": meta["anio_corte"],
+        })
+
+        for campo, etiquetas in csr.etiquetas.items():
+            tablas[f"etiquetas_{origen}_{campo}"] = pd.DataFrame({
+                "codigo": np.arange(len(etiquetas), dtype=np.int32),
+                "valor": pd.Series(etiquetas, dtype=object),
+            })
+
+        # clasificar_nivel_post se aplica una vez por etiqueta, como flags_niveles
+        niveles = [clasificar_nivel_post(e) for e in csr.etiquetas["nivel"]]
+        tablas[f"niveles_{origen}"] = pd.DataFrame({
+            "codigo": np.arange(len(niveles), dtype=np.int32),
+            **{flag: np.array([n.get(flag, False) for n in niveles], dtype=bool) for flag in FLAGS_NIVEL},
+        })
+
+    return tablas
+
+def _conexion():
+    """Cursor propio del hilo sobre una base DuckDB en memoria, con las tablas de la versión vigente."""
+    global _base
+    if not DUCKDB_DISPONIBLE:
+        raise ImportError("ECAS_MOTOR_KPI=duckdb requiere el paquete duckdb.")
+
+    with _lock_base:
+        if _base is None:
+            _base = duckdb.connect(":memory:")
+            if HILOS_DUCKDB > 0:
+                _base.execute(f"SET threads = {HILOS_DUCKDB}")
+
+    cursor = _base.cursor()
+    for nombre, tabla in _tablas().items():
+        cursor.register(nombre, tabla)
+    return cursor
+
+def _consultar(sql: str, parametros: dict) -> pd.DataFrame:
+    cursor = _conexion()
+    try:
+        # solo se envían los parámetros que la consulta usa
+        return cursor.execute(sql, {k: v for k, v in parametros.items() if f"${k}" in sql}).df()
+    finally:
+        cursor.close()
+
+#SQL
+_SQL_UNIVERSO = """
+    tit AS (
+        SELECT mrun, cohorte, 'Titulados ECAS' AS origen
+        FROM titulados
+        WHERE cohorte BETWEEN 2007 AND 2025
+          AND ($anio IS NULL OR cohorte = $anio)
+    ),
+    fd AS (
+        SELECT mrun, cohorte, 'Desertores ECAS' AS origen
+        FROM fuga
+        WHERE cohorte BETWEEN 2007 AND 2025
+          AND ($anio IS NULL OR cohorte = $anio)
+          AND mrun NOT IN (SELECT mrun FROM tit)
+    ),
+    ab AS (
+        SELECT mrun, cohorte, 'Abandono total' AS origen
+        FROM abandono
+        WHERE cohorte BETWEEN 2007 AND 2025
+          AND ($anio IS NULL OR cohorte = $anio)
+          AND mrun NOT IN (SELECT mrun FROM tit)
+          AND mrun NOT IN (SELECT mrun FROM fd)
+    ),
+    universo AS (
+        SELECT * FROM tit
+        UNION ALL SELECT * FROM fd
+        UNION ALL SELECT * FROM ab
+    )
+"""
+
+def _filtro_perfil(alias: str, jornada, gen_alu, rango_edad, cohorte: bool = False) -> str:
+    """Equivalente SQL de seleccionar_estudiantes (None = sin filtro)."""
+    filtros = []
+    if cohorte:
+        filtros.append(f"{alias}.cohorte = $anio")
+    if jornada is not None:
+        filtros.append(f"{alias}.jornada = $jornada")
+    if gen_alu is not None:
+        filtros.append(f"{alias}.gen_alu = $gen_alu")
+    if rango_edad:
+        filtros.append(f"list_contains($rangos, {alias}.rango_edad)")
+    return "".join(f"\n          AND {f}" for f in filtros)
+
+def _rangos(rango_edad) -> list:
+    return rango_edad if isinstance(rango_edad, list) else [rango_edad]
+
+#KPIs
+def construir_universo_ex_ecas(anio_n: Optional[int] = None) -> pd.DataFrame:
+    sql = f"WITH {_SQL_UNIVERSO} SELECT mrun, cohorte, origen FROM universo"
+    return _consultar(sql, {"anio": anio_n})
+
+def calcular_top_reingreso_por_columna(
+    columna_objetivo: str,
+    cohorte_n: int | None = None,
+    top_n: int = 10,
+    nivel_objetivo: str | None = None,
+    gen_alu: str | None = None,
+    jornada: str | None = None,
+    solo_desertores: bool = False,
+    solo_titulados: bool = False
+) -> pd.DataFrame:
+
+    campo = CAMPOS_EVENTO[columna_objetivo]
+
+    origenes_validos = ["Titulados ECAS", "Desertores ECAS"]
+    if solo_desertores:
+        origenes_validos.remove("Titulados ECAS")
+    if solo_titulados:
+        origenes_validos.remove("Desertores ECAS")
+
+    if nivel_objetivo is None:
+        filtro_nivel = ""
+    elif nivel_objetivo in FLAGS_NIVEL:
+        filtro_nivel = f"\n          AND n.{nivel_objetivo}"
+    else:
+        filtro_nivel = "\n          AND FALSE"
+
+    # primer evento cronológico posterior al corte, por estudiante y por origen
+    primeros = []
+    for origen in ORIGENES_CSR:
+        valor = "p.codigo" if campo == "anio" else "et.valor"
+        decodificar = "" if campo == "anio" else f"\n        LEFT JOIN etiquetas_{origen}_{campo} et ON et.codigo = p.codigo"
+        primeros.append(f"""
+        SELECT p.mrun, {valor} AS valor
+        FROM (
+            SELECT m.mrun, arg_min(e.{campo}, e.pos) AS codigo
+            FROM eventos_{origen} e
+            JOIN meta_{origen} m ON m.estudiante = e.estudiante
+            JOIN niveles_{origen} n ON n.codigo = e.nivel
+            WHERE m.mrun IN (SELECT mrun FROM validos)
+              AND e.anio >= 0
+              AND e.anio > m.anio_corte{_filtro_perfil("m", jornada, gen_alu, None, cohorte=cohorte_n is not None)}{filtro_nivel}
+            GROUP BY m.estudiante, m.mrun
+        ) p{decodificar}""")
+
+    sql = f"""
+    WITH {_SQL_UNIVERSO},
+    validos AS (
+        SELECT DISTINCT mrun FROM universo WHERE origen IN (SELECT unnest($origenes))
+    ),
+    primeros AS ({" UNION ALL ".join(primeros)}
+    )
+    SELECT
+        valor AS "{columna_objetivo}",
+        COUNT(*) AS cantidad,
+        (SELECT COUNT(DISTINCT mrun) FROM primeros) AS total_reingresan
+    FROM primeros
+    WHERE valor IS NOT NULL
+    GROUP BY valor
+    ORDER BY cantidad DESC, valor
+    """
+
+    conteo = _consultar(sql, {"anio": cohorte_n, "origenes": origenes_validos, "jornada": jornada, "gen_alu": gen_alu})
+
+    if conteo.empty:
+        return pd.DataFrame()
+
+    conteo["porcentaje"] = (conteo["cantidad"] / conteo["total_reingresan"] * 100).round(2)
+
+    return conteo.head(top_n)
+
+def calcular_permanencia_desertores(
+    cohorte_n: int | None = None,
+    jornada: str | None = None,
+    gen_alu: str | None = None,
+    rango_edad: str | None = None,
+) -> pd.DataFrame:
+
+    filtro_cohorte = "\n          AND u.cohorte = $anio" if cohorte_n else ""
+
+    # Mismo criterio de universo que la versión pandas (incluida la etiqueta "Abandono Total")
+    sql = f"""
+    WITH {_SQL_UNIVERSO},
+    eventos AS (
+        SELECT mrun, año_primer_fuga, gen_alu, rango_edad, jornada FROM fuga
+        UNION ALL
+        SELECT mrun, año_primer_fuga, gen_alu, rango_edad, jornada FROM abandono
+    ),
+    analisis AS (
+        SELECT u.cohorte, u.origen, e.año_primer_fuga - u.cohorte AS años_permanencia
+        FROM universo u
+        JOIN eventos e ON e.mrun = u.mrun
+        WHERE u.origen IN ('Desertores ECAS', 'Abandono Total'){_filtro_perfil("e", jornada or None, gen_alu or None, rango_edad)}{filtro_cohorte}
+    )
+    SELECT cohorte, años_permanencia, origen, COUNT(*) AS cantidad_alumnos
+    FROM analisis
+    WHERE cohorte IS NOT NULL AND años_permanencia IS NOT NULL
+    GROUP BY cohorte, años_permanencia, origen
+    ORDER BY cohorte, años_permanencia, origen
+    """
+
+    resumen = _consultar(sql, {"anio": cohorte_n, "jornada": jornada, "gen_alu": gen_alu, "rangos": _rangos(rango_edad)})
+
+    if resumen.empty:
+        return pd.DataFrame()
+
+    total_cohorte = resumen["cantidad_alumnos"].sum()
+    resumen["tasa_sobre_desercion"] = (resumen["cantidad_alumnos"] / total_cohorte * 100).round(2)
+
+    return resumen
+
+def calcular_kpi_continuidad_origen(cohorte_n: int | None = None, jornada: str | None = None, gen_alu: str | None = None, rango_edad: str | None = None) -> pd.DataFrame:
+
+    continuidad = []
+    for origen, etiqueta in (("titulados", "Titulados ECAS"), ("desertores", "Desertores ECAS")):
+        # Titulados: ingreso posterior o igual a la titulación. Desertores: estrictamente posterior
+        comparacion = ">=" if origen == "titulados" else ">"
+        continuidad.append(f"""
+        SELECT m.cohorte, '{etiqueta}' AS origen, bool_or(n.postitulo) AS postitulo, bool_or(n.postgrado) AS postgrado
+        FROM meta_{origen} m
+        JOIN eventos_{origen} e ON e.estudiante = m.estudiante
+        JOIN niveles_{origen} n ON n.codigo = e.nivel
+        WHERE m.mrun IN (SELECT mrun FROM universo WHERE origen = '{etiqueta}')
+          AND e.anio >= 0
+          AND e.anio {comparacion} m.anio_corte{_filtro_perfil("m", jornada, gen_alu, rango_edad)}
+        GROUP BY m.estudiante, m.cohorte""")
+
+    sql = f"""
+    WITH {_SQL_UNIVERSO},
+    continuidad AS ({" UNION ALL ".join(continuidad)}
+    )
+    SELECT
+        cohorte AS año_cohorte_ecas,
+        origen,
+        SUM(postitulo::INT) AS postitulo,
+        SUM(postgrado::INT) AS postgrado
+    FROM continuidad
+    WHERE (postitulo OR postgrado) AND cohorte IS NOT NULL
+    GROUP BY cohorte, origen
+    ORDER BY año_cohorte_ecas, origen
+    """
+
+    resumen = _consultar(sql, {"anio": cohorte_n, "jornada": jornada, "gen_alu": gen_alu, "rangos": _rangos(rango_edad)})
+
+    if resumen.empty:
+        return pd.DataFrame(columns=["año_cohorte_ecas", "origen", "postitulo", "postgrado"])
+
+    return calcular_contribucion_porcentual(resumen)
+
+#Verificación cruzada contra la implementación pandas
+def _normalizar(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df.reset_index(drop=True)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+def verificar_motores(cohortes: Optional[list] = None) -> pd.DataFrame:
+    """
+    Ejecuta cada KPI con ambos motores y compara los resultados (sin importar el orden de filas).
+    Devuelve una fila por caso con 'igual' y, si difiere, el detalle.
+    """
+    import auxiliar
+    import metricas_2
+
+    casos = []
+    for cohorte in [None] + list(cohortes or []):
+        casos += [
+            ("construir_universo_ex_ecas", auxiliar.construir_universo_ex_ecas, {"anio_n": cohorte}),
+            ("calcular_top_reingreso_por_columna", metricas_2.calcular_top_reingreso_por_columna,
+             {"columna_objetivo": "institucion_destino", "cohorte_n": cohorte, "top_n": None}),
+            ("calcular_top_reingreso_por_columna", metricas_2.calcular_top_reingreso_por_columna,
+             {"columna_objetivo": "area_conocimiento_destino", "cohorte_n": cohorte, "top_n": None, "nivel_objetivo": "postgrado"}),
+            ("calcular_top_reingreso_por_columna", metricas_2.calcular_top_reingreso_por_columna,
+             {"columna_objetivo": "anio_ingreso_destino", "cohorte_n": cohorte, "top_n": None, "solo_desertores": True}),
+            ("calcular_permanencia_desertores", metricas_2.calcular_permanencia_desertores, {"cohorte_n": cohorte}),
+            ("calcular_permanencia_desertores", metricas_2.calcular_permanencia_desertores, {"cohorte_n": cohorte, "jornada": "Diurna"}),
+            ("calcular_kpi_continuidad_origen", metricas_2.calcular_kpi_continuidad_origen, {"cohorte_n": cohorte}),
+            ("calcular_kpi_continuidad_origen", metricas_2.calcular_kpi_continuidad_origen, {"cohorte_n": cohorte, "jornada": "Vespertina"}),
+        ]
+
+    filas = []
+    for nombre, funcion, kwargs in casos:
+        esperado = _normalizar(funcion(**kwargs, motor="pandas"))
+        obtenido = _normalizar(funcion(**kwargs, motor="duckdb"))
+        try:
+            pd.testing.assert_frame_equal(esperado, obtenido, check_dtype=False, check_index_type=False)
+            detalle = ""
+        except AssertionError as e:
+            detalle = str(e).strip().splitlines()[0]
+        filas.append({"kpi": nombre, "argumentos": kwargs, "filas": len(esperado), "igual": not detalle, "detalle": detalle})
+
+    return pd.DataFrame(filas)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compara los KPIs de dash2 entre pandas y DuckDB.")
+    parser.add_argument("--cohortes", type=int, nargs="*", default=[2010, 2015, 2020])
+    args = parser.parse_args()
+
+    reporte = verificar_motores(args.cohortes)
+    print(reporte.to_string(index=False))
+
+    if not reporte["igual"].all():
+        raise SystemExit(f"❌ {(~reporte['igual']).sum()} casos difieren entre motores")
+    print(f"✅ {len(reporte)} casos iguales entre pandas y DuckDB")
@@ -6,121 +6,126 @@ import plotly.express as px
 from dash import Input, Output, callback, State
 from metricas_2 import *
 from plots_desertores import *
+from callbacks_fondo import callback_fondo
 
-df_filtros = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
+def layout():
+    """Layout de la página: las opciones de los filtros salen de la versión de datos de la request."""
+    df_filtros = cargar_dataset("trayectoria_titulados")
 
-opciones_genero = [{'label': g, 'value': g} for g in df_filtros['gen_alu'].unique() if pd.notna(g)]
-opciones_jornada = [{'label': j, 'value': j} for j in df_filtros['jornada'].unique() if pd.notna(j)]
-opciones_edad = sorted([{'label': e, 'value': e} for e in df_filtros['rango_edad'].unique() if pd.notna(e)], key=lambda x: x['label'])
+    opciones_genero = [{'label': g, 'value': g} for g in df_filtros['gen_alu'].unique() if pd.notna(g)]
+    opciones_jornada = [{'label': j, 'value': j} for j in df_filtros['jornada'].unique() if pd.notna(j)]
+    opciones_edad = sorted([{'label': e, 'value': e} for e in df_filtros['rango_edad'].unique() if pd.notna(e)], key=lambda x: x['label'])
 
-df_universo_base = construir_universo_ex_ecas()
-cohortes_disponibles = sorted(df_universo_base['cohorte'].dropna().unique())
+    cohortes_disponibles = sorted(construir_universo_ex_ecas()['cohorte'].dropna().unique())
 
-layout = dbc.Container([
-    dbc.Row([
-        # --- COLUMNA IZQUIERDA: FILTROS ---
-        dbc.Col([
-            html.Div([
-                html.H4("Filtros de Análisis", className="mb-4"),
+    return dbc.Container([
+        dbc.Row([
+            # --- COLUMNA IZQUIERDA: FILTROS ---
+            dbc.Col([
+                html.Div([
+                    html.H4("Filtros de Análisis", className="mb-4"),
                 
-                # 1. Filtro: Cohorte
-                html.Label("Seleccionar Cohorte:"),
-                dcc.Dropdown(
-                    id='filtro-cohorte',
-                    options=[{'label': str(int(c)), 'value': int(c)} for c in cohortes_disponibles],
-                    placeholder="Todas las cohortes",
-                    className="mb-3"
-                ),
-
-                # 2. Filtro: Género (RadioItems para selección única)
-                html.Label("Género:"),
-                dbc.RadioItems(
-                    id='filtro-genero',
-                    options=[{"label": "Todos", "value": "todos"}] + opciones_genero,
-                    value="todos",
-                    className="mb-3"
-                ),
-
-                # 3. Filtro: Jornada (Checklist para selección múltiple)
-                html.Label("Jornada:"),
-                dbc.Checklist(
-                    id='filtro-jornada',
-                    options=opciones_jornada,
-                    value=[j['value'] for j in opciones_jornada], # Todos seleccionados por defecto
-                    labelStyle={'display': 'block'},
-                    className="mb-3"
-                ),
-
-                # 4. Filtro: Rango Etario (Dropdown por la cantidad de opciones)
-                html.Label("Rango Etario:"),
-                dcc.Dropdown(
-                    id='filtro-edad',
-                    options=opciones_edad,
-                    placeholder="Seleccionar rango...",
-                    multi=True, # Permite seleccionar varios rangos
-                    className="mb-3"
-                ),
-
-                dbc.Button("Aplicar Filtros", id="btn-aplicar", color="primary", className="w-100 mt-2")
-            ], 
-            style={
-                "background-color": "#f8f9fa", 
-                "padding": "20px", 
-                "border-radius": "10px",
-                "height": "100vh",
-                "position": "sticky",
-                "top": "0"
-            })
-        ], width=3),
-
-        # --- COLUMNA DERECHA: RESULTADOS ---
-        dbc.Col([
-            html.H2("Análisis de Desertores y Permanencia", className="text-center mb-4"),
+                    # 1. Filtro: Cohorte
+                    html.Label("Seleccionar Cohorte:"),
+                    dcc.Dropdown(
+                        id='filtro-cohorte',
+                        options=[{'label': str(int(c)), 'value': int(c)} for c in cohortes_disponibles],
+                        placeholder="Todas las cohortes",
+                        className="mb-3"
+                    ),
+
+                    # 2. Filtro: Género (RadioItems para selección única)
+                    html.Label("Género:"),
+                    dbc.RadioItems(
+                        id='filtro-genero',
+                        options=[{"label": "Todos", "value": "todos"}] + opciones_genero,
+                        value="todos",
+                        className="mb-3"
+                    ),
+
+                    # 3. Filtro: Jornada (Checklist para selección múltiple)
+                    html.Label("Jornada:"),
+                    dbc.Checklist(
+                        id='filtro-jornada',
+                        options=opciones_jornada,
+                        value=[j['value'] for j in opciones_jornada], # Todos seleccionados por defecto
+                        labelStyle={'display': 'block'},
+                        className="mb-3"
+                    ),
+
+                    # 4. Filtro: Rango Etario (Dropdown por la cantidad de opciones)
+                    html.Label("Rango Etario:"),
+                    dcc.Dropdown(
+                        id='filtro-edad',
+                        options=opciones_edad,
+                        placeholder="Seleccionar rango...",
+                        multi=True, # Permite seleccionar varios rangos
+                        className="mb-3"
+                    ),
+
+                    dbc.Button("Aplicar Filtros", id="btn-aplicar", color="primary", className="w-100 mt-2"),
+                    # Avance del cálculo de destinos (visible solo mientras corre)
+                    dbc.Progress(id="progreso-destinos", value=0, striped=True, animated=True, className="mt-3", style={"display": "none"})
+                ], 
+                style={
+                    "background-color": "#f8f9fa", 
+                    "padding": "20px", 
+                    "border-radius": "10px",
+                    "height": "100vh",
+                    "position": "sticky",
+                    "top": "0"
+                })
+            ], width=3),
+
+            # --- COLUMNA DERECHA: RESULTADOS ---
+            dbc.Col([
+                html.H2("Análisis de Desertores y Permanencia", className="text-center mb-4"),
             
-            # Gráficos de Permanencia (KPI 4 - Donut Charts)
-            dbc.Row([
-                dbc.Col([
-                    dbc.Card([
-                        dbc.CardHeader("Permanencia por Jornada (Distribución de Deserción)"),
-                        dbc.CardBody([
-                            dbc.Spinner(dbc.Row(id='container-permanencia-graficos'), color="primary")
+                # Gráficos de Permanencia (KPI 4 - Donut Charts)
+                dbc.Row([
+                    dbc.Col([
+                        dbc.Card([
+                            dbc.CardHeader("Permanencia por Jornada (Distribución de Deserción)"),
+                            dbc.CardBody([
+                                dbc.Spinner(dbc.Row(id='container-permanencia-graficos'), color="primary")
+                            ])
+                        ], className="mb-4")
+                    ], width=12)
+                ]),
+
+                # Gráficos de Perfil (Barras y Pie)
+                dbc.Row([
+                    dbc.Col([
+                        dbc.Card([
+                            dbc.CardHeader("Top Instituciones de Destino"),
+                            dbc.CardBody(dcc.Graph(id='graph-dest-institucion'))
                         ])
-                    ], className="mb-4")
-                ], width=12)
-            ]),
-
-            # Gráficos de Perfil (Barras y Pie)
-            dbc.Row([
-                dbc.Col([
-                    dbc.Card([
-                        dbc.CardHeader("Top Instituciones de Destino"),
-                        dbc.CardBody(dcc.Graph(id='graph-dest-institucion'))
-                    ])
-                ], width=6, className="mb-4"),
-                dbc.Col([
-                    dbc.Card([
-                        dbc.CardHeader("Áreas de Conocimiento de Destino"),
-                        dbc.CardBody(dcc.Graph(id='graph-dest-area'))
-                    ])
-                ], width=6, className="mb-4"),
-            ]),
-            dbc.Row([
-                dbc.Col([
-                    dbc.Card([
-                        dbc.CardHeader("Tipo de Institución (Categoría 1)"),
-                        dbc.CardBody(dcc.Graph(id='graph-dest-tipo1'))
-                    ])
-                ], width=6),
-                dbc.Col([
-                    dbc.Card([
-                        dbc.CardHeader("Nivel de destino"),
-                        dbc.CardBody(dcc.Graph(id='graph-dest-nivel'))
-                    ])
-                ], width=6),
-            ])
-        ], width=9)
-    ])
-], fluid=True)
+                    ], width=6, className="mb-4"),
+                    dbc.Col([
+                        dbc.Card([
+                            dbc.CardHeader("Áreas de Conocimiento de Destino"),
+                            dbc.CardBody(dcc.Graph(id='graph-dest-area'))
+                        ])
+                    ], width=6, className="mb-4"),
+                ]),
+                dbc.Row([
+                    dbc.Col([
+                        dbc.Card([
+                            dbc.CardHeader("Tipo de Institución (Categoría 1)"),
+                            dbc.CardBody(dcc.Graph(id='graph-dest-tipo1'))
+                        ])
+                    ], width=6),
+                    dbc.Col([
+                        dbc.Card([
+                            dbc.CardHeader("Nivel de destino"),
+                            dbc.CardBody(dcc.Graph(id='graph-dest-nivel'))
+                        ])
+                    ], width=6),
+                ])
+            ], width=9)
+        ])
+    ], fluid=True)
+
 
 @callback(
     Output('container-permanencia-graficos', 'children'),
@@ -157,7 +162,8 @@ def update_permanencia_charts(n_clicks, cohorte, jornadas_sel, genero, edad):
     return charts
 
 # --- CALLBACK 2: DESTINOS ---
-@callback(
+# En segundo plano: muestra el avance por gráfico y se cancela si el usuario cambia algún filtro
+@callback_fondo(
     [Output('graph-dest-institucion', 'figure'),
      Output('graph-dest-area', 'figure'),
      Output('graph-dest-tipo1', 'figure'),
@@ -166,9 +172,18 @@ def update_permanencia_charts(n_clicks, cohorte, jornadas_sel, genero, edad):
     [State('filtro-cohorte', 'value'),
      State('filtro-genero', 'value'),
      State('filtro-jornada', 'value'),
-     State('filtro-edad', 'value')]
+     State('filtro-edad', 'value')],
+    progress=[Output('progreso-destinos', 'value'),
+              Output('progreso-destinos', 'label')],
+    running=[(Output('btn-aplicar', 'disabled'), True, False),
+             (Output('progreso-destinos', 'style'), {"display": "flex"}, {"display": "none"})],
+    cancel=[Input('filtro-cohorte', 'value'),
+            Input('filtro-genero', 'value'),
+            Input('filtro-jornada', 'value'),
+            Input('filtro-edad', 'value')],
+    prevent_initial_call=True
 )
-def update_destino_charts(n_clicks, cohorte, genero, jornadas, edades):
+def update_destino_charts(set_progress, n_clicks, cohorte, genero, jornadas, edades):
     if n_clicks is None:
         raise dash.exceptions.PreventUpdate
 
@@ -184,7 +199,8 @@ def update_destino_charts(n_clicks, cohorte, genero, jornadas, edades):
     ]
 
     figures = []
-    for col_name, titulo, escala in config_graficos:
+    set_progress((0, "0%"))
+    for i, (col_name, titulo, escala) in enumerate(config_graficos, 1):
         df_top = calcular_top_reingreso_por_columna(
             columna_objetivo=col_name,
             cohorte_n=cohorte,
@@ -195,10 +211,12 @@ def update_destino_charts(n_clicks, cohorte, genero, jornadas, edades):
 
         if df_top.empty:
             figures.append(px.bar(title=f"Sin datos: {titulo}"))
-            continue
+        else:
+            # LLAMADA A LA FUNCIÓN EXTERNA CON PARÁMETROS DIFERENTES
+            fig = generar_figura_barras_destino(df_top, titulo, escala)
+            figures.append(fig)
 
-        # LLAMADA A LA FUNCIÓN EXTERNA CON PARÁMETROS DIFERENTES
-        fig = generar_figura_barras_destino(df_top, titulo, escala)
-        figures.append(fig)
+        avance = 100 * i // len(config_graficos)
+        set_progress((avance, f"{avance}%"))
 
     return figures
\ No newline at end of file
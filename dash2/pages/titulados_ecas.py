@@ -4,17 +4,7 @@ from auxiliar import *
 from metrics_titulados import *
 from metricas_2 import *
 from dash import Input, Output, callback, html, dcc, ALL, ctx
-
-#Totales
-df_total = kpi1_pct_llegan_postitulo_postgrado()
-total_titulados = df_total.loc[df_total['origen'] == 'Titulados ECAS', 'total_mrun'].values[0]
-total_desertores = df_total.loc[df_total['origen'] == 'Desertores ECAS', 'total_mrun'].values[0]
-total_abandono = df_total.loc[df_total['origen'] == 'Abandono total', 'total_mrun'].values[0]
-
-
-df_filtros = pd.read_excel(FILE_TRAYECTORIA, sheet_name="Trayectoria_Resumen")
-opciones_jornada = [{'label': j, 'value': j} for j in df_filtros['jornada'].unique() if pd.notna(j)]
-cohortes_disponibles = sorted(df_filtros['año_cohorte_ecas'].dropna().unique())
+from callbacks_fondo import callback_fondo
 
 def crear_card_metric(titulo, valor, icono_class):
     # Formateo de miles con punto como separador (estilo chileno)
@@ -33,136 +23,150 @@ def crear_card_metric(titulo, valor, icono_class):
         className="shadow-sm border-0 rounded"
     )
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.H2("Dashboard de Seguimiento de Titulados ECAS", className="text-center my-4"),
-            html.Hr()
-        ], width=12)
-    ]),
+def layout():
+    """
+    Layout de la página con los filtros de la versión de datos de la request
+    (los totales del encabezado los llena update_metricas_encabezado al cargar).
+    """
+    df_filtros = cargar_dataset("trayectoria_titulados")
+    opciones_jornada = [{'label': j, 'value': j} for j in df_filtros['jornada'].unique() if pd.notna(j)]
+    cohortes_disponibles = sorted(df_filtros['año_cohorte_ecas'].dropna().unique())
+
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.H2("Dashboard de Seguimiento de Titulados ECAS", className="text-center my-4"),
+                html.Hr()
+            ], width=12)
+        ]),
 
-    dbc.Row(id="contenedor-metricas-totales", className="mb-4"),
+        # Indicador mientras se recalculan los totales (el callback corre en segundo plano)
+        dbc.Progress(id="progreso-metricas-totales", value=100, striped=True, animated=True, className="mb-2", style={"display": "none"}),
+        dbc.Row(id="contenedor-metricas-totales", className="mb-4"),
     
-    # --- FILTROS ---
-    dbc.Row([
-        dbc.Col([
-            html.Label("Cohorte (Año Ingreso):"),
-            dcc.Dropdown(
-                id='filtro-cohorte-tit',
-                # Generamos las opciones dinámicamente desde tu lista 'cohortes_disponibles'
-                options=[
-                    {'label': f"{int(c)}", 'value': int(c)} 
-                    for c in cohortes_disponibles
-                ],
-                placeholder="Seleccione una cohorte...",
-                className="mt-1",
-                clearable=True  # Permite limpiar la selección para ver el total histórico
-            )
-        ], width=6),
-        dbc.Col([
-            html.Label("Jornada ECAS:"),
-            html.Div([
-                dbc.ButtonGroup([
-                    # 1. Botón "Ambos" (Manual)
-                    dbc.Button(
-                        "Ambos", 
-                        id={"type": "btn-jornada", "index": "todos"}, 
-                        color="primary", 
-                        outline=False
+        # --- FILTROS ---
+        dbc.Row([
+            dbc.Col([
+                html.Label("Cohorte (Año Ingreso):"),
+                dcc.Dropdown(
+                    id='filtro-cohorte-tit',
+                    # Generamos las opciones dinámicamente desde tu lista 'cohortes_disponibles'
+                    options=[
+                        {'label': f"{int(c)}", 'value': int(c)} 
+                        for c in cohortes_disponibles
+                    ],
+                    placeholder="Seleccione una cohorte...",
+                    className="mt-1",
+                    clearable=True  # Permite limpiar la selección para ver el total histórico
+                )
+            ], width=6),
+            dbc.Col([
+                html.Label("Jornada ECAS:"),
+                html.Div([
+                    dbc.ButtonGroup([
+                        # 1. Botón "Ambos" (Manual)
+                        dbc.Button(
+                            "Ambos", 
+                            id={"type": "btn-jornada", "index": "todos"}, 
+                            color="primary", 
+                            outline=False
+                        )
+                    ] + [
+                        # 2. Botones dinámicos desde opciones_jornada
+                        dbc.Button(
+                            opt['label'],
+                            id={"type": "btn-jornada", "index": opt['value']},
+                            # Asignamos colores según el nombre para mantener tu estilo (Opcional)
+                            color="warning" if opt['value'] == "Diurna" else "danger",
+                            outline=True # Outline=True hace que se vean más limpios al estar agrupados
+                        ) for opt in opciones_jornada
+                    ], className="mt-2 w-100") # w-100 para que use todo el ancho de la columna
+                ])
+            ], width=6),
+        ], className="mb-4 p-3 bg-light rounded"),
+
+        # --- KPI 1, 2 y 3 (Nivel, Institución y Área) ---
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 1: Nivel inmediato de Reingreso"),
+                    # Dejamos el Body vacío para que el callback inyecte los dcc.Graph necesarios
+                    dbc.CardBody(id='graph-nivel-reingreso') 
+                ])
+            ], width=6),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 1.b: Máximo Nivel Alcanzado post-ECAS"),
+                    dbc.CardBody(id='graph-nivel-maximo') # El contenedor dinámico 
+                ])
+            ], width=6),
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 2: Instituciones de Destino"),
+                    dbc.CardBody(
+                        id='graph-tipo-inst-tit',
+                        style={
+                        "maxHeight": "500px",  # Altura fija máxima para la tarjeta
+                        "overflowY": "auto",   # Habilita el scroll vertical si el gráfico es más alto
+                        "overflowX": "auto"
+                    })
+                ])
+            ], width=6),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 3: Areas de destino"),
+                    dbc.CardBody(
+                        id='graph-tipo-area',
+                        style={
+                        "maxHeight": "500px",  # Altura fija máxima para la tarjeta
+                        "overflowY": "auto",   # Habilita el scroll vertical si el gráfico es más alto
+                        "overflowX": "auto"
+                    })
+                ])
+            ], width=6),
+        ], className="mb-4"),
+
+    
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 3: Tiempo de Acceso a Nueva Carrera (Años tras titulación)"),
+                    dbc.CardBody(
+                        id='graph-tiempo-acceso',
+                        style={
+                            "height": "650px",      # Altura fija para ver ~2 filas de gráficos
+                            "overflow-y": "auto",   # Scroll activado
+                            "overflow-x": "hidden"
+                        }
                     )
-                ] + [
-                    # 2. Botones dinámicos desde opciones_jornada
-                    dbc.Button(
-                        opt['label'],
-                        id={"type": "btn-jornada", "index": opt['value']},
-                        # Asignamos colores según el nombre para mantener tu estilo (Opcional)
-                        color="warning" if opt['value'] == "Diurna" else "danger",
-                        outline=True # Outline=True hace que se vean más limpios al estar agrupados
-                    ) for opt in opciones_jornada
-                ], className="mt-2 w-100") # w-100 para que use todo el ancho de la columna
-            ])
-        ], width=6),
-    ], className="mb-4 p-3 bg-light rounded"),
-
-    # --- KPI 1, 2 y 3 (Nivel, Institución y Área) ---
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 1: Nivel inmediato de Reingreso"),
-                # Dejamos el Body vacío para que el callback inyecte los dcc.Graph necesarios
-                dbc.CardBody(id='graph-nivel-reingreso') 
-            ])
-        ], width=6),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 1.b: Máximo Nivel Alcanzado post-ECAS"),
-                dbc.CardBody(id='graph-nivel-maximo') # El contenedor dinámico 
-            ])
-        ], width=6),
-    ], className="mb-4"),
-
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 2: Instituciones de Destino"),
-                dbc.CardBody(
-                    id='graph-tipo-inst-tit',
-                    style={
-                    "maxHeight": "500px",  # Altura fija máxima para la tarjeta
-                    "overflowY": "auto",   # Habilita el scroll vertical si el gráfico es más alto
-                    "overflowX": "auto"
-                })
-            ])
-        ], width=6),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 3: Areas de destino"),
-                dbc.CardBody(
-                    id='graph-tipo-area',
-                    style={
-                    "maxHeight": "500px",  # Altura fija máxima para la tarjeta
-                    "overflowY": "auto",   # Habilita el scroll vertical si el gráfico es más alto
-                    "overflowX": "auto"
+                ])
+            ], width=12)
+        ]),
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("KPI 5: Representación de Trayectorias Académicas"),
+                    dbc.CardBody(id='graph-ruta-pictograma')
+                ])
+            ], width=12)
+        ], className="mt-4")
+            ], fluid=True,
+                style={
+                    "backgroundColor": "#f5f5f5",  # Un gris muy claro profesional
+                    "minHeight": "100vh",         # Asegura que cubra toda la altura de la pantalla
+                    "padding": "20px"
                 })
-            ])
-        ], width=6),
-    ], className="mb-4"),
 
-    
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 3: Tiempo de Acceso a Nueva Carrera (Años tras titulación)"),
-                dbc.CardBody(
-                    id='graph-tiempo-acceso',
-                    style={
-                        "height": "650px",      # Altura fija para ver ~2 filas de gráficos
-                        "overflow-y": "auto",   # Scroll activado
-                        "overflow-x": "hidden"
-                    }
-                )
-            ])
-        ], width=12)
-    ]),
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("KPI 5: Representación de Trayectorias Académicas"),
-                dbc.CardBody(id='graph-ruta-pictograma')
-            ])
-        ], width=12)
-    ], className="mt-4")
-        ], fluid=True,
-            style={
-                "backgroundColor": "#f5f5f5",  # Un gris muy claro profesional
-                "minHeight": "100vh",         # Asegura que cubra toda la altura de la pantalla
-                "padding": "20px"
-            })
 
-@callback(
+# En segundo plano: un cambio de cohorte o jornada mientras corre cancela el cálculo anterior
+@callback_fondo(
     Output("contenedor-metricas-totales", "children"),
     [Input("filtro-cohorte-tit", "value"),
-     Input({'type': 'btn-jornada', 'index': ALL}, 'n_clicks')]
+     Input({'type': 'btn-jornada', 'index': ALL}, 'n_clicks')],
+    running=[(Output("progreso-metricas-totales", "style"), {"display": "flex"}, {"display": "none"})]
 )
 def update_metricas_encabezado(cohorte_sel, n_clicks_list):
     # 1. Identificar jornada seleccionada (opcional si tu kpi1 lo usa)
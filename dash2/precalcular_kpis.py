@@ -0,0 +1,142 @@
+#Precálculo de los KPIs de dash2 para todas las combinaciones de filtros que exponen las páginas
+#(cohorte × jornada × género × rango etario). Se ejecuta después de publicar cada versión de datos
+#(exportar_snapshots.py) y deja los resultados en el almacén de esa versión (ver almacen_kpis.py),
+#así los callbacks solo hacen un lookup. Cada tarea calcula un KPI para todas las cohortes y
+#jornadas de una combinación de los demás filtros: el lote de todas las cohortes se arma una vez.
+#El rango etario es de selección múltiple en la página; se precalculan los rangos de a uno
+#(las selecciones de varios rangos se siguen calculando en vivo).
+#Uso:
+#   python dash2/precalcular_kpis.py [--version 20250101] [--procesos 8]
+import argparse
+import importlib
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+DASH2_DIR = Path(__file__).resolve().parent
+DASH1_DIR = DASH2_DIR.parent / "dash1"
+for ruta in (DASH2_DIR, DASH1_DIR):
+    if str(ruta) not in sys.path:
+        sys.path.insert(0, str(ruta))
+
+import pandas as pd
+
+import snapshots
+from almacen_kpis import clave_kpi, tabla_almacen
+
+#Gráficos de destino de pages/desertores.py
+COLUMNAS_DESTINO = ("institucion_destino", "area_conocimiento_destino", "tipo_inst_1", "nivel_global")
+#Jornadas que pages/titulados_ecas.py muestra con el botón "todos"
+JORNADAS_FIJAS = ("Diurna", "Vespertina")
+
+def opciones_filtros() -> dict:
+    """Valores de los filtros de las páginas, desde las mismas fuentes que usan sus layouts."""
+    from auxiliar import construir_universo_ex_ecas
+
+    df_filtros = snapshots.cargar_dataset("trayectoria_titulados")
+    valores = lambda columna: [v for v in df_filtros[columna].unique() if pd.notna(v)]
+
+    return {
+        "cohortes_desertores": [None] + sorted(int(c) for c in construir_universo_ex_ecas()["cohorte"].dropna().unique()),
+        "cohortes_titulados": [None] + sorted(int(c) for c in df_filtros["año_cohorte_ecas"].dropna().unique()),
+        "jornadas": list(dict.fromkeys([*JORNADAS_FIJAS, *valores("jornada")])),
+        "generos": [None] + valores("gen_alu"),
+        "rangos_edad": [None] + sorted(valores("rango_edad")),
+    }
+
+def armar_tareas(opciones: dict) -> list:
+    """Tareas (módulo, KPI, argumentos fijos, lista de argumentos por cohorte y jornada)."""
+    jornadas = opciones["jornadas"]
+    cohortes_d, cohortes_t = opciones["cohortes_desertores"], opciones["cohortes_titulados"]
+    tareas = []
+
+    # pages/desertores.py: una jornada por gráfico de permanencia; destinos con la primera jornada marcada o ninguna
+    for genero, rango in itertools.product(opciones["generos"], opciones["rangos_edad"]):
+        tareas.append((
+            "metricas_2", "calcular_permanencia_desertores",
+            {"gen_alu": genero, "rango_edad": rango},
+            [{"cohorte_n": c, "jornada": j} for c in cohortes_d for j in jornadas]
+        ))
+    for columna, genero in itertools.product(COLUMNAS_DESTINO, opciones["generos"]):
+        tareas.append((
+            "metricas_2", "calcular_top_reingreso_por_columna",
+            {"columna_objetivo": columna, "gen_alu": genero, "solo_desertores": True},
+            [{"cohorte_n": c, "jornada": j} for c in cohortes_d for j in [None, *jornadas]]
+        ))
+
+    # pages/titulados_ecas.py: encabezado por cohorte y gráficos por jornada
+    tareas.append(("metricas_2", "kpi1_pct_llegan_postitulo_postgrado", {}, [{"anio_n": c} for c in cohortes_t]))
+
+    por_jornada = [{"cohorte_n": c, "jornada": j} for c in cohortes_t for j in jornadas]
+    for kpi in (
+        "calcular_nivel_reingreso",
+        "calcular_nivel_reingreso_inmediato",
+        "calcular_distribucion_demora_reingreso",
+        "calcular_ruta_promedio_titulados",
+    ):
+        tareas.append(("metrics_titulados", kpi, {}, por_jornada))
+    for columna in ("institucion_destino", "area_conocimiento_destino"):
+        tareas.append((
+            "metrics_titulados", "calcular_top_reingreso_por_columna_titulados",
+            {"columna_objetivo": columna, "criterio": "min", "top_n": 5},
+            por_jornada
+        ))
+
+    return tareas
+
+def _iniciar_proceso(version: str) -> None:
+    snapshots.fijar_version(version)
+
+def ejecutar_tarea(tarea: tuple) -> tuple:
+    """Calcula una tarea en el proceso actual. Devuelve (KPI, [(clave, resultado)], segundos de CPU)."""
+    modulo, kpi, fijos, variantes = tarea
+    inicio_cpu = time.process_time()
+
+    funcion = getattr(importlib.import_module(modulo), kpi)
+    # La función sin @precalculado: no se consulta el almacén que se está armando
+    calcular = getattr(funcion, "__wrapped__", funcion)
+    pares = [(clave_kpi(funcion, **fijos, **variante), calcular(**fijos, **variante)) for variante in variantes]
+
+    return kpi, pares, time.process_time() - inicio_cpu
+
+def precalcular(version: str | None = None, procesos: int | None = None) -> str:
+    """Precalcula todas las tareas en un pool de procesos y las agrega a la versión. Devuelve la versión."""
+    version = version or snapshots.version_actual()
+    if version is None:
+        raise FileNotFoundError(f"No hay snapshots publicados en {snapshots.SNAPSHOT_DIR}.")
+
+    procesos = procesos or os.cpu_count()
+    snapshots.fijar_version(version)
+
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    tareas = armar_tareas(opciones_filtros())
+    print(f"✔ {len(tareas)} tareas ({sum(len(t[3]) for t in tareas)} combinaciones) para la versión {version} en {procesos} procesos")
+
+    resultados, cpu_tareas = {}, 0.0
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso, initargs=(version,)) as pool:
+        futuros = [pool.submit(ejecutar_tarea, tarea) for tarea in tareas]
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            kpi, pares, cpu = futuro.result()
+            resultados.setdefault(kpi, []).extend(pares)
+            cpu_tareas += cpu
+            print(f"  [{i}/{len(tareas)}] {kpi}: {len(pares)} combinaciones, {cpu:.2f} s CPU ({time.perf_counter() - inicio:.1f} s)")
+
+    snapshots.agregar_a_version(tabla_almacen(resultados), version)
+
+    cpu_total = cpu_tareas + time.process_time() - inicio_cpu
+    print(f"✔ Tiempo total: {time.perf_counter() - inicio:.1f} s de pared, {cpu_total:.1f} s de CPU")
+    return version
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Precalcula los KPIs de dash2 para todas las combinaciones de filtros.")
+    parser.add_argument("--version", default=None, help="Versión de snapshot (por defecto, la publicada)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, los CPU disponibles)")
+    args = parser.parse_args()
+
+    version = precalcular(args.version, args.procesos)
+
+    print(f"✅ KPIs precalculados en la versión {version}")
@@ -1,7 +1,7 @@
 import sys
 sys.path.append('C:/Users/ezequ/Downloads/dash-ecas-v2/dash-ecas-v2/dash1')
 
-from conn_db import get_db_engine
+from conn_db import get_db_engine, leer_sql, escribir_temporal, borrar_temporal
 import pandas as pd
 from pathlib import Path
 from auxiliar import *
@@ -108,11 +108,11 @@ def creacion_trayectoria_titulados(db_conn):
       AND anio_ing_carr_ori BETWEEN 2007 AND 2025
     GROUP BY mrun
     """
-    df_titulados = pd.read_sql(sql_titulados_ecas, db_conn)
+    df_titulados = leer_sql(sql_titulados_ecas, db_conn)
 
     # 4️⃣ Tabla temporal MRUNs titulados
     df_mruns_temp = pd.DataFrame(df_titulados["mrun"].unique(), columns=["mrun"])
-    df_mruns_temp.to_sql("#TempMrunsTitulados", db_conn, if_exists="replace", index=False)
+    escribir_temporal(df_mruns_temp, "#TempMrunsTitulados", db_conn)
 
     # 5️⃣ Trayectoria post-ECAS
     sql_trayectoria = """
@@ -136,7 +136,8 @@ def creacion_trayectoria_titulados(db_conn):
         ON m.mrun = t.mrun
     ORDER BY m.mrun, m.cat_periodo;
     """
-    df_trayectoria = pd.read_sql(sql_trayectoria, db_conn)
+    df_trayectoria = leer_sql(sql_trayectoria, db_conn)
+    borrar_temporal("#TempMrunsTitulados", db_conn)
 
     df_trayectoria = pd.merge(
         df_trayectoria,
@@ -153,14 +154,8 @@ def creacion_trayectoria_titulados(db_conn):
 
     return df_trayectoria_agrupada
 
-def exportar_trayectoria_post_ecas_excel(
-    df_trayectoria_agrupada: pd.DataFrame,
-    ruta_salida: str
-) -> None:
-    ruta = Path(ruta_salida)
-    ruta.parent.mkdir(parents=True, exist_ok=True)
-
-    # ---- 1️⃣ Preparar versión "amigable" para Excel (listas → texto)
+def trayectoria_a_texto(df_trayectoria_agrupada: pd.DataFrame) -> pd.DataFrame:
+    """Serializa las columnas lista con " | " (formato de la hoja Trayectoria_Resumen)."""
     df_excel_resumen = df_trayectoria_agrupada.copy()
 
     columnas_lista = [
@@ -182,6 +177,18 @@ def exportar_trayectoria_post_ecas_excel(
                 lambda x: " | ".join(map(str, x)) if isinstance(x, list) else ""
             )
 
+    return df_excel_resumen
+
+def exportar_trayectoria_post_ecas_excel(
+    df_trayectoria_agrupada: pd.DataFrame,
+    ruta_salida: str
+) -> None:
+    ruta = Path(ruta_salida)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+
+    # ---- 1️⃣ Preparar versión "amigable" para Excel (listas → texto)
+    df_excel_resumen = trayectoria_a_texto(df_trayectoria_agrupada)
+
     # ---- 2️⃣ Exportar Excel
     with pd.ExcelWriter(ruta, engine='xlsxwriter') as writer:
         df_excel_resumen.to_excel(
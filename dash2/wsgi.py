@@ -0,0 +1,25 @@
+#Punto de entrada WSGI del dashboard de trayectorias (index.py).
+#Uso: gunicorn -c gunicorn.conf.py dash2.wsgi:server
+import sys
+from pathlib import Path
+
+DASH2_DIR = Path(__file__).resolve().parent
+DASH1_DIR = DASH2_DIR.parent / "dash1"
+for ruta in (DASH2_DIR, DASH1_DIR):
+    if str(ruta) not in sys.path:
+        sys.path.insert(0, str(ruta))
+
+from snapshots import precargar_datasets
+
+def crear_app():
+    """
+    Precarga los snapshots y construye la app. Con preload_app=True se ejecuta una
+    sola vez en el proceso maestro y los workers comparten los datos tras el fork.
+    """
+    precargar_datasets()
+
+    import index
+    return index.app
+
+app = crear_app()
+server = app.server
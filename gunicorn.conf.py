@@ -0,0 +1,41 @@
+#Configuración de gunicorn para los dashboards.
+#Uso:
+#   gunicorn -c gunicorn.conf.py dash1.wsgi:server
+#   gunicorn -c gunicorn.conf.py dash2.wsgi:server
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get("ECAS_BIND", "0.0.0.0:8050")
+
+# Procesos x hilos: los callbacks liberan el GIL en pandas/NumPy y en la espera de SQL Server
+workers = int(os.environ.get("ECAS_WORKERS", min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get("ECAS_THREADS", 4))
+worker_class = "gthread"
+
+# La app (y los snapshots) se cargan una vez en el maestro; los workers los heredan
+# por copy-on-write y los archivos mapeados se comparten vía page cache.
+preload_app = True
+
+timeout = int(os.environ.get("ECAS_TIMEOUT", 120))
+graceful_timeout = 30
+max_requests = int(os.environ.get("ECAS_MAX_REQUESTS", 0))
+max_requests_jitter = 50
+
+accesslog = "-"
+errorlog = "-"
+
+def post_fork(server, worker):
+    """
+    Las conexiones abiertas en el maestro no se comparten: cada worker abre su propio pool.
+    Cada worker además inicia su hilo de refresco de snapshots (ECAS_REFRESCO_SEGUNDOS).
+    """
+    from sqlalchemy.engine import Engine
+
+    for modulo in list(sys.modules.values()):
+        for valor in list(getattr(modulo, "__dict__", {}).values()):
+            if isinstance(valor, Engine):
+                valor.dispose(close=False)
+
+    if "snapshots" in sys.modules:
+        sys.modules["snapshots"].iniciar_refresco()